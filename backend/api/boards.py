@@ -1,35 +1,38 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+import asyncio
 import json
 import logging
 from typing import Dict, List
 from services.arduino_cli import run_arduino_cli
+from services.catalog import CatalogQuery, catalog_response, loads
 
 router = APIRouter(prefix="/boards", tags=["boards"])
 logger = logging.getLogger(__name__)
 
 @router.get("/")
-async def get_boards():
+@router.get("", include_in_schema=False)
+async def get_boards(query: CatalogQuery = Depends()):
     """Get list of available boards"""
-    result = run_arduino_cli(['arduino-cli', 'board', 'listall', '--format', 'json'])
+    result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'board', 'listall', '--format', 'json'])
     
     if result['success']:
         try:
-            boards = json.loads(result['stdout'])
-            return {"success": True, "boards": boards.get('boards', [])}
+            boards = loads(result['stdout'])
+            return catalog_response(boards.get('boards', []), "boards", query)
         except json.JSONDecodeError:
             return {"success": False, "error": "Failed to parse board list"}
     
     return {"success": False, "error": result['stderr']}
 
 @router.get("/available")
-async def get_available_boards():
+async def get_available_boards(query: CatalogQuery = Depends()):
     """Get list of all available boards for installation"""
-    result = run_arduino_cli(['arduino-cli', 'board', 'listall', '--format', 'json'])
+    result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'board', 'listall', '--format', 'json'])
     
     if result['success']:
         try:
-            boards = json.loads(result['stdout'])
-            return {"success": True, "boards": boards.get('boards', [])}
+            boards = loads(result['stdout'])
+            return catalog_response(boards.get('boards', []), "boards", query)
         except json.JSONDecodeError:
             return {"success": False, "error": "Failed to parse available boards"}
     
@@ -1,66 +1,364 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import hashlib
 import json
 import logging
 import os
-from typing import Dict, List
+import shutil
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 from pydantic import BaseModel
-from services.arduino_cli import run_arduino_cli
+from config.settings import EXAMPLES_SKETCH_DIR, SKETCH_MANIFEST_DIR, WORKSPACE_DIR
+from services.arduino_cli import compile_slot, run_arduino_cli
+from services.build_roots import build_key, build_roots
+from services.compile_profiler import profile_compile, profile_stats
+from services.example_index import SKETCH_EXTENSIONS
+from services.file_store import atomic_write, file_lock_name, file_store
+from services.hub import hub
+from services.library_resolver import compile_preflight, failed_includes, missing_libraries_message
+from services.jobs import job_registry
+from services.prewarm import prewarmer
+from services.scheduler import client_identity
+from services.serial_session import serial_session
+from services.telemetry import PhaseTimer
 
 router = APIRouter(prefix="/compile", tags=["compile"])
 logger = logging.getLogger(__name__)
 
+class SketchFile(BaseModel):
+    # Path relative to the sketch directory, e.g. "Blink.ino" or "src/util.cpp"
+    name: str
+    # Left out when the server should already hold the file with this hash
+    content: Optional[str] = None
+    # SHA-256 of the content's UTF-8 bytes
+    hash: Optional[str] = None
+
 class CompileRequest(BaseModel):
-    code: str
+    # Text of the main sketch file; with files, only used if they leave it out
+    code: str = ""
     board: str
     sketch_path: str
+    # Every file of the sketch; source files sent earlier that are not listed are removed
+    files: Optional[List[SketchFile]] = None
+    # Compile verbosely and return a per-phase timing breakdown
+    profile: bool = False
+    # Install libraries the sketch includes but are not installed, instead of failing early
+    install_missing: bool = False
 
 class UploadRequest(BaseModel):
-    code: str
+    code: str = ""
     board: str
     port: str
     sketch_path: str
+    files: Optional[List[SketchFile]] = None
 
-@router.post("/verify")
-async def compile_code(request: CompileRequest):
-    """Compile Arduino code"""
-    # Ensure the sketch directory exists
-    os.makedirs(os.path.dirname(request.sketch_path), exist_ok=True)
+class StaleFiles(Exception):
+    """Files sent by hash alone that the server does not hold with that hash"""
+
+    def __init__(self, names: List[str]):
+        super().__init__(f"Send the content of: {', '.join(names)}")
+        self.names = names
+
+@contextmanager
+def temporary_sketch():
+    """Path of a sketch file in a fresh scratch directory, removed afterwards"""
+    name = f"arduino_sketch_{uuid.uuid4()}"
+    directory = os.path.join(build_roots.scratch_dir(), name)
+    try:
+        yield os.path.join(directory, f"{name}.ino")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.remove(manifest_path(directory))
+        except OSError:
+            pass
+
+def sketch_file_path(sketch_dir: str, name: str) -> str:
+    path = os.path.normpath(os.path.join(sketch_dir, name))
+    if os.path.isabs(name) or not path.startswith(os.path.normpath(sketch_dir) + os.sep):
+        raise ValueError(f"{name} is outside the sketch")
+    return path
+
+def managed_sketch_dir(sketch_dir: str) -> bool:
+    """Whether a sketch directory is one the server made: in the workspace, an opened example or scratch"""
+    path = os.path.realpath(sketch_dir)
+    roots = (WORKSPACE_DIR, EXAMPLES_SKETCH_DIR, build_roots.scratch_dir())
+    return any(path.startswith(os.path.realpath(root) + os.sep) for root in roots)
+
+def manifest_path(sketch_dir: str) -> str:
+    key = hashlib.sha1(os.path.realpath(sketch_dir).encode()).hexdigest()
+    return os.path.join(SKETCH_MANIFEST_DIR, f"{key}.json")
+
+def read_manifest(sketch_dir: str) -> List[str]:
+    """Names of the files the server wrote to a sketch directory"""
+    try:
+        with open(manifest_path(sketch_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+def listed_files(sketch_path: str, code: str, files: Optional[List[SketchFile]]):
+    """The request's files, the main one added from code if they leave it out, and their paths"""
+    sketch_dir = os.path.dirname(sketch_path)
+    main = os.path.basename(sketch_path)
+    listed = files if files is not None else []
+    if files is None or (code and not any(os.path.normpath(file.name) == main for file in listed)):
+        listed = listed + [SketchFile(name=main, content=code)]
+    return listed, [sketch_file_path(sketch_dir, file.name) for file in listed]
+
+def sketch_lock_names(sketch_path: str, code: str, files: Optional[List[SketchFile]]) -> List[str]:
+    """Hub locks of every file write_sketch may write or remove"""
+    sketch_dir = os.path.dirname(sketch_path)
+    _, paths = listed_files(sketch_path, code, files)
+    for name in read_manifest(sketch_dir):
+        try:
+            paths.append(sketch_file_path(sketch_dir, name))
+        except ValueError:
+            continue
+    return [file_lock_name(path) for path in paths]
+
+def write_sketch(sketch_path: str, code: str, files: Optional[List[SketchFile]]) -> List[Dict]:
+    """Bring the sketch directory in line with the request, writing only files whose content changed
+
+    Unchanged files keep their mtimes, so arduino-cli's incremental build only
+    recompiles the translation units that were edited. Sources an earlier
+    request wrote and this one leaves out are removed, in directories the
+    server manages only; files it did not write are never touched.
+    """
+    sketch_dir = os.path.dirname(sketch_path)
+    listed, paths = listed_files(sketch_path, code, files)
+
+    # Check every file sent by hash before changing anything
+    stale = [file.name for file, path in zip(listed, paths)
+             if file.content is None and (file.hash is None or file_store.current_hash(path) != file.hash)]
+    if stale:
+        raise StaleFiles(stale)
+
+    written = []
+    for file, path in zip(listed, paths):
+        if file.content is None:
+            written.append({"name": file.name, "path": path, "hash": file.hash, "changed": False})
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        saved = file_store.save(path, file.content)
+        written.append({"name": file.name, "path": path, "hash": saved["hash"], "changed": saved["changed"]})
+
+    if files is not None and managed_sketch_dir(sketch_dir):
+        # Tabs closed since the last build must not be compiled into it
+        kept = set(paths)
+        previous = read_manifest(sketch_dir)
+        manifest = {os.path.relpath(path, sketch_dir) for file, path in zip(listed, paths)
+                    if file.content is not None or os.path.relpath(path, sketch_dir) in previous}
+        for name in previous:
+            try:
+                path = sketch_file_path(sketch_dir, name)
+            except ValueError:
+                continue
+            if path in kept or not name.endswith(SKETCH_EXTENSIONS) or not os.path.isfile(path):
+                continue
+            os.remove(path)
+            written.append({"name": name, "path": path, "hash": None, "changed": True})
+        if manifest != set(previous):
+            atomic_write(manifest_path(sketch_dir), json.dumps(sorted(manifest)).encode('utf-8'))
+    return written
+
+def sketch_text(written: List[Dict]) -> str:
+    """Every source of the sketch, for the include scan before a build"""
+    texts = []
+    for file in written:
+        if file["hash"] is None:
+            continue
+        try:
+            texts.append(file_store.read_text(file["path"])[0])
+        except (OSError, UnicodeDecodeError):
+            continue
+    return '\n'.join(texts)
+
+def request_bytes(request) -> int:
+    return len(request.code) + sum(len(file.content or '') for file in request.files or [])
+
+def file_summary(written: List[Dict]) -> List[Dict]:
+    return [{key: file[key] for key in ("name", "hash", "changed")} for file in written]
+
+async def prepare_sketch(request, sketch_path: str, timer: PhaseTimer):
+    """Write the request's files: (None, files written), or (response to send instead, None)"""
+    with timer.phase("write"):
+        try:
+            # The locks file patches take, so neither overwrites the other's edit
+            async with hub.lock_all(sketch_lock_names(sketch_path, request.code, request.files)):
+                written = await asyncio.to_thread(write_sketch, sketch_path, request.code, request.files)
+        except StaleFiles as e:
+            return {"success": False, "output": str(e), "stale_files": e.names}, None
+        except (OSError, ValueError) as e:
+            return {"success": False, "output": str(e)}, None
+    return None, written
+
+def legacy_response(response: Dict) -> Dict:
+    """Older clients read the CLI output from 'message' rather than 'output'"""
+    response["message"] = response.pop("output")
+    return response
+
+async def compile_sketch(request: CompileRequest, sketch_path: str, user: str, keep_build: bool = True) -> Dict:
+    """Write the sketch's files and compile it in the user's turn
+
+    The build tree is kept for the next compile and upload of the same sketch
+    unless keep_build is False.
+    """
+    # Background warm-ups give the CPU back to real builds, but one already
+    # building this sketch's tree is raised to normal priority and waited for
+    prewarmer.yield_cpu(build_key(sketch_path, request.board) if keep_build else None)
+    timer = PhaseTimer("compile", board=request.board, code_bytes=request_bytes(request))
+    refused, written = await prepare_sketch(request, sketch_path, timer)
+    if refused:
+        timer.emit(success=False, returncode=None)
+        return refused
     
-    # Write the code to the sketch file
-    with open(request.sketch_path, 'w') as f:
-        f.write(request.code)
+    # Resolve the sketch's includes, installing what they need if asked to. The
+    # index can be wrong (core and platform headers), so it only advises the build
+    with timer.phase("libraries"):
+        libraries = await compile_preflight(
+            await asyncio.to_thread(sketch_text, written), os.path.dirname(sketch_path), request.install_missing, user
+        )
     
     # Compile the code
-    result = run_arduino_cli([
-        'arduino-cli', 'compile',
-        '--fqbn', request.board,
-        request.sketch_path
-    ])
+    async with job_registry.track("compile", board=request.board, sketch_path=sketch_path) as job:
+        # A build of this tree already running finishes before this one takes a
+        # compile slot, and a tree is only held by a build that is ready to run
+        if keep_build:
+            with timer.phase("tree"):
+                await build_roots.wait(sketch_path, request.board)
+        async with compile_slot(timer, user):
+            async with build_roots.tree(sketch_path, request.board, keep=keep_build) as build_path:
+                with timer.phase("compile"):
+                    command = [
+                        'arduino-cli', 'compile',
+                        '--fqbn', request.board,
+                        '--build-path', build_path,
+                        sketch_path
+                    ]
+                    if request.profile:
+                        result = await profile_compile(command)
+                    else:
+                        result = await asyncio.to_thread(run_arduino_cli, command)
+        job["success"] = result['success']
+    # Missing libraries are only reported for includes the compiler could not find
+    missing = {}
+    if not result['success']:
+        suggested = libraries["missing"] if libraries else {}
+        missing = {header: suggested.get(header, []) for header in failed_includes(result['stderr'])}
+    timer.emit(success=result['success'], returncode=result['returncode'],
+               **({"missing_libraries": list(missing)} if missing else {}))
     
-    return {
+    response = {
         "success": result['success'],
-        "output": result['stdout'] if result['success'] else result['stderr']
+        "output": result['stdout'] if result['success'] else result['stderr'],
+        "job_id": job["id"],
+        "files": file_summary(written)
     }
+    if request.profile:
+        response["profile"] = result['profile']
+    if missing:
+        report = {"missing": missing, "failed": libraries.get("failed", {}) if libraries else {}}
+        response["output"] = missing_libraries_message(report) + '\n\n' + response["output"]
+        response["missing_libraries"] = missing
+    elif libraries and libraries["missing"] and not result['success']:
+        response["suggested_libraries"] = libraries["missing"]
+    if libraries and libraries.get("installed"):
+        response["installed_libraries"] = libraries["installed"]
+    return response
 
-@router.post("/upload")
-async def upload_code(request: UploadRequest):
-    """Upload Arduino code to a board"""
-    # Ensure the sketch directory exists
-    os.makedirs(os.path.dirname(request.sketch_path), exist_ok=True)
-    
-    # Write the code to the sketch file
-    with open(request.sketch_path, 'w') as f:
-        f.write(request.code)
+@router.post("/verify")
+async def compile_code(request: CompileRequest, user: str = Depends(client_identity)):
+    """Compile Arduino code"""
+    return await compile_sketch(request, request.sketch_path, user)
+
+@router.post("", include_in_schema=False)
+async def compile_code_in_temp_dir(request: CompileRequest, user: str = Depends(client_identity)):
+    """Compile in a throwaway sketch directory (the older /api/compile)"""
+    with temporary_sketch() as sketch_path:
+        return legacy_response(await compile_sketch(request, sketch_path, user, keep_build=False))
+
+@router.post("/prewarm")
+async def prewarm_sketch(request: CompileRequest, user: str = Depends(client_identity)):
+    """Build a sketch for a newly selected board in the background, so Verify finds its libraries built"""
+    timer = PhaseTimer("prewarm", board=request.board, code_bytes=request_bytes(request))
+    refused, written = await prepare_sketch(request, request.sketch_path, timer)
+    if refused:
+        return refused
+    libraries = await compile_preflight(
+        await asyncio.to_thread(sketch_text, written), os.path.dirname(request.sketch_path), False, user
+    )
+    if libraries and libraries["missing"]:
+        return {"success": True, "started": False, "reason": "Missing libraries", "files": file_summary(written)}
+    try:
+        started = await prewarmer.warm(user, request.sketch_path, request.board, timer)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, **started, "files": file_summary(written)}
+
+@router.get("/jobs")
+async def list_jobs(state: Optional[str] = None):
+    """Compiles and uploads running or recently finished on any worker"""
+    try:
+        return {"success": True, "jobs": await job_registry.list(state)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of one compile or upload, whichever worker runs it"""
+    try:
+        job = await job_registry.get(job_id)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    if not job:
+        return {"success": False, "error": "Job not found"}
+    return {"success": True, "job": job}
+
+@router.get("/builds")
+async def get_build_roots():
+    """Build tree usage on the RAM and disk tiers"""
+    try:
+        return {"success": True, "builds": await build_roots.status()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.get("/profile")
+async def get_compile_profile():
+    """Phase and translation unit timings aggregated over profiled compiles"""
+    return {"success": True, "profile": profile_stats.summary()}
+
+async def upload_sketch(request: UploadRequest, sketch_path: str) -> Dict:
+    """Write the sketch's files and upload it"""
+    timer = PhaseTimer("upload", board=request.board, port=request.port)
+    # Unchanged files keep their mtimes, so the kept build tree still matches them
+    refused, written = await prepare_sketch(request, sketch_path, timer)
+    if refused:
+        timer.emit(success=False, returncode=None)
+        return refused
     
-    # Upload the code
-    result = run_arduino_cli([
-        'arduino-cli', 'upload',
-        '--fqbn', request.board,
-        '--port', request.port,
-        request.sketch_path
-    ])
+    # Upload the code, releasing the port from any open serial session meanwhile
+    async with job_registry.track("upload", board=request.board, port=request.port, sketch_path=sketch_path) as job:
+        # Upload what the last compile of this sketch built, if it kept its tree
+        async with build_roots.tree(sketch_path, request.board, create=False) as build_path:
+            command = ['arduino-cli', 'upload', '--fqbn', request.board, '--port', request.port]
+            if build_path:
+                command += ['--input-dir', build_path]
+            async with serial_session.hold_port(request.port):
+                with timer.phase("upload"):
+                    result = await asyncio.to_thread(run_arduino_cli, command + [sketch_path])
+        job["success"] = result['success']
+    timer.emit(success=result['success'], returncode=result['returncode'])
     
     return {
         "success": result['success'],
-        "output": result['stdout'] if result['success'] else result['stderr']
-    }
\ No newline at end of file
+        "output": result['stdout'] if result['success'] else result['stderr'],
+        "job_id": job["id"],
+        "files": file_summary(written)
+    }
+
+@router.post("/upload")
+async def upload_code(request: UploadRequest):
+    """Upload Arduino code to a board"""
+    return await upload_sketch(request, request.sketch_path)
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+import asyncio
 import json
 import logging
 from typing import Dict, List
 from pydantic import BaseModel
 from services.arduino_cli import run_arduino_cli
+from services.catalog import CatalogQuery, catalog_response, loads
+from services.example_index import example_index
+from services.scheduler import client_identity, scheduler
 
 router = APIRouter(prefix="/cores", tags=["cores"])
 logger = logging.getLogger(__name__)
@@ -12,6 +16,7 @@ class CoreRequest(BaseModel):
     core_name: str
 
 @router.get("/")
+@router.get("", include_in_schema=False)
 async def get_cores():
     """Get list of installed cores"""
     result = run_arduino_cli(['arduino-cli', 'core', 'list', '--format', 'json'])
@@ -26,35 +31,41 @@ async def get_cores():
     return {"success": False, "error": result['stderr']}
 
 @router.get("/search")
-async def search_cores():
+async def search_cores(query: CatalogQuery = Depends()):
     """Get list of all available cores for installation"""
-    result = run_arduino_cli(['arduino-cli', 'core', 'search', '--format', 'json'])
+    result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'core', 'search', '--format', 'json'])
     
     if result['success']:
         try:
-            cores = json.loads(result['stdout'])
-            return {"success": True, "platforms": cores.get('platforms', [])}
+            cores = loads(result['stdout'])
+            return catalog_response(cores.get('platforms', []), "platforms", query)
         except json.JSONDecodeError:
             return {"success": False, "error": "Failed to parse available cores"}
     
     return {"success": False, "error": result['stderr']}
 
 @router.post("/install")
-async def install_core(request: CoreRequest):
+async def install_core(request: CoreRequest, user: str = Depends(client_identity)):
     """Install a core"""
-    result = run_arduino_cli(['arduino-cli', 'core', 'install', request.core_name])
+    async with scheduler.slot("install", user):
+        result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'core', 'install', request.core_name])
+    # Cores bring libraries of their own, with their examples
+    example_index.invalidate()
     
     if result['success']:
         return {"success": True, "message": f"Core {request.core_name} installed successfully"}
     
-    return {"success": False, "error": result['stderr']}
+    # "message" is what older clients show on failure
+    return {"success": False, "error": result['stderr'], "message": result['stderr']}
 
 @router.post("/uninstall")
-async def uninstall_core(request: CoreRequest):
+async def uninstall_core(request: CoreRequest, user: str = Depends(client_identity)):
     """Uninstall a core"""
-    result = run_arduino_cli(['arduino-cli', 'core', 'uninstall', request.core_name])
+    async with scheduler.slot("install", user):
+        result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'core', 'uninstall', request.core_name])
+    example_index.invalidate()
     
     if result['success']:
         return {"success": True, "message": f"Core {request.core_name} uninstalled successfully"}
     
-    return {"success": False, "error": result['stderr']}
\ No newline at end of file
+    return {"success": False, "error": result['stderr'], "message": result['stderr']}
\ No newline at end of file
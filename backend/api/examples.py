@@ -0,0 +1,52 @@
+from fastapi import APIRouter, Depends
+import asyncio
+import logging
+from typing import Optional
+from services.catalog import CatalogQuery, catalog_response
+from services.example_index import example_index, public
+
+router = APIRouter(prefix="/examples", tags=["examples"])
+logger = logging.getLogger(__name__)
+
+@router.get("/")
+@router.get("", include_in_schema=False)
+async def search_examples(q: str = "", library: Optional[str] = None, query: CatalogQuery = Depends()):
+    """Examples of installed libraries and cores, searched by name and keywords"""
+    try:
+        examples = await example_index.search(q, library)
+    except Exception as e:
+        logger.error(f"Error searching examples: {e}")
+        return {"success": False, "error": str(e)}
+    return catalog_response([public(example) for example in examples], "examples", query)
+
+@router.post("/refresh")
+async def refresh_examples():
+    """Rescan libraries that changed outside the API (e.g. installed by hand)"""
+    try:
+        example_index.invalidate()
+        await example_index.ensure_loaded()
+        return {"success": True, "examples": len(example_index.examples)}
+    except Exception as e:
+        logger.error(f"Error refreshing examples: {e}")
+        return {"success": False, "error": str(e)}
+
+@router.get("/{example_id}")
+async def get_example(example_id: str):
+    """An example and the text of its files"""
+    example = await example_index.get(example_id)
+    if not example:
+        return {"success": False, "error": "Example not found"}
+    files = await asyncio.to_thread(example_index.read_files, example)
+    return {"success": True, "example": public(example), "files": files}
+
+@router.post("/{example_id}/open")
+async def open_example(example_id: str):
+    """Copy an example to its own sketch path, which compiles and uploads should use"""
+    example = await example_index.get(example_id)
+    if not example:
+        return {"success": False, "error": "Example not found"}
+    try:
+        sketch_path, files = await asyncio.to_thread(example_index.materialize, example)
+    except OSError as e:
+        return {"success": False, "error": str(e)}
+    return {"success": True, "example": public(example), "sketch_path": sketch_path, "files": files}
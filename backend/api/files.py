@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+import asyncio
 import json
 import logging
+import mimetypes
 import os
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 from pydantic import BaseModel
+from services.workspace_tree import workspace_tree
+from services.file_store import PatchConflict, etag_matches, file_lock_name, file_store
+from services.hub import hub
+from services.file_reader import MAX_LINE_WINDOW, RangeNotSatisfiable, iter_file_range, line_indexes, parse_byte_range
 
 router = APIRouter(prefix="/files", tags=["files"])
 logger = logging.getLogger(__name__)
@@ -13,56 +20,137 @@ class FileContent(BaseModel):
     path: str
     content: str
 
+class FileBatch(BaseModel):
+    files: List[FileContent]
+
+class TextPatch(BaseModel):
+    start: int
+    end: int
+    text: str = ""
+
+class FilePatch(BaseModel):
+    path: str
+    base_hash: str
+    patches: List[TextPatch]
+
 @router.get("/workspace")
-async def get_workspace():
-    """Get the workspace file structure"""
-    workspace_path = "/tmp/arduino_workspace"
-    os.makedirs(workspace_path, exist_ok=True)
-    
-    def get_directory_structure(path):
-        result = []
-        for item in os.listdir(path):
-            item_path = os.path.join(path, item)
-            if os.path.isdir(item_path):
-                result.append({
-                    "name": item,
-                    "path": item_path,
-                    "type": "directory",
-                    "children": get_directory_structure(item_path)
-                })
-            else:
-                result.append({
-                    "name": item,
-                    "path": item_path,
-                    "type": "file"
-                })
-        return result
-    
+async def get_workspace(path: Optional[str] = None, depth: Optional[int] = None):
+    """Get the workspace file structure, optionally one subdirectory and a limited depth"""
     try:
-        structure = get_directory_structure(workspace_path)
+        structure = workspace_tree.tree(path, depth)
         return {"success": True, "workspace": structure}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+@router.websocket("/workspace/ws")
+async def workspace_websocket(websocket: WebSocket):
+    """Push workspace change notifications"""
+    await websocket.accept()
+    queue = workspace_tree.subscribe()
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        workspace_tree.unsubscribe(queue)
+
 @router.get("/get")
-async def get_file(path: str):
-    """Get file content"""
+async def get_file(path: str, request: Request):
+    """Get file content; answers 304 when If-None-Match holds the current hash"""
+    try:
+        content, digest = await asyncio.to_thread(file_store.read_text, path)
+        headers = {"ETag": f'"{digest}"'}
+        if etag_matches(request.headers.get("if-none-match"), digest):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse({"success": True, "content": content, "hash": digest}, headers=headers)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.get("/raw")
+async def get_raw_file(path: str, request: Request):
+    """Stream a file from disk, honouring a single byte range"""
     try:
-        with open(path, 'r') as f:
-            content = f.read()
-        return {"success": True, "content": content}
+        if not os.path.isfile(path):
+            return {"success": False, "error": "File not found"}
+        size = os.path.getsize(path)
+        byte_range = parse_byte_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers={"Accept-Ranges": "bytes"})
+    start, end = byte_range
+    return StreamingResponse(
+        iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1)
+        }
+    )
+
+@router.get("/lines")
+async def get_file_lines(path: str, start: int = 0, end: int = 1000):
+    """Get lines start..end (0-based, end exclusive) of a text file without reading all of it"""
+    end = min(end, start + MAX_LINE_WINDOW)
+    try:
+        window = await asyncio.to_thread(line_indexes.read_window, path, start, end)
+        return {"success": True, **window}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.post("/patch")
+async def patch_file(file_patch: FilePatch):
+    """Apply edits made against a known revision and save the result"""
+    try:
+        patches = [patch.model_dump() for patch in file_patch.patches]
+        # Read, check and write as one step, or two patches on one base could both apply
+        async with hub.lock(file_lock_name(file_patch.path)):
+            saved = await asyncio.to_thread(file_store.patch, file_patch.path, file_patch.base_hash, patches)
+        return {"success": True, "hash": saved["hash"]}
+    except PatchConflict as e:
+        return JSONResponse(status_code=409, content={"success": False, "error": str(e), "hash": e.current_hash})
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 @router.post("/save")
+@router.post("", include_in_schema=False)
 async def save_file(file: FileContent):
     """Save file content"""
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(file.path), exist_ok=True)
-        
-        with open(file.path, 'w') as f:
-            f.write(file.content)
-        return {"success": True, "message": "File saved successfully"}
+        async with hub.lock(file_lock_name(file.path)):
+            saved = await asyncio.to_thread(file_store.save, file.path, file.content)
+        return {"success": True, "message": "File saved successfully", "hash": saved["hash"]}
     except Exception as e:
-        return {"success": False, "error": str(e)}
\ No newline at end of file
+        return {"success": False, "error": str(e)}
+
+@router.post("/save-batch")
+@router.post("/batch", include_in_schema=False)
+async def save_files(batch: FileBatch):
+    """Save many files at once, skipping the ones whose content is unchanged"""
+    def save_all():
+        results = []
+        for file in batch.files:
+            try:
+                results.append(file_store.save(file.path, file.content))
+            except Exception as e:
+                logger.error(f"Error saving {file.path}: {e}")
+                results.append({"path": file.path, "error": str(e)})
+        return results
+
+    # The locks patches take, or a save could land between a patch's check and write
+    async with hub.lock_all(file_lock_name(file.path) for file in batch.files):
+        results = await asyncio.to_thread(save_all)
+    return {"success": all("error" not in r for r in results), "files": results}
+
+# Older clients put the path in the URL; registered last so it cannot shadow the routes above
+@router.get("/{file_path:path}", include_in_schema=False)
+async def get_file_by_path(file_path: str, request: Request):
+    """Get file content, with the path in the URL"""
+    return await get_file(file_path, request)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+import logging
+from services.index_manager import index_manager
+
+router = APIRouter(prefix="/indexes", tags=["indexes"])
+logger = logging.getLogger(__name__)
+
+@router.get("/")
+async def get_index_status():
+    """Freshness and signature state of the platform and library indexes"""
+    return {"success": True, **index_manager.status()}
+
+@router.post("/refresh")
+async def refresh_indexes(force: bool = False):
+    """Check for new indexes now instead of waiting for the next scheduled refresh"""
+    try:
+        results = await index_manager.refresh(force=force)
+        return {"success": all(result["status"] != "error" for result in results), "indexes": results}
+    except Exception as e:
+        logger.error(f"Error refreshing indexes: {e}")
+        return {"success": False, "error": str(e)}
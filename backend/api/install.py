@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+import json
+import logging
+from typing import List
+from pydantic import BaseModel
+from services.batch_installer import batch_installer
+from services.scheduler import client_identity, scheduler
+
+router = APIRouter(prefix="/install", tags=["install"])
+logger = logging.getLogger(__name__)
+
+class BatchInstallRequest(BaseModel):
+    # Specs like "arduino:avr" or "arduino:avr@1.8.6"
+    cores: List[str] = []
+    # Specs like "Servo" or "Servo@1.2.1"; dependencies are added automatically
+    libraries: List[str] = []
+    # Only resolve and report what would be installed
+    dry_run: bool = False
+
+@router.post("/batch")
+async def batch_install(request: BatchInstallRequest, user: str = Depends(client_identity)):
+    """Install cores and libraries with their dependencies, streaming progress as NDJSON"""
+    # Taken before the response starts so a refusal is still a 429; given back
+    # once, when the stream ends
+    ticket = await scheduler.acquire("install", user)
+
+    async def events():
+        try:
+            async for event in batch_installer.install(request.cores, request.libraries, request.dry_run):
+                yield json.dumps(event) + "\n"
+        finally:
+            await scheduler.release("install", ticket)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
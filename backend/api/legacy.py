@@ -0,0 +1,49 @@
+from fastapi import APIRouter
+import json
+import logging
+from typing import Optional
+from services.arduino_cli import run_arduino_cli
+from services.port_discovery import discovery
+from services.workspace_tree import workspace_tree
+from api.compile import UploadRequest, legacy_response, temporary_sketch, upload_sketch
+from api.files import workspace_websocket
+from api.serial import ports_websocket
+
+# URLs of the original single-file backend that sit outside any domain prefix.
+# Aliases that do fit a prefix (/api/compile, /api/files/{path}, ...) live in their routers.
+router = APIRouter(tags=["legacy"], include_in_schema=False)
+logger = logging.getLogger(__name__)
+
+@router.get("/ports")
+async def get_ports():
+    """Get detected ports in arduino-cli's `board list` format"""
+    if discovery.running:
+        return {"success": True, "ports": {"detected_ports": discovery.detected_ports()}}
+
+    result = run_arduino_cli(['arduino-cli', 'board', 'list', '--format', 'json'])
+
+    if result['success']:
+        try:
+            ports = json.loads(result['stdout'])
+            return {"success": True, "ports": ports}
+        except json.JSONDecodeError:
+            return {"success": False, "error": "Failed to parse port list"}
+
+    return {"success": False, "error": result['stderr']}
+
+@router.get("/workspace")
+async def get_workspace(path: Optional[str] = None, depth: Optional[int] = None):
+    """Get workspace file tree"""
+    try:
+        return {"success": True, "tree": workspace_tree.tree(path, depth)}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.post("/upload")
+async def upload_code(request: UploadRequest):
+    """Upload from a throwaway sketch directory"""
+    with temporary_sketch() as sketch_path:
+        return legacy_response(await upload_sketch(request, sketch_path))
+
+router.add_api_websocket_route("/ports/ws", ports_websocket)
+router.add_api_websocket_route("/workspace/ws", workspace_websocket)
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+import asyncio
 import json
 import logging
-from typing import Dict, List
+import os
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 from services.arduino_cli import run_arduino_cli
+from services.catalog import CatalogQuery, catalog_response, loads
+from services.example_index import example_index
+from services.scheduler import RateLimited, client_identity, scheduler
+from services.library_resolver import library_index
 
 router = APIRouter(prefix="/libraries", tags=["libraries"])
 logger = logging.getLogger(__name__)
@@ -14,53 +20,80 @@ class LibraryRequest(BaseModel):
 class LibrarySearchRequest(BaseModel):
     query: str = ""
 
+class LibraryResolveRequest(BaseModel):
+    code: str
+    sketch_path: Optional[str] = None
+    auto_install: bool = False
+
 @router.get("/")
-async def get_libraries():
+@router.get("", include_in_schema=False)
+async def get_libraries(query: CatalogQuery = Depends()):
     """Get list of installed libraries"""
-    result = run_arduino_cli(['arduino-cli', 'lib', 'list', '--format', 'json'])
+    result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'lib', 'list', '--format', 'json'])
     
     if result['success']:
         try:
-            libraries = json.loads(result['stdout'])
-            return {"success": True, "libraries": libraries.get('libraries', [])}
+            libraries = loads(result['stdout'])
+            return catalog_response(libraries.get('installed_libraries', []), "libraries", query)
         except json.JSONDecodeError:
             return {"success": False, "error": "Failed to parse library list"}
     
     return {"success": False, "error": result['stderr']}
 
 @router.post("/search")
-async def search_libraries(request: LibrarySearchRequest):
-    """Search for libraries"""
+async def search_libraries(request: LibrarySearchRequest, query: CatalogQuery = Depends()):
+    """Search for libraries; an empty query lists the whole index"""
     if request.query:
-        result = run_arduino_cli(['arduino-cli', 'lib', 'search', request.query, '--format', 'json'])
+        command = ['arduino-cli', 'lib', 'search', request.query, '--format', 'json']
     else:
-        result = run_arduino_cli(['arduino-cli', 'lib', 'search', '--format', 'json'])
+        command = ['arduino-cli', 'lib', 'search', '--format', 'json']
+    result = await asyncio.to_thread(run_arduino_cli, command)
     
     if result['success']:
         try:
-            libraries = json.loads(result['stdout'])
-            return {"success": True, "libraries": libraries.get('libraries', [])}
+            libraries = loads(result['stdout'])
+            return catalog_response(libraries.get('libraries', []), "libraries", query)
         except json.JSONDecodeError:
             return {"success": False, "error": "Failed to parse library search results"}
     
     return {"success": False, "error": result['stderr']}
 
 @router.post("/install")
-async def install_library(request: LibraryRequest):
+async def install_library(request: LibraryRequest, user: str = Depends(client_identity)):
     """Install a library"""
-    result = run_arduino_cli(['arduino-cli', 'lib', 'install', request.library_name])
+    async with scheduler.slot("install", user):
+        result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'lib', 'install', request.library_name])
+    library_index.invalidate_installed()
+    example_index.invalidate()
     
     if result['success']:
         return {"success": True, "message": f"Library {request.library_name} installed successfully"}
     
-    return {"success": False, "error": result['stderr']}
+    # "message" is what older clients show on failure
+    return {"success": False, "error": result['stderr'], "message": result['stderr']}
 
 @router.post("/uninstall")
-async def uninstall_library(request: LibraryRequest):
+async def uninstall_library(request: LibraryRequest, user: str = Depends(client_identity)):
     """Uninstall a library"""
-    result = run_arduino_cli(['arduino-cli', 'lib', 'uninstall', request.library_name])
+    async with scheduler.slot("install", user):
+        result = await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'lib', 'uninstall', request.library_name])
+    library_index.invalidate_installed()
+    example_index.invalidate()
     
     if result['success']:
         return {"success": True, "message": f"Library {request.library_name} uninstalled successfully"}
     
-    return {"success": False, "error": result['stderr']}
\ No newline at end of file
+    return {"success": False, "error": result['stderr'], "message": result['stderr']}
+
+@router.post("/resolve")
+async def resolve_libraries(request: LibraryResolveRequest, user: str = Depends(client_identity)):
+    """Find the libraries a sketch's #includes need, optionally installing the missing ones"""
+    try:
+        sketch_dir = os.path.dirname(request.sketch_path) if request.sketch_path else None
+        report = await library_index.check_sketch(request.code, sketch_dir, install=request.auto_install, user=user)
+        return {"success": True, **report}
+    except RateLimited:
+        raise
+    except Exception as e:
+        logger.error(f"Error resolving libraries: {e}")
+        return {"success": False, "error": str(e)}
\ No newline at end of file
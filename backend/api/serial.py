@@ -1,94 +1,49 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+import csv
+import io
 import json
 import logging
 import asyncio
-import serial
+import codecs
+import time
 import serial.tools.list_ports
-from typing import Dict, List
+from typing import Optional
+from pydantic import BaseModel
+from services.serial_recorder import recorder
+from services.serial_session import serial_session
+from services.port_discovery import discovery
+from services.metrics import serial_bytes
+from services.arduino_cli import cli_environment, resolve_cli_command
+from services.telemetry import telemetry
 
 router = APIRouter(prefix="/serial", tags=["serial"])
 logger = logging.getLogger(__name__)
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-        self.serial_connection = None
-        self.read_task = None
+# Most bytes of monitor output relayed per websocket message
+MONITOR_READ_SIZE = 4096
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            await connection.send_text(message)
-
-    async def connect_serial(self, port: str, baud_rate: int):
-        try:
-            if self.serial_connection and self.serial_connection.is_open:
-                self.serial_connection.close()
-            
-            self.serial_connection = serial.Serial(port, baud_rate, timeout=0)
-            
-            if self.read_task:
-                self.read_task.cancel()
-            
-            self.read_task = asyncio.create_task(self.read_serial())
-            
-            return True
-        except Exception as e:
-            logger.error(f"Error connecting to serial port: {e}")
-            return False
-
-    async def disconnect_serial(self):
-        try:
-            if self.read_task:
-                self.read_task.cancel()
-                self.read_task = None
-            
-            if self.serial_connection and self.serial_connection.is_open:
-                self.serial_connection.close()
-                self.serial_connection = None
-            
-            return True
-        except Exception as e:
-            logger.error(f"Error disconnecting from serial port: {e}")
-            return False
-
-    async def send_serial(self, data: str):
-        try:
-            if self.serial_connection and self.serial_connection.is_open:
-                self.serial_connection.write(data.encode())
-                return True
-            return False
-        except Exception as e:
-            logger.error(f"Error sending data to serial port: {e}")
-            return False
-
-    async def read_serial(self):
-        try:
-            while self.serial_connection and self.serial_connection.is_open:
-                if self.serial_connection.in_waiting > 0:
-                    data = self.serial_connection.read(self.serial_connection.in_waiting).decode(errors='replace')
-                    await self.broadcast(data)
-                await asyncio.sleep(0.01)
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Error reading from serial port: {e}")
-
-manager = ConnectionManager()
+class RecordingRequest(BaseModel):
+    port: Optional[str] = None
+    name: Optional[str] = None
 
 @router.get("/ports")
 async def get_ports():
     """Get list of available serial ports"""
+    if discovery.running:
+        ports = []
+        for entry in discovery.detected_ports():
+            port = entry["port"]
+            properties = port.get("properties", {})
+            hwid = port.get("hardwareId") or ":".join(
+                properties[key] for key in ("vid", "pid") if key in properties
+            )
+            ports.append({
+                "device": port.get("address"),
+                "description": port.get("label") or port.get("protocolLabel", ""),
+                "hwid": hwid
+            })
+        return {"success": True, "ports": {"detected_ports": ports}}
     try:
         ports = []
         for port in serial.tools.list_ports.comports():
@@ -101,9 +56,105 @@ async def get_ports():
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+@router.websocket("/ports/ws")
+async def ports_websocket(websocket: WebSocket):
+    """Push port add/remove events as devices are plugged in and out"""
+    await websocket.accept()
+    queue = discovery.subscribe()
+    try:
+        while True:
+            await websocket.send_json(await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        discovery.unsubscribe(queue)
+
+@router.get("/recordings")
+async def list_recordings():
+    """List serial recordings stored on disk"""
+    try:
+        return {"success": True, "recordings": recorder.list()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.post("/recordings/start")
+async def start_recording(request: RecordingRequest):
+    """Start recording the bytes read from a serial port"""
+    try:
+        recording = await serial_session.start_recording(request.port, request.name)
+        return {"success": True, "recording": recording}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.post("/recordings/{recording_id}/stop")
+async def stop_recording(recording_id: str):
+    """Stop an active recording"""
+    recording = await serial_session.stop_recording(recording_id)
+    if not recording:
+        return {"success": False, "error": "Recording is not active"}
+    return {"success": True, "recording": recording}
+
+@router.delete("/recordings/{recording_id}")
+async def delete_recording(recording_id: str):
+    """Delete a recording and its segments"""
+    if not await serial_session.delete_recording(recording_id):
+        return {"success": False, "error": "Recording not found"}
+    return {"success": True}
+
+@router.get("/recordings/{recording_id}/replay")
+async def replay_recording(recording_id: str, start: Optional[float] = None,
+                           end: Optional[float] = None, max_bytes: int = 1024 * 1024):
+    """Get the recorded data between two epoch timestamps"""
+    recording = recorder.get(recording_id)
+    if not recording:
+        return {"success": False, "error": "Recording not found"}
+    chunks = []
+    total = 0
+    truncated = False
+    for ts, data in recording.read_range(start, end):
+        if total + len(data) > max_bytes:
+            truncated = True
+            break
+        chunks.append({"t": ts, "data": data.decode(errors='replace')})
+        total += len(data)
+    return {"success": True, "chunks": chunks, "truncated": truncated}
+
+@router.get("/recordings/{recording_id}/export")
+async def export_recording(recording_id: str, start: Optional[float] = None, end: Optional[float] = None):
+    """Export recorded data between two epoch timestamps as CSV"""
+    recording = recorder.get(recording_id)
+    if not recording:
+        return {"success": False, "error": "Recording not found"}
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["timestamp", "data"])
+        for ts, data in recording.read_range(start, end):
+            writer.writerow([f"{ts:.6f}", data.decode(errors='replace')])
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(
+        generate_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{recording_id}.csv"'}
+    )
+
+@router.get("/status")
+async def get_status():
+    """The shared serial session, wherever its port is open"""
+    try:
+        return {"success": True, "session": await serial_session.status()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    await serial_session.connect(websocket)
     try:
         while True:
             data = await websocket.receive_text()
@@ -112,19 +163,97 @@ async def websocket_endpoint(websocket: WebSocket):
                 if message.get("type") == "connect":
                     port = message.get("port")
                     baud_rate = int(message.get("baudRate", 9600))
-                    success = await manager.connect_serial(port, baud_rate)
+                    success = await serial_session.connect_serial(port, baud_rate)
                     await websocket.send_json({"type": "connect", "success": success})
                 elif message.get("type") == "disconnect":
-                    success = await manager.disconnect_serial()
+                    success = await serial_session.disconnect_serial()
                     await websocket.send_json({"type": "disconnect", "success": success})
                 elif message.get("type") == "send":
                     data = message.get("data", "")
-                    success = await manager.send_serial(data)
+                    success = await serial_session.send_serial(data)
                     await websocket.send_json({"type": "send", "success": success})
             except json.JSONDecodeError:
-                await manager.send_serial(data)
+                await serial_session.send_serial(data)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        serial_session.disconnect(websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        manager.disconnect(websocket)
\ No newline at end of file
+        serial_session.disconnect(websocket)
+
+# Older clients open one socket per port and talk to an `arduino-cli monitor` of their
+# own; registered last so /ws and /ports/ws above take precedence
+@router.websocket("/{port:path}")
+async def monitor_websocket(websocket: WebSocket, port: str):
+    """Relay an arduino-cli monitor on the port, output forwarded as it arrives"""
+    await websocket.accept()
+    process = None
+    session_started = time.monotonic()
+    bytes_in = 0
+    bytes_out = 0
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *resolve_cli_command(['arduino-cli', 'monitor', '--port', port]),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=cli_environment()
+        )
+        
+        async def pump_monitor_output():
+            nonlocal bytes_in
+            # Forward whatever the monitor has produced, without waiting for a newline;
+            # the decoder holds back a character split across two reads
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            while True:
+                chunk = await process.stdout.read(MONITOR_READ_SIZE)
+                if not chunk:
+                    break
+                bytes_in += len(chunk)
+                serial_bytes.labels(port, "in").inc(len(chunk))
+                text = decoder.decode(chunk)
+                if text:
+                    await websocket.send_text(text)
+        
+        async def pump_client_input():
+            nonlocal bytes_out
+            # Write whatever the client sends to the monitor's stdin
+            while True:
+                data = (await websocket.receive_text()).encode()
+                bytes_out += len(data)
+                serial_bytes.labels(port, "out").inc(len(data))
+                process.stdin.write(data)
+                await process.stdin.drain()
+        
+        tasks = [asyncio.create_task(pump_monitor_output()), asyncio.create_task(pump_client_input())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, (WebSocketDisconnect, ConnectionError)):
+                raise result
+        
+    except WebSocketDisconnect:
+        logger.info(f"Serial monitor disconnected for port {port}")
+    except Exception as e:
+        logger.error(f"Serial monitor error: {e}")
+        try:
+            await websocket.send_text(f"Error: {str(e)}")
+        except Exception:
+            pass
+    finally:
+        if process and process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=2)
+            except asyncio.TimeoutError:
+                process.kill()
+        telemetry.emit(
+            "serial_session",
+            port=port,
+            duration=time.monotonic() - session_started,
+            bytes_in=bytes_in,
+            bytes_out=bytes_out
+        )
@@ -0,0 +1,54 @@
+from fastapi import APIRouter, Depends
+import logging
+from typing import Optional
+from pydantic import BaseModel
+from services.scheduler import client_identity
+from services.sketch_store import sketch_repository
+
+router = APIRouter(prefix="/sketches", tags=["sketches"])
+logger = logging.getLogger(__name__)
+
+# Histories belong to the requester as client_identity sees them (the verified
+# Supabase user, else the client address); a user_id sent by the client is ignored
+
+class SketchRevisionRequest(BaseModel):
+    content: str
+
+@router.get("/")
+async def list_sketches(user_id: str = Depends(client_identity)):
+    """List a user's stored sketches with their latest revision"""
+    try:
+        sketches = await sketch_repository.list_sketches(user_id)
+        return {"success": True, "sketches": sketches}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.post("/{sketch_id}/revisions")
+async def save_revision(sketch_id: str, request: SketchRevisionRequest, user_id: str = Depends(client_identity)):
+    """Store a new revision of a sketch; unchanged content keeps the current revision"""
+    try:
+        result = await sketch_repository.save(user_id, sketch_id, request.content)
+        return {"success": True, **result}
+    except Exception as e:
+        logger.error(f"Error saving sketch revision: {e}")
+        return {"success": False, "error": str(e)}
+
+@router.get("/{sketch_id}/revisions")
+async def list_revisions(sketch_id: str, limit: int = 100, user_id: str = Depends(client_identity)):
+    """List revisions of a sketch, newest first"""
+    try:
+        revisions = await sketch_repository.history(user_id, sketch_id, limit)
+        return {"success": True, "revisions": revisions}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@router.get("/{sketch_id}")
+async def get_sketch(sketch_id: str, rev: Optional[int] = None, user_id: str = Depends(client_identity)):
+    """Get the latest revision of a sketch, or a specific one"""
+    try:
+        revision = await sketch_repository.load(user_id, sketch_id, rev)
+        if not revision:
+            return {"success": False, "error": "Revision not found"}
+        return {"success": True, **revision}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
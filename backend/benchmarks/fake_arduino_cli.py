@@ -0,0 +1,97 @@
+"""Stand-in for arduino-cli used by the benchmarks
+
+Answers the subcommands the backend runs with canned output after a fixed delay.
+FAKE_CLI_LATENCY sets the delay in seconds and FAKE_CLI_OUTPUT_BYTES the approximate
+size of each response. `monitor --port P` copies the device's output to stdout.
+"""
+import json
+import os
+import sys
+import time
+
+LATENCY = float(os.environ.get('FAKE_CLI_LATENCY', 0.05))
+OUTPUT_BYTES = int(os.environ.get('FAKE_CLI_OUTPUT_BYTES', 4096))
+
+
+def option(args, name, default=None):
+    if name in args and args.index(name) + 1 < len(args):
+        return args[args.index(name) + 1]
+    return default
+
+
+def padded_list(make_item):
+    """Items from make_item(i) until their JSON reaches OUTPUT_BYTES"""
+    items = []
+    size = 0
+    while size < OUTPUT_BYTES or not items:
+        item = make_item(len(items))
+        size += len(json.dumps(item)) + 2
+        items.append(item)
+    return items
+
+
+def board_listall():
+    return {"boards": padded_list(lambda i: {"name": f"Fake Board {i}", "fqbn": f"fake:avr:board{i}"})}
+
+
+def lib_search(query):
+    return {"libraries": padded_list(lambda i: {
+        "name": f"{query or 'Fake'} Library {i}",
+        "latest": {"version": "1.0.0", "author": "Benchmarks", "sentence": "A library that does not exist."}
+    })}
+
+
+def compile_output():
+    lines = []
+    size = 0
+    while size < OUTPUT_BYTES:
+        line = f"Compiling fake translation unit {len(lines)}"
+        lines.append(line)
+        size += len(line) + 1
+    lines.append("Sketch uses 924 bytes (2%) of program storage space. Maximum is 32256 bytes.")
+    return '\n'.join(lines)
+
+
+def monitor(port):
+    fd = os.open(port, os.O_RDONLY | os.O_NOCTTY)
+    out = sys.stdout.buffer
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError:
+            break
+        if not chunk:
+            break
+        out.write(chunk)
+        out.flush()
+
+
+def main(args):
+    if args[:1] == ['monitor']:
+        monitor(option(args, '--port'))
+        return 0
+
+    time.sleep(LATENCY)
+    command = [arg for arg in args if not arg.startswith('-')][:2]
+    if command == ['board', 'listall']:
+        print(json.dumps(board_listall()))
+    elif command == ['board', 'list']:
+        print(json.dumps({"detected_ports": []}))
+    elif command[:2] == ['lib', 'search']:
+        query = args[2] if len(args) > 2 and not args[2].startswith('-') else ''
+        print(json.dumps(lib_search(query)))
+    elif command == ['lib', 'list']:
+        print(json.dumps({"installed_libraries": []}))
+    elif command == ['core', 'list']:
+        print(json.dumps({"platforms": []}))
+    elif command[:1] == ['compile']:
+        print(compile_output())
+    elif command[:1] == ['upload']:
+        print("Upload complete")
+    else:
+        print("{}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,427 @@
+"""Local load tests for the backend
+
+Times cold starts, then runs the app in-process with a stub arduino-cli and pty-backed serial devices,
+drives the hot endpoints concurrently and writes latency percentiles and throughput
+as JSON, optionally compared with an earlier run:
+
+    cd backend
+    python -m benchmarks.run --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.run --baseline results/<older>.json
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = Path(__file__).parent
+BACKEND_DIR = BENCHMARKS_DIR.parent
+SCENARIOS = ['startup', 'boards', 'library_search', 'compile', 'serial_fanout']
+
+# Endpoints exercised for each entry point. Both serve the same app; server:app is
+# benchmarked through the original backend's URLs, whose compile uses a throwaway
+# sketch directory and whose serial sockets each run their own monitor.
+ROUTES = {
+    'main:app': {
+        'health': '/api/health',
+        'boards': '/api/boards/',
+        'library_search': '/api/libraries/search',
+        'compile': '/api/compile/verify',
+        'serial': 'shared',
+    },
+    'server:app': {
+        'health': '/api/health',
+        'boards': '/api/boards',
+        'library_search': '/api/libraries/search',
+        'compile': '/api/compile',
+        'serial': 'per_socket',
+    },
+}
+
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    """Latency figures in milliseconds and completed operations per second"""
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "p50_ms": percentile(ms, 0.50),
+        "p99_ms": percentile(ms, 0.99),
+        "mean_ms": statistics.fmean(ms) if ms else None,
+        "max_ms": max(ms) if ms else None,
+        "throughput": len(ms) / elapsed if elapsed > 0 else None,
+    }
+
+
+def prepare_environment(workdir: str, latency: float, output_bytes: int, compile_clients: int):
+    """Point the app at the stub CLI and a scratch directory; must run before the app is imported
+
+    Every benchmark connection comes from one address, so one user: its
+    per-user compile limits are lifted to the server's, or most compiles
+    would be refused with 429 rather than measured.
+    """
+    wrapper = os.path.join(workdir, 'arduino-cli')
+    with open(wrapper, 'w') as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{BENCHMARKS_DIR / "fake_arduino_cli.py"}" "$@"\n')
+    os.chmod(wrapper, 0o755)
+    os.environ.update({
+        'ARDUINO_CLI': wrapper,
+        'FAKE_CLI_LATENCY': str(latency),
+        'FAKE_CLI_OUTPUT_BYTES': str(output_bytes),
+        'TEMP': workdir,
+        'LIBRARY_INDEX_PATH': os.path.join(workdir, 'library_index.json'),
+        'INDEX_STATE_PATH': os.path.join(workdir, 'index_state.json'),
+        'INDEX_REFRESH_INTERVAL': '0',
+        'DISCOVERY_TOOLS_DIR': os.path.join(workdir, 'tools'),
+    })
+    concurrency = os.environ.get('COMPILE_CONCURRENCY', str(os.cpu_count() or 2))
+    os.environ.update({
+        'COMPILE_CONCURRENCY': concurrency,
+        'COMPILE_USER_CONCURRENCY': concurrency,
+        'COMPILE_USER_RATE': '0',
+        'COMPILE_USER_QUEUE': str(compile_clients),
+    })
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """Runs the app under uvicorn on a background thread"""
+
+    def __init__(self, app_path: str):
+        self.app_path = app_path
+        self.port = free_port()
+        self.server = None
+        self.thread = None
+
+    def start(self, timeout: float = 30):
+        import uvicorn
+        config = uvicorn.Config(self.app_path, host='127.0.0.1', port=self.port, log_level='warning')
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"{self.app_path} did not start")
+            time.sleep(0.05)
+
+    def stop(self):
+        if self.server:
+            self.server.should_exit = True
+            self.thread.join(timeout=10)
+
+
+def run_http_load(port: int, make_request: Callable[[int], tuple], requests: int, concurrency: int) -> Dict:
+    """Send `requests` requests over `concurrency` keep-alive connections"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        nonlocal errors
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, body = make_request(i)
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                ok = response.status == 200 and json.loads(payload).get('success', True)
+            except (OSError, http.client.HTTPException, ValueError):
+                ok = False
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+        conn.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def bench_startup(port: int, args) -> Dict:
+    """Time from launching a server process until it answers, and the bare import time
+
+    Runs in fresh processes, so it measures cold start rather than the in-process app.
+    """
+    module = args.app.split(':')[0]
+    ready = []
+    imports = []
+    errors = 0
+    for _ in range(args.startup_runs):
+        output = subprocess.run(
+            [sys.executable, '-c', f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"],
+            cwd=BACKEND_DIR, capture_output=True, text=True
+        )
+        if output.returncode == 0:
+            imports.append(float(output.stdout.strip().splitlines()[-1]))
+
+        process_port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', args.app, '--host', '127.0.0.1', '--port', str(process_port), '--log-level', 'warning'],
+            cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            deadline = started + 60
+            while time.perf_counter() < deadline and process.poll() is None:
+                try:
+                    conn = http.client.HTTPConnection('127.0.0.1', process_port, timeout=1)
+                    conn.request('GET', ROUTES[args.app]['health'])
+                    if conn.getresponse().status == 200:
+                        ready.append(time.perf_counter() - started)
+                        break
+                except OSError:
+                    pass
+                finally:
+                    conn.close()
+                time.sleep(0.01)
+            else:
+                errors += 1
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    result = summarize(ready, errors, 0)
+    del result["throughput"]
+    result["import_p50_ms"] = percentile([seconds * 1000 for seconds in imports], 0.50)
+    return result
+
+
+def bench_boards(port: int, args) -> Dict:
+    path = ROUTES[args.app]['boards']
+    return run_http_load(port, lambda i: ('GET', path, None), args.requests, args.concurrency)
+
+
+def bench_library_search(port: int, args) -> Dict:
+    path = ROUTES[args.app]['library_search']
+    return run_http_load(
+        port, lambda i: ('POST', path, {"query": f"sensor{i % 10}"}),
+        args.requests, args.concurrency
+    )
+
+
+def bench_compile(port: int, args) -> Dict:
+    path = ROUTES[args.app]['compile']
+    sketches = os.path.join(os.environ['TEMP'], 'bench_sketches')
+
+    def make_request(i):
+        name = f"sketch_{i}_{uuid.uuid4().hex[:8]}"
+        return ('POST', path, {
+            "code": f"void setup() {{}}\nvoid loop() {{ delay({i}); }}\n",
+            "board": "arduino:avr:uno",
+            "sketch_path": os.path.join(sketches, name, f"{name}.ino"),
+        })
+
+    return run_http_load(port, make_request, args.compiles, args.compile_concurrency)
+
+
+async def _serial_fanout(port: int, args) -> Dict:
+    import websockets
+    from benchmarks.virtual_serial import VirtualSerialDevice
+
+    shared = ROUTES[args.app]['serial'] == 'shared'
+    devices = [
+        VirtualSerialDevice(rate=args.serial_rate, line_length=args.serial_line_length)
+        for _ in range(1 if shared else args.subscribers)
+    ]
+    for device in devices:
+        device.start()
+    latencies = []
+    if shared:
+        urls = [f"ws://127.0.0.1:{port}/api/serial/ws"] * args.subscribers
+    else:
+        urls = [f"ws://127.0.0.1:{port}/api/serial/{device.path}" for device in devices]
+    clients = [await websockets.connect(url, max_size=None) for url in urls]
+
+    async def receive(ws, stop_at):
+        buffer = ''
+        while True:
+            remaining = stop_at - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except (asyncio.TimeoutError, websockets.ConnectionClosed):
+                return
+            arrived = time.perf_counter_ns()
+            if message.startswith('{'):
+                # Status and command replies, not device output
+                continue
+            # The shared session forwards raw chunks, the monitor one line per message
+            buffer += message if shared else message + '\n'
+            *lines, buffer = buffer.split('\n')
+            for line in lines:
+                parts = line.split(' ', 2)
+                if len(parts) == 3 and parts[1].isdigit():
+                    latencies.append((arrived - int(parts[1])) / 1e9)
+
+    try:
+        if shared:
+            await clients[0].send(json.dumps({"type": "connect", "port": devices[0].path, "baudRate": args.serial_rate * 10}))
+        started = time.perf_counter()
+        sent_before = sum(device.sent for device in devices)
+        stop_at = time.monotonic() + args.serial_duration
+        await asyncio.gather(*(receive(ws, stop_at) for ws in clients))
+        elapsed = time.perf_counter() - started
+        sent = sum(device.sent for device in devices) - sent_before
+        if shared:
+            await clients[0].send(json.dumps({"type": "disconnect"}))
+    finally:
+        for ws in clients:
+            await ws.close()
+        for device in devices:
+            device.stop()
+
+    result = summarize(latencies, 0, elapsed)
+    expected = sent * args.subscribers if shared else sent
+    result.update(
+        subscribers=args.subscribers,
+        lines_sent=sent,
+        lines_dropped_at_device=sum(device.dropped for device in devices),
+        delivery_ratio=len(latencies) / expected if expected else None,
+    )
+    return result
+
+
+def bench_serial_fanout(port: int, args) -> Dict:
+    return asyncio.run(_serial_fanout(port, args))
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'boards': bench_boards,
+    'library_search': bench_library_search,
+    'compile': bench_compile,
+    'serial_fanout': bench_serial_fanout,
+}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """One line per scenario: p50, p99 and throughput change from the baseline"""
+    lines = []
+    for name, current in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ("p50_ms", "p99_ms", "throughput", "import_p50_ms"):
+            if current.get(key) and before.get(key):
+                changes.append(f"{key} {before[key]:.2f} -> {current[key]:.2f} ({(current[key] / before[key] - 1) * 100:+.1f}%)")
+        lines.append(f"{name}: {', '.join(changes)}")
+    return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app', default='main:app', choices=sorted(ROUTES), help="App to benchmark")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma-separated subset of " + ', '.join(SCENARIOS))
+    parser.add_argument('--startup-runs', type=int, default=5, help="Cold starts timed by the startup scenario")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per HTTP scenario")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent HTTP connections")
+    parser.add_argument('--compiles', type=int, default=64)
+    parser.add_argument('--compile-concurrency', type=int, default=16)
+    parser.add_argument('--cli-latency', type=float, default=0.05, help="Seconds the stub CLI takes per call")
+    parser.add_argument('--cli-output-bytes', type=int, default=4096, help="Approximate size of stub CLI output")
+    parser.add_argument('--subscribers', type=int, default=8, help="WebSocket clients watching the serial device")
+    parser.add_argument('--serial-rate', type=int, default=11520, help="Bytes per second the virtual device writes")
+    parser.add_argument('--serial-line-length', type=int, default=64)
+    parser.add_argument('--serial-duration', type=float, default=5)
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(BENCHMARKS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix='arduino-bench-')
+    prepare_environment(workdir, args.cli_latency, args.cli_output_bytes, args.compile_concurrency)
+    sys.path.insert(0, str(BACKEND_DIR))
+    server = AppServer(args.app)
+    server.start()
+    results = {}
+    try:
+        for name in scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = BENCHMARKS[name](server.port, args)
+    finally:
+        server.stop()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "platform": {"python": platform.python_version(), "system": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline.get('commit') or args.baseline}:", file=sys.stderr)
+        for line in compare(report, baseline):
+            print(f"  {line}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
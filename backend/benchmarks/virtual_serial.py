@@ -0,0 +1,79 @@
+"""Pseudo-terminal devices that behave like boards printing to a serial port"""
+import errno
+import os
+import pty
+import threading
+import time
+import tty
+
+
+class VirtualSerialDevice:
+    """The slave end of a pty, fed with timestamped lines at a fixed byte rate
+
+    Each line is `<sequence> <perf_counter_ns> <padding>\\n`, so a reader in the same
+    process can compute how long a line took to reach it. Lines that do not fit
+    because nobody is reading are dropped and counted, like a real UART overrun.
+    """
+
+    def __init__(self, rate: int = 11520, line_length: int = 64):
+        self.rate = rate
+        self.line_length = line_length
+        self.master = None
+        self.slave = None
+        self.path = None
+        self.sent = 0
+        self.dropped = 0
+        self.running = False
+        self.thread = None
+
+    def start(self) -> str:
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.path = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target=self._feed, daemon=True)
+        self.thread.start()
+        return self.path
+
+    def _line(self, sequence: int) -> bytes:
+        head = f"{sequence} {time.perf_counter_ns()} "
+        return (head + 'x' * max(self.line_length - len(head) - 1, 0) + '\n').encode()
+
+    def _feed(self):
+        interval = self.line_length / self.rate
+        next_write = time.perf_counter()
+        sequence = 0
+        while self.running:
+            line = self._line(sequence)
+            sequence += 1
+            try:
+                os.write(self.master, line)
+                self.sent += 1
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                self.dropped += 1
+            next_write += interval
+            delay = next_write - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1)
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
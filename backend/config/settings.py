@@ -1,4 +1,6 @@
+import hashlib
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -11,14 +13,130 @@ load_dotenv(ROOT_DIR / '.env')
 # MongoDB settings
 MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 DB_NAME = os.environ.get('DB_NAME', 'arduino_editor')
+# Seconds between connection attempts while MongoDB is unreachable
+MONGO_RETRY_INTERVAL = float(os.environ.get('MONGO_RETRY_INTERVAL', 5))
+
+# Sketch revision storage: a full snapshot at least every N revisions,
+# buffered revisions written every few seconds or once a batch fills up
+SKETCH_SNAPSHOT_INTERVAL = int(os.environ.get('SKETCH_SNAPSHOT_INTERVAL', 50))
+SKETCH_FLUSH_INTERVAL = float(os.environ.get('SKETCH_FLUSH_INTERVAL', 2))
+SKETCH_FLUSH_BATCH = int(os.environ.get('SKETCH_FLUSH_BATCH', 200))
+
+# Telemetry: events buffered in memory (oldest dropped beyond the limit)
+# and written to MongoDB in batches
+TELEMETRY_BUFFER_SIZE = int(os.environ.get('TELEMETRY_BUFFER_SIZE', 10000))
+TELEMETRY_BATCH_SIZE = int(os.environ.get('TELEMETRY_BATCH_SIZE', 500))
+TELEMETRY_FLUSH_INTERVAL = float(os.environ.get('TELEMETRY_FLUSH_INTERVAL', 5))
 
 # Arduino CLI settings
 BIN_PATH = str(ROOT_DIR.parent / 'bin')
+# Path of the arduino-cli executable to run instead of the one found on PATH
+ARDUINO_CLI = os.environ.get('ARDUINO_CLI')
 TEMP_DIR = os.environ.get('TEMP', os.path.join(ROOT_DIR, 'temp'))
+# Created by the workspace tree when it starts
 WORKSPACE_DIR = Path(os.path.join(TEMP_DIR, "arduino_workspace"))
 
-# Ensure workspace directory exists
-WORKSPACE_DIR.mkdir(exist_ok=True, parents=True)
+# Entries hidden from the workspace tree, as fnmatch patterns
+WORKSPACE_IGNORE = os.environ.get('WORKSPACE_IGNORE', 'build,.git,__pycache__,node_modules,.DS_Store,.*.tmp').split(',')
+# Seconds between mtime scans for directories inotify cannot watch
+WORKSPACE_POLL_INTERVAL = float(os.environ.get('WORKSPACE_POLL_INTERVAL', 2))
+
+# Bytes of recently used file text kept in memory for patch-based sync
+FILE_CACHE_BYTES = int(os.environ.get('FILE_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Serial recording settings
+RECORDINGS_DIR = Path(os.environ.get('RECORDINGS_DIR', os.path.join(TEMP_DIR, 'serial_recordings')))
+RECORDING_SEGMENT_BYTES = int(os.environ.get('RECORDING_SEGMENT_BYTES', 16 * 1024 * 1024))
+RECORDING_MAX_BYTES = int(os.environ.get('RECORDING_MAX_BYTES', 1024 * 1024 * 1024))
+
+# Number of arduino-cli compiles allowed to run at once across all workers; the rest wait in line
+COMPILE_CONCURRENCY = int(os.environ.get('COMPILE_CONCURRENCY', os.cpu_count() or 2))
+
+# Fair sharing of compiles and installs between users: each user may run a few
+# operations at once, the rest wait in per-user queues served in turn. A token
+# bucket (operations per second with a burst) and a bound on each queue answer
+# 429 past that. A user is, in order: the Supabase user of a request's token,
+# only trusted when it verifies against SUPABASE_JWT_SECRET; the value of the
+# SESSION_COOKIE cookie, for deployments whose proxy or SSO issues one (clients
+# can change a cookie the app does not verify, so it is off by default); else the
+# client address. Without a secret or cookie, everyone behind one NAT or proxy
+# is a single user: list the proxies in TRUSTED_PROXIES (addresses or networks)
+# so the client address is taken from their X-Forwarded-For instead.
+SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET')
+SESSION_COOKIE = os.environ.get('SESSION_COOKIE', '')
+TRUSTED_PROXIES = [proxy.strip() for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()]
+COMPILE_USER_CONCURRENCY = int(os.environ.get('COMPILE_USER_CONCURRENCY', 2))
+COMPILE_USER_RATE = float(os.environ.get('COMPILE_USER_RATE', 0.5))
+COMPILE_USER_BURST = int(os.environ.get('COMPILE_USER_BURST', 10))
+COMPILE_USER_QUEUE = int(os.environ.get('COMPILE_USER_QUEUE', 4))
+INSTALL_CONCURRENCY = int(os.environ.get('INSTALL_CONCURRENCY', 2))
+INSTALL_USER_CONCURRENCY = int(os.environ.get('INSTALL_USER_CONCURRENCY', 1))
+INSTALL_USER_RATE = float(os.environ.get('INSTALL_USER_RATE', 0.1))
+INSTALL_USER_BURST = int(os.environ.get('INSTALL_USER_BURST', 10))
+INSTALL_USER_QUEUE = int(os.environ.get('INSTALL_USER_QUEUE', 2))
+
+# Warm-up builds started when a client selects a board: at most this many per
+# worker, run at this nice level (and in the idle I/O class where ionice exists)
+PREWARM_CONCURRENCY = int(os.environ.get('PREWARM_CONCURRENCY', 1))
+PREWARM_NICE = int(os.environ.get('PREWARM_NICE', 19))
+
+# Build trees: on tmpfs up to BUILD_RAM_BYTES and spilled to BUILD_DISK_DIR
+# beyond that; least recently used trees are moved to disk, then removed once
+# the disk share passes BUILD_DISK_BYTES. An empty BUILD_RAM_DIR keeps them on disk.
+BUILD_RAM_DIR = os.environ.get('BUILD_RAM_DIR', '/dev/shm/arduino-builds')
+BUILD_RAM_BYTES = int(os.environ.get('BUILD_RAM_BYTES', 1024 * 1024 * 1024))
+BUILD_DISK_DIR = Path(os.environ.get('BUILD_DISK_DIR', os.path.join(TEMP_DIR, 'builds')))
+BUILD_DISK_BYTES = int(os.environ.get('BUILD_DISK_BYTES', 8 * 1024 * 1024 * 1024))
+
+# Library dependency resolution: the CLI's library index, where the derived
+# header -> library table is cached, and how many installs run at once
+LIBRARY_INDEX_PATH = Path(os.environ.get('LIBRARY_INDEX_PATH', ROOT_DIR / 'library_index.json'))
+LIBRARY_HEADER_CACHE = Path(os.environ.get('LIBRARY_HEADER_CACHE', os.path.join(TEMP_DIR, 'library_headers.json')))
+LIBRARY_INSTALL_CONCURRENCY = int(os.environ.get('LIBRARY_INSTALL_CONCURRENCY', 4))
+
+# Example catalog: its per-library cache and where opened examples are copied
+EXAMPLE_INDEX_CACHE = Path(os.environ.get('EXAMPLE_INDEX_CACHE', os.path.join(TEMP_DIR, 'example_index.json')))
+EXAMPLES_SKETCH_DIR = Path(os.environ.get('EXAMPLES_SKETCH_DIR', os.path.join(TEMP_DIR, 'examples')))
+
+# Files each sketch directory was sent, the only ones a later request may remove
+SKETCH_MANIFEST_DIR = Path(os.environ.get('SKETCH_MANIFEST_DIR', os.path.join(TEMP_DIR, 'sketch_manifests')))
+
+# Batch installs: arduino-cli's data and staging directories, the
+# content-addressed archive cache and how many downloads run at once
+ARDUINO_DATA_DIR = Path(os.environ.get('ARDUINO_DATA_DIR', ROOT_DIR))
+STAGING_DIR = Path(os.environ.get('STAGING_DIR', ROOT_DIR / 'staging'))
+DOWNLOAD_CACHE_DIR = Path(os.environ.get('DOWNLOAD_CACHE_DIR', ROOT_DIR / 'download_cache'))
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', 6))
+
+# Index refresh: where indexes come from (URLs or a local mirror directory),
+# how often they are checked and the keyring their signatures are checked against.
+# Only indexes with a valid signature replace the current ones unless
+# INDEX_ACCEPT_UNVERIFIED allows unsigned or unchecked ones too
+PACKAGE_INDEX_URL = os.environ.get('PACKAGE_INDEX_URL', 'https://downloads.arduino.cc/packages/package_index.json')
+LIBRARY_INDEX_URL = os.environ.get('LIBRARY_INDEX_URL', 'https://downloads.arduino.cc/libraries/library_index.json.gz')
+INDEX_MIRROR_DIR = os.environ.get('INDEX_MIRROR_DIR')
+INDEX_REFRESH_INTERVAL = float(os.environ.get('INDEX_REFRESH_INTERVAL', 6 * 60 * 60))
+INDEX_KEYRING = os.environ.get('INDEX_KEYRING')
+INDEX_ACCEPT_UNVERIFIED = os.environ.get('INDEX_ACCEPT_UNVERIFIED', '').lower() in ('1', 'true', 'yes')
+INDEX_STATE_PATH = Path(os.environ.get('INDEX_STATE_PATH', os.path.join(TEMP_DIR, 'index_state.json')))
+
+# Seconds to keep trying to reopen a serial port after an upload or reset
+SERIAL_RECONNECT_TIMEOUT = float(os.environ.get('SERIAL_RECONNECT_TIMEOUT', 15))
+
+# Unix socket through which the workers of one deployment share the serial
+# port and job state; empty keeps all of it in each worker's process. By
+# default it lives in the runtime directory, one per TEMP directory
+HUB_SOCKET = os.environ.get('HUB_SOCKET', os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+    f"arduino-hub-{hashlib.sha1(os.path.abspath(TEMP_DIR).encode()).hexdigest()[:12]}.sock"
+))
+
+# Port discovery settings
+DISCOVERY_TOOLS_DIR = Path(os.environ.get('DISCOVERY_TOOLS_DIR', ROOT_DIR / 'packages' / 'builtin' / 'tools'))
+DISCOVERY_TOOLS = os.environ.get('DISCOVERY_TOOLS', 'serial-discovery,mdns-discovery').split(',')
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
 
 # API settings
 API_PREFIX = "/api"
@@ -1,18 +1,28 @@
-from fastapi import FastAPI
+import time
+
+# Reference point for the startup time reported by /api/health
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
 import logging
+import math
 from pathlib import Path
 from dotenv import load_dotenv
 
-# Import API routers
-from api.boards import router as boards_router
-from api.libraries import router as libraries_router
-from api.compile import router as compile_router
-from api.files import router as files_router
-from api.serial import router as serial_router
-from api.cores import router as cores_router
+from config.settings import COMPRESSION_MIN_BYTES
+from services.arduino_cli import cli_environment, cli_executable
+from services.compression import CompressionMiddleware
+from services.database import database
+from services.hub import hub
+from services.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from services.router_loader import LazyRouterMiddleware, RouterLoader
+from services.scheduler import RateLimited, scheduler
+from services.telemetry import telemetry
 
 # Setup logging
 logging.basicConfig(
@@ -25,39 +35,169 @@ logger = logging.getLogger(__name__)
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# Create the main app
-app = FastAPI(title="Arduino Code Editor API")
-
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# API routers by their path segment after /api, imported on first request.
+# api.legacy keeps the original backend's URLs outside these prefixes working.
+ROUTERS = {
+    "boards": "api.boards",
+    "libraries": "api.libraries",
+    "compile": "api.compile",
+    "files": "api.files",
+    "serial": "api.serial",
+    "cores": "api.cores",
+    "sketches": "api.sketches",
+    "install": "api.install",
+    "indexes": "api.indexes",
+    "examples": "api.examples",
+    "ports": "api.legacy",
+    "workspace": "api.legacy",
+    "upload": "api.legacy",
+}
+
+# Services with background work, as (module, instance), started in this order
+# once the app is serving and stopped in reverse
+SERVICES = [
+    ("services.port_discovery", "discovery"),
+    ("services.workspace_tree", "workspace_tree"),
+    ("services.library_resolver", "library_index"),
+    ("services.index_manager", "index_manager"),
+    ("services.example_index", "example_index"),
+    ("services.prewarm", "prewarmer"),
+    ("services.sketch_store", "sketch_repository"),
+]
+# Modules registering hub methods by namespace, imported when another worker first calls one
+HUB_PROVIDERS = {
+    "builds": "services.build_roots",
+    "jobs": "services.jobs",
+    "serial": "services.serial_session",
+    "sketches": "services.sketch_store",
+}
+
+startup = {"ready": False, "seconds": None}
+
+
+async def start_services(started: list):
+    """Import the services (pyserial, pymongo and the rest with them) off the event loop once serving"""
+    for module_name, name in SERVICES:
+        try:
+            module = await asyncio.to_thread(importlib.import_module, module_name)
+            service = getattr(module, name)
+            await service.start()
+            started.append(service)
+        except Exception as e:
+            logger.error(f"Error starting {module_name}: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for namespace, module_name in HUB_PROVIDERS.items():
+        hub.provide(namespace, module_name)
+
+    # Resolve the CLI's environment and executable once for every process started later
+    cli_environment()
+    logger.info(f"Using {cli_executable()}")
+    await hub.start()
+    await database.connect()
+    await telemetry.start()
+    started = []
+    services_task = asyncio.create_task(start_services(started))
+
+    startup["ready"] = True
+    startup["seconds"] = time.perf_counter() - IMPORT_STARTED
+    logger.info(f"Ready {startup['seconds'] * 1000:.0f} ms after import")
+    try:
+        yield
+    finally:
+        services_task.cancel()
+        await asyncio.gather(services_task, return_exceptions=True)
+        # The revision store flushes pending saves here, before the database closes
+        for service in reversed(started):
+            try:
+                await service.stop()
+            except Exception as e:
+                logger.error(f"Error stopping {type(service).__name__}: {e}")
+        await telemetry.stop()
+        await database.close()
+        await hub.stop()
 
-# Include routers
-app.include_router(boards_router, prefix="/api")
-app.include_router(libraries_router, prefix="/api")
-app.include_router(compile_router, prefix="/api")
-app.include_router(files_router, prefix="/api")
-app.include_router(serial_router, prefix="/api")
-app.include_router(cores_router, prefix="/api")
 
-@app.get("/api")
+# Routes that are part of the app itself rather than a domain router
+system_router = APIRouter()
+
+@system_router.get("/api")
+@system_router.get("/api/", include_in_schema=False)
 async def root():
     return {"message": "Arduino Code Editor API"}
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+@system_router.get("/api/health")
+async def health(request: Request):
+    """Liveness: the process is up and serving, whatever its dependencies are doing"""
+    return {
+        "success": True,
+        "startup_seconds": startup["seconds"],
+        "database": database.status(),
+        "hub": hub.status(),
+        "routers": request.app.state.routers.status()
+    }
+
+@system_router.get("/api/ready")
+async def ready():
+    """Readiness: 503 until startup has finished and MongoDB answers"""
+    is_ready = startup["ready"] and database.ready
+    return JSONResponse(
+        {"success": is_ready, "startup": startup["ready"], "database": database.status()},
+        status_code=200 if is_ready else 503
+    )
+
+@system_router.get("/api/telemetry")
+async def telemetry_stats():
+    """Telemetry sink counters: events emitted, written, buffered and dropped"""
+    return {"success": True, "telemetry": telemetry.stats()}
+
+@system_router.get("/api/scheduler")
+async def scheduler_status():
+    """Running and waiting compiles and installs, shared fairly between users"""
+    try:
+        return {"success": True, "pools": await scheduler.status()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@system_router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+async def rate_limited(request: Request, exc: RateLimited):
+    return JSONResponse(
+        {"success": False, "error": str(exc), "retry_after": exc.retry_after},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
+def create_app() -> FastAPI:
+    """The backend: every API router, served under both the current and the original URLs"""
+    app = FastAPI(title="Arduino Code Editor API", lifespan=lifespan)
+    app.state.routers = RouterLoader(app, ROUTERS, prefix="/api")
+
+    # Innermost, so metrics and CORS see the response as it is sent
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Total-Count", "Retry-After"],
+    )
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(LazyRouterMiddleware, loader=app.state.routers)
+
+    app.add_exception_handler(RateLimited, rate_limited)
+    app.include_router(system_router)
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
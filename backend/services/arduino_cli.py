@@ -1,36 +1,109 @@
 import subprocess
 import os
+import shutil
 import logging
-from typing import Dict, List
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from pathlib import Path
+from config.settings import ARDUINO_CLI, BIN_PATH
+from services.metrics import cli_duration, cli_spawns, compile_queue_depth, compiles_running
+from services.scheduler import scheduler
+from services.telemetry import PhaseTimer, telemetry
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def compile_slot(timer: PhaseTimer, user: str):
+    """Wait for the user's turn at a compile slot, timing the wait as the "queue" phase"""
+    compile_queue_depth.inc()
+    try:
+        with timer.phase("queue"):
+            ticket = await scheduler.acquire("compile", user)
+    finally:
+        compile_queue_depth.dec()
+    compiles_running.inc()
+    try:
+        yield
+    finally:
+        compiles_running.dec()
+        await scheduler.release("compile", ticket)
+
+def cli_subcommand(command: List[str]) -> str:
+    """Subcommand of an arduino-cli invocation, e.g. 'compile' or 'lib install'"""
+    return ' '.join(arg for arg in command[1:3] if not arg.startswith('-'))
+
+def record_cli_run(command: List[str], duration: float, returncode: int,
+                   stdout: str = '', stderr: str = '', error: Optional[str] = None):
+    """Report one arduino-cli invocation to metrics and telemetry"""
+    subcommand = cli_subcommand(command)
+    outcome = 'error' if error else ('success' if returncode == 0 else 'failure')
+    cli_spawns.labels(subcommand, outcome).inc()
+    if not error:
+        cli_duration.labels(subcommand).observe(duration)
+    event = {
+        "subcommand": subcommand,
+        "duration": duration,
+        "returncode": returncode,
+        "stdout_bytes": len(stdout),
+        "stderr_bytes": len(stderr)
+    }
+    if error:
+        event["error"] = error
+    telemetry.emit("cli", **event)
+
 # Get the root directory
 ROOT_DIR = Path(__file__).parent.parent
 
-def run_arduino_cli(command: List[str]) -> Dict:
-    """Run arduino-cli command and return result"""
-    try:
-        # Add arduino-cli to PATH
+# Built on first use and shared by every arduino-cli process
+_environment: Optional[Dict[str, str]] = None
+_executable: Optional[str] = None
+
+def cli_environment() -> Dict[str, str]:
+    """Environment for arduino-cli processes, built once"""
+    global _environment
+    if _environment is None:
         env = os.environ.copy()
-        bin_path = str(ROOT_DIR.parent / 'bin')
-        env['PATH'] = f"{bin_path};{env.get('PATH', '')}"
+        # Add arduino-cli to PATH
+        env['PATH'] = f"{BIN_PATH}{os.pathsep}{env.get('PATH', '')}"
         # Set HOME to a Windows-compatible path
         env['HOME'] = str(ROOT_DIR)
-        
+        _environment = env
+    return _environment
+
+def cli_executable() -> str:
+    """Full path of arduino-cli, looked up on the CLI's PATH once it has been found"""
+    global _executable
+    if _executable is None:
         # Use arduino-cli.exe on Windows
-        if command[0] == 'arduino-cli' and os.name == 'nt':
-            command[0] = 'arduino-cli.exe'
+        name = ARDUINO_CLI or ('arduino-cli.exe' if os.name == 'nt' else 'arduino-cli')
+        found = shutil.which(name, path=cli_environment()['PATH'])
+        if not found:
+            return name
+        _executable = found
+    return _executable
+
+def resolve_cli_command(command: List[str]) -> List[str]:
+    if command[0] == 'arduino-cli':
+        return [cli_executable(), *command[1:]]
+    return command
+
+def run_arduino_cli(command: List[str]) -> Dict:
+    """Run arduino-cli command and return result"""
+    try:
+        env = cli_environment()
+        command = resolve_cli_command(command)
         
         logger.info(f"Running command: {' '.join(command)}")
         
+        started = time.perf_counter()
         result = subprocess.run(
             command,
             capture_output=True,
             text=True,
             env=env
         )
+        record_cli_run(command, time.perf_counter() - started, result.returncode, result.stdout, result.stderr)
         
         if result.returncode != 0:
             logger.error(f"Command failed with code {result.returncode}: {result.stderr}")
@@ -43,6 +116,7 @@ def run_arduino_cli(command: List[str]) -> Dict:
         }
     except Exception as e:
         logger.error(f"Exception running arduino-cli: {e}")
+        record_cli_run(command, 0.0, -1, error=str(e))
         return {
             'success': False,
             'stdout': '',
@@ -0,0 +1,401 @@
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import shutil
+import tempfile
+import urllib.request
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config.settings import (
+    ARDUINO_DATA_DIR, DOWNLOAD_CACHE_DIR, DOWNLOAD_CONCURRENCY, LIBRARY_INDEX_PATH,
+    LIBRARY_INSTALL_CONCURRENCY, STAGING_DIR
+)
+from services.arduino_cli import run_arduino_cli
+from services.example_index import example_index
+from services.library_resolver import library_index
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# Bytes between download progress events for one item
+PROGRESS_INTERVAL = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+EXACT_VERSION = re.compile(r'\d+(\.\d+)*(-[\w.]+)?')
+HASH_ALGORITHMS = {'SHA-256': 'sha256', 'SHA-1': 'sha1', 'MD5': 'md5'}
+
+# Tool host triplets usable on this machine, best first (same idea as arduino-cli's host matching)
+HOST_PATTERNS = {
+    ('Linux', 'x86_64'): [r'^x86_64-.*linux-gnu$', r'^i[3456]86-.*linux-gnu$'],
+    ('Linux', 'aarch64'): [r'^(aarch64|arm64)-.*linux-gnu$', r'^arm.*-linux-gnueabihf$'],
+    ('Linux', 'armv7l'): [r'^arm.*-linux-gnueabihf$'],
+    ('Linux', 'armv6l'): [r'^arm.*-linux-gnueabihf$'],
+    ('Linux', 'i686'): [r'^i[3456]86-.*linux-gnu$'],
+    ('Darwin', 'arm64'): [r'^arm64-apple-darwin.*$', r'^x86_64-apple-darwin.*$', r'^i[3456]86-apple-darwin.*$'],
+    ('Darwin', 'x86_64'): [r'^x86_64-apple-darwin.*$', r'^i[3456]86-apple-darwin.*$'],
+    ('Windows', 'AMD64'): [r'^x86_64-mingw32$', r'^i686-mingw32$'],
+    ('Windows', 'x86'): [r'^i686-mingw32$'],
+}
+
+
+class InstallError(Exception):
+    pass
+
+
+def version_key(version: str):
+    """Sort key for index versions; pre-releases sort below the release they precede"""
+    release, _, prerelease = (version or '').partition('-')
+    return tuple(int(n) for n in re.findall(r'\d+', release)), not prerelease, version or ''
+
+
+def split_spec(spec: str) -> Tuple[str, Optional[str]]:
+    """'arduino:avr@1.8.6' -> ('arduino:avr', '1.8.6'); the version is optional"""
+    name, _, version = spec.partition('@')
+    return name.strip(), version.strip() or None
+
+
+def host_patterns() -> List[str]:
+    return HOST_PATTERNS.get((platform.system(), platform.machine()), []) + [r'^all$']
+
+
+def parse_checksum(checksum: str) -> Tuple[str, str]:
+    algorithm, _, digest = checksum.partition(':')
+    if algorithm not in HASH_ALGORITHMS or not digest:
+        raise InstallError(f"Unsupported checksum {checksum}")
+    return HASH_ALGORITHMS[algorithm], digest.lower()
+
+
+class ArchiveCache:
+    """Downloaded archives stored by checksum, shared by every install
+
+    Archives are linked into arduino-cli's staging directory under the name the
+    CLI expects, so its own install step finds them and skips the download.
+    """
+
+    def __init__(self, root=DOWNLOAD_CACHE_DIR, staging=STAGING_DIR):
+        self.root = str(root)
+        self.staging = str(staging)
+
+    def path_for(self, checksum: str) -> str:
+        algorithm, digest = parse_checksum(checksum)
+        return os.path.join(self.root, algorithm, digest[:2], digest)
+
+    @staticmethod
+    def _hash_file(path: str, algorithm: str) -> str:
+        digest = hashlib.new(algorithm)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _link(source: str, target: str):
+        """Place source at target via a hard link, copying across filesystems"""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def fetch(self, item: Dict, progress: Callable[[int], None]) -> str:
+        """Make an item's archive available in the cache and staging; returns where it came from"""
+        algorithm, digest = parse_checksum(item["checksum"])
+        cached = self.path_for(item["checksum"])
+        staged = os.path.join(self.staging, item["staging_dir"], item["archive"])
+
+        if os.path.exists(cached):
+            source = "cache"
+        elif os.path.exists(staged) and self._hash_file(staged, algorithm) == digest:
+            # Left behind by an earlier arduino-cli download
+            self._link(staged, cached)
+            source = "staging"
+        else:
+            if not item.get("url"):
+                raise InstallError(f"{item['id']} is not cached and has no download URL")
+            self._download(item["url"], cached, algorithm, digest, progress)
+            source = "download"
+
+        if not os.path.exists(staged) or not os.path.samefile(staged, cached):
+            self._link(cached, staged)
+        return source
+
+    def _download(self, url: str, target: str, algorithm: str, expected: str, progress: Callable[[int], None]):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+        try:
+            digest = hashlib.new(algorithm)
+            received = 0
+            reported = 0
+            with os.fdopen(fd, 'wb') as out, urllib.request.urlopen(url, timeout=DOWNLOAD_TIMEOUT) as response:
+                for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+                    if received - reported >= PROGRESS_INTERVAL:
+                        reported = received
+                        progress(received)
+            if digest.hexdigest() != expected:
+                raise InstallError(f"Checksum mismatch for {url}")
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+class PackageIndexes:
+    """Slim views of the platform and library indexes, reloaded when the files change"""
+
+    def __init__(self, data_dir=ARDUINO_DATA_DIR, library_index_path=LIBRARY_INDEX_PATH):
+        self.data_dir = str(data_dir)
+        self.library_index_path = str(library_index_path)
+        self.platforms: Dict[str, Dict[str, Dict]] = {}
+        self.tools: Dict[str, Dict[str, Dict]] = {}
+        self.libraries: Dict[str, Dict[str, Dict]] = {}
+        self.package_stamp = None
+        self.library_stamp = None
+
+    @staticmethod
+    def _stamp(paths: List[str]):
+        stamp = []
+        for path in sorted(paths):
+            try:
+                st = os.stat(path)
+                stamp.append((path, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                pass
+        return stamp
+
+    def _load_packages(self, paths: List[str]):
+        platforms: Dict[str, Dict[str, Dict]] = {}
+        tools: Dict[str, Dict[str, Dict]] = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                index = json.load(f)
+            for package in index.get("packages", []):
+                for entry in package.get("platforms", []):
+                    key = f"{package['name']}:{entry['architecture']}"
+                    platforms.setdefault(key, {})[entry["version"]] = {
+                        "url": entry.get("url"),
+                        "archive": entry.get("archiveFileName"),
+                        "checksum": entry.get("checksum"),
+                        "size": int(entry.get("size") or 0),
+                        "tools": [
+                            dependency
+                            for field in ("toolsDependencies", "discoveryDependencies", "monitorDependencies")
+                            for dependency in entry.get(field) or []
+                        ]
+                    }
+                for entry in package.get("tools", []):
+                    key = f"{package['name']}:{entry['name']}"
+                    tools.setdefault(key, {})[entry["version"]] = {"systems": entry.get("systems", [])}
+        self.platforms, self.tools = platforms, tools
+
+    def _load_libraries(self):
+        with open(self.library_index_path, 'rb') as f:
+            index = json.load(f)
+        libraries: Dict[str, Dict[str, Dict]] = {}
+        for release in index.get("libraries", []):
+            libraries.setdefault(release["name"], {})[release["version"]] = {
+                "url": release.get("url"),
+                "archive": release.get("archiveFileName"),
+                "checksum": release.get("checksum"),
+                "size": int(release.get("size") or 0),
+                "dependencies": release.get("dependencies") or []
+            }
+        self.libraries = libraries
+
+    def refresh(self, need_packages: bool, need_libraries: bool):
+        if need_packages:
+            paths = glob.glob(os.path.join(self.data_dir, 'package_index*.json'))
+            stamp = self._stamp(paths)
+            if stamp != self.package_stamp:
+                self._load_packages(paths)
+                self.package_stamp = stamp
+        if need_libraries:
+            stamp = self._stamp([self.library_index_path])
+            if stamp != self.library_stamp:
+                if stamp:
+                    self._load_libraries()
+                self.library_stamp = stamp
+
+    @staticmethod
+    def _pick(versions: Dict[str, Dict], wanted: Optional[str]) -> Optional[str]:
+        """The wanted version, else the latest one
+
+        Library dependencies may carry constraints (^1.2.0, >=1.0) which resolve to
+        the latest release; an exact version that is not in the index resolves to None.
+        """
+        if not versions:
+            return None
+        if wanted in versions:
+            return wanted
+        if wanted and EXACT_VERSION.fullmatch(wanted):
+            return None
+        return max(versions, key=version_key)
+
+    def _tool_item(self, packager: str, name: str, version: Optional[str]) -> Dict:
+        key = f"{packager}:{name}"
+        version = self._pick(self.tools.get(key, {}), version)
+        if not version:
+            raise InstallError(f"Tool {key} is not in the package index")
+        systems = self.tools[key][version]["systems"]
+        for pattern in host_patterns():
+            for system in systems:
+                if re.match(pattern, system.get("host", "")):
+                    return {
+                        "kind": "tool", "id": f"{key}@{version}", "name": key, "version": version,
+                        "url": system.get("url"), "archive": system.get("archiveFileName"),
+                        "checksum": system.get("checksum"), "size": int(system.get("size") or 0),
+                        "staging_dir": "packages"
+                    }
+        raise InstallError(f"Tool {key}@{version} has no build for {platform.system()} {platform.machine()}")
+
+    def resolve(self, cores: List[str], libraries: List[str]) -> List[Dict]:
+        """Every archive needed for the requested cores and libraries, dependencies included"""
+        self.refresh(bool(cores), bool(libraries))
+        items: Dict[str, Dict] = {}
+
+        for spec in cores:
+            name, wanted = split_spec(spec)
+            version = self._pick(self.platforms.get(name, {}), wanted)
+            if not version:
+                raise InstallError(f"Core {spec} is not in the package index")
+            release = self.platforms[name][version]
+            items[f"{name}@{version}"] = {
+                "kind": "core", "id": f"{name}@{version}", "name": name, "version": version,
+                "url": release["url"], "archive": release["archive"], "checksum": release["checksum"],
+                "size": release["size"], "staging_dir": "packages"
+            }
+            for dependency in release["tools"]:
+                tool = self._tool_item(dependency["packager"], dependency["name"], dependency.get("version"))
+                items.setdefault(tool["id"], tool)
+
+        pending = [split_spec(spec) for spec in libraries]
+        seen = set()
+        while pending:
+            name, wanted = pending.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            version = self._pick(self.libraries.get(name, {}), wanted)
+            if not version:
+                raise InstallError(f"Library {name} is not in the library index")
+            release = self.libraries[name][version]
+            items[f"{name}@{version}"] = {
+                "kind": "library", "id": f"{name}@{version}", "name": name, "version": version,
+                "url": release["url"], "archive": release["archive"], "checksum": release["checksum"],
+                "size": release["size"], "staging_dir": "libraries"
+            }
+            pending.extend((dependency["name"], dependency.get("version")) for dependency in release["dependencies"])
+
+        return list(items.values())
+
+
+class BatchInstaller:
+    """Resolves, downloads in parallel and installs sets of cores and libraries"""
+
+    def __init__(self):
+        self.indexes = PackageIndexes()
+        self.cache = ArchiveCache()
+        # One batch at a time: arduino-cli installs share the data directory
+        self.lock = asyncio.Lock()
+
+    async def install(self, cores: List[str], libraries: List[str], dry_run: bool = False) -> AsyncIterator[Dict]:
+        """Yield progress events: resolved, download, install and finally done"""
+        async with self.lock:
+            try:
+                items = await asyncio.to_thread(self.indexes.resolve, cores, libraries)
+            except (InstallError, OSError, ValueError) as e:
+                yield {"type": "done", "success": False, "error": str(e)}
+                return
+            yield {
+                "type": "resolved",
+                "items": [{key: item[key] for key in ("kind", "id", "size")} for item in items]
+            }
+            if dry_run:
+                yield {"type": "done", "success": True}
+                return
+
+            events: asyncio.Queue = asyncio.Queue()
+            worker = asyncio.create_task(self._run(items, events))
+            try:
+                while True:
+                    event = await events.get()
+                    if event is None:
+                        break
+                    yield event
+                yield await worker
+            finally:
+                if not worker.done():
+                    worker.cancel()
+
+    async def _run(self, items: List[Dict], events: asyncio.Queue) -> Dict:
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(DOWNLOAD_CONCURRENCY)
+
+        async def fetch(item: Dict) -> bool:
+            async with slots:
+                def progress(received: int):
+                    loop.call_soon_threadsafe(events.put_nowait, {
+                        "type": "download", "id": item["id"], "status": "progress",
+                        "received": received, "size": item["size"]
+                    })
+                try:
+                    source = await asyncio.to_thread(self.cache.fetch, item, progress)
+                    await events.put({"type": "download", "id": item["id"], "status": "ready", "source": source})
+                    return True
+                except Exception as e:
+                    logger.error(f"Error fetching {item['id']}: {e}")
+                    await events.put({"type": "download", "id": item["id"], "status": "failed", "error": str(e)})
+                    return False
+
+        try:
+            fetched = await asyncio.gather(*(fetch(item) for item in items))
+            if not all(fetched):
+                return {"type": "done", "success": False, "error": "Some archives could not be downloaded"}
+
+            # Tools come with their core; cores install one at a time, libraries concurrently
+            failed = []
+            for item in items:
+                if item["kind"] == "core" and not await self._install_item(item, events):
+                    failed.append(item["id"])
+            library_slots = asyncio.Semaphore(LIBRARY_INSTALL_CONCURRENCY)
+
+            async def install_library(item: Dict):
+                async with library_slots:
+                    if not await self._install_item(item, events):
+                        failed.append(item["id"])
+
+            await asyncio.gather(*(install_library(item) for item in items if item["kind"] == "library"))
+            if any(item["kind"] == "library" for item in items):
+                library_index.invalidate_installed()
+            example_index.invalidate()
+            return {"type": "done", "success": not failed, "failed": failed}
+        finally:
+            await events.put(None)
+
+    async def _install_item(self, item: Dict, events: asyncio.Queue) -> bool:
+        if item["kind"] == "core":
+            command = ['arduino-cli', 'core', 'install', item["id"]]
+        else:
+            # Dependencies were resolved and fetched as items of their own
+            command = ['arduino-cli', 'lib', 'install', item["id"], '--no-deps']
+        await events.put({"type": "install", "id": item["id"], "status": "started"})
+        result = await asyncio.to_thread(run_arduino_cli, command)
+        if result['success']:
+            await events.put({"type": "install", "id": item["id"], "status": "installed"})
+        else:
+            await events.put({"type": "install", "id": item["id"], "status": "failed", "error": result['stderr']})
+        return result['success']
+
+
+batch_installer = BatchInstaller()
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from config.settings import BUILD_DISK_BYTES, BUILD_DISK_DIR, BUILD_RAM_BYTES, BUILD_RAM_DIR, TEMP_DIR
+from services.hub import hub
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Assumed size of a build tree until some have been measured
+DEFAULT_BUILD_BYTES = 32 * 1024 * 1024
+# Throwaway sketch directories go here on the RAM tier
+SCRATCH_NAME = "sketches"
+
+
+def tree_size(path: str) -> int:
+    """Bytes allocated to the files under path"""
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(directory, name))
+            except OSError:
+                continue
+            total += stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+    return total
+
+
+def build_key(sketch_path: str, fqbn: str) -> str:
+    """Build tree name for a sketch and board, stable so incremental builds reuse it"""
+    sketch_dir = os.path.dirname(os.path.realpath(sketch_path))
+    return hashlib.sha1(f"{sketch_dir}\0{fqbn}".encode()).hexdigest()[:20]
+
+
+def ram_root() -> Optional[str]:
+    """The tmpfs root, or None when there is none to use"""
+    if not BUILD_RAM_DIR or BUILD_RAM_BYTES <= 0:
+        return None
+    parent = os.path.dirname(BUILD_RAM_DIR.rstrip('/'))
+    if not os.path.isdir(parent) or not os.access(parent, os.W_OK):
+        return None
+    return BUILD_RAM_DIR
+
+
+class BuildTree:
+    def __init__(self, key: str, tier: str, path: str, size: int = 0, last_used: Optional[float] = None):
+        self.key = key
+        self.tier = tier
+        self.path = path
+        self.size = size
+        self.last_used = last_used or time.time()
+        # Held by one build or upload at a time, and while the tree is moved
+        self.lock = asyncio.Lock()
+        self.holder: Optional[int] = None
+        self.ticket: Optional[str] = None
+
+    def info(self) -> Dict:
+        return {
+            "key": self.key,
+            "tier": self.tier,
+            "path": self.path,
+            "size": self.size,
+            "last_used": self.last_used,
+            "in_use": self.lock.locked()
+        }
+
+
+class BuildRootManager:
+    """Build trees for arduino-cli's --build-path, run on the hub's owner
+
+    New trees go to the RAM tier while it has room for them, making room by
+    moving the least recently used idle trees to disk; when every tree in RAM
+    is busy the new one spills to disk. Trees are measured after each build,
+    and the least recently used idle trees on disk are removed past its budget.
+    """
+
+    def __init__(self, ram_dir: Optional[str] = None, ram_budget: int = BUILD_RAM_BYTES,
+                 disk_dir=BUILD_DISK_DIR, disk_budget: int = BUILD_DISK_BYTES):
+        self.roots = {"ram": ram_dir, "disk": str(disk_dir)}
+        self.budgets = {"ram": ram_budget if ram_dir else 0, "disk": disk_budget}
+        # Least recently used first
+        self.trees: OrderedDict = OrderedDict()
+        self.lock = asyncio.Lock()
+        self.evictions = {"moved": 0, "removed": 0}
+        # Ticket -> worker of those waiting for a tree, and the tickets given up before they got it
+        self.waiting: Dict[str, Optional[int]] = {}
+        self.abandoned: set = set()
+
+    def usage(self, tier: str) -> int:
+        return sum(tree.size for tree in self.trees.values() if tree.tier == tier)
+
+    def estimate(self) -> int:
+        sizes = [tree.size for tree in self.trees.values() if tree.size]
+        return sum(sizes) // len(sizes) if sizes else DEFAULT_BUILD_BYTES
+
+    async def load(self):
+        """Pick up the trees already on disk (and on tmpfs, if it survived a restart)"""
+        trees = []
+        for tier, root in self.roots.items():
+            if not root or not os.path.isdir(root):
+                continue
+            for entry in os.scandir(root):
+                if entry.is_dir() and entry.name != SCRATCH_NAME and entry.name not in self.trees:
+                    size = await asyncio.to_thread(tree_size, entry.path)
+                    trees.append(BuildTree(entry.name, tier, entry.path, size, entry.stat().st_mtime))
+        for tree in sorted(trees, key=lambda tree: tree.last_used):
+            self.trees[tree.key] = tree
+        if trees:
+            logger.info(f"Found {len(trees)} build trees")
+        await self._enforce()
+
+    async def acquire(self, key: str, create: bool = True, worker: Optional[int] = None,
+                      ticket: Optional[str] = None) -> Optional[Dict]:
+        """Hold a tree for a build or upload, creating it if asked to; None if there is none"""
+        tree = self.trees.get(key)
+        if tree is None:
+            if not create:
+                return None
+            async with self.lock:
+                tree = self.trees.get(key) or await self._create(key)
+        self.waiting[ticket] = worker
+        try:
+            await tree.lock.acquire()
+        except BaseException:
+            self.abandoned.discard(ticket)
+            raise
+        finally:
+            self.waiting.pop(ticket, None)
+        if self.trees.get(key) is not tree:
+            # Removed while waiting for it
+            tree.lock.release()
+            return await self.acquire(key, create, worker, ticket)
+        if ticket in self.abandoned or (worker is not None and not hub.connected(worker)):
+            # The build asking for it gave up, or its worker exited, while it waited
+            self.abandoned.discard(ticket)
+            tree.lock.release()
+            return None
+        tree.holder = worker
+        tree.ticket = ticket
+        tree.last_used = time.time()
+        self.trees.move_to_end(key)
+        try:
+            # Kept in the directory's mtime so the order survives a restart
+            os.utime(tree.path)
+        except OSError:
+            pass
+        return {"path": tree.path, "tier": tree.tier}
+
+    async def release(self, key: str, discard: bool = False, worker: Optional[int] = None,
+                      ticket: Optional[str] = None):
+        """Give back a tree, or stop waiting for it"""
+        tree = self.trees.get(key)
+        if tree is None or not tree.lock.locked() or tree.holder != worker or tree.ticket != ticket:
+            if ticket is not None and ticket in self.waiting:
+                self.abandoned.add(ticket)
+            return
+        if discard:
+            del self.trees[key]
+            await asyncio.to_thread(shutil.rmtree, tree.path, True)
+        else:
+            tree.size = await asyncio.to_thread(tree_size, tree.path)
+        tree.holder = None
+        tree.ticket = None
+        tree.lock.release()
+        if not discard:
+            async with self.lock:
+                await self._enforce()
+
+    async def wait(self, key: str):
+        """Return once no build holds a tree, without holding it"""
+        tree = self.trees.get(key)
+        if tree is not None and tree.lock.locked():
+            async with tree.lock:
+                pass
+
+    async def worker_lost(self, worker: int):
+        # Its waiting builds have failed with it, even if it reconnects under the same pid
+        for ticket, waiter in self.waiting.items():
+            if waiter == worker:
+                self.abandoned.add(ticket)
+        for tree in list(self.trees.values()):
+            if tree.holder == worker:
+                await self.release(tree.key, worker=worker, ticket=tree.ticket)
+
+    async def _create(self, key: str) -> BuildTree:
+        tier = "disk"
+        if self.roots["ram"]:
+            needed = self.estimate()
+            await self._make_room("ram", self.budgets["ram"] - needed)
+            if self.usage("ram") + needed <= self.budgets["ram"]:
+                tier = "ram"
+        path = os.path.join(self.roots[tier], key)
+        os.makedirs(path, exist_ok=True)
+        tree = BuildTree(key, tier, path)
+        self.trees[key] = tree
+        return tree
+
+    async def _enforce(self):
+        await self._make_room("ram", self.budgets["ram"])
+        await self._make_room("disk", self.budgets["disk"])
+
+    async def _make_room(self, tier: str, limit: int):
+        """Evict idle trees from a tier, least recently used first, until it is within limit"""
+        for tree in list(self.trees.values()):
+            if self.usage(tier) <= limit:
+                return
+            if tree.tier != tier or tree.lock.locked() or self.trees.get(tree.key) is not tree:
+                continue
+            async with tree.lock:
+                if tier == "ram":
+                    await self._move_to_disk(tree)
+                else:
+                    del self.trees[tree.key]
+                    await asyncio.to_thread(shutil.rmtree, tree.path, True)
+                    self.evictions["removed"] += 1
+
+    async def _move_to_disk(self, tree: BuildTree):
+        target = os.path.join(self.roots["disk"], tree.key)
+        try:
+            await asyncio.to_thread(shutil.rmtree, target, True)
+            os.makedirs(self.roots["disk"], exist_ok=True)
+            await asyncio.to_thread(shutil.move, tree.path, target)
+            tree.tier = "disk"
+            tree.path = target
+            self.evictions["moved"] += 1
+        except OSError as e:
+            logger.error(f"Error moving build tree {tree.key} to disk, removing it: {e}")
+            del self.trees[tree.key]
+            await asyncio.to_thread(shutil.rmtree, tree.path, True)
+            self.evictions["removed"] += 1
+
+    async def status(self) -> Dict:
+        tiers = {}
+        for tier, root in self.roots.items():
+            trees = [tree for tree in self.trees.values() if tree.tier == tier]
+            tiers[tier] = {
+                "path": root,
+                "budget": self.budgets[tier],
+                "used": sum(tree.size for tree in trees),
+                "trees": len(trees),
+                "in_use": sum(1 for tree in trees if tree.lock.locked())
+            }
+        return {
+            "tiers": tiers,
+            "evictions": dict(self.evictions),
+            "trees": [tree.info() for tree in reversed(self.trees.values())]
+        }
+
+    async def rejoined(self):
+        if hub.owner:
+            await self.load()
+
+
+build_root_manager = BuildRootManager(ram_root())
+
+registry.gauge(
+    'build_root_bytes', 'Bytes of build trees by tier, as measured after each build', ('tier',),
+    callback=lambda: {(tier,): build_root_manager.usage(tier) for tier in build_root_manager.roots}
+)
+
+hub.register("builds.acquire", build_root_manager.acquire)
+hub.register("builds.release", build_root_manager.release)
+hub.register("builds.wait", build_root_manager.wait)
+hub.register("builds.status", build_root_manager.status)
+hub.on_worker_lost(build_root_manager.worker_lost)
+hub.on_join(build_root_manager.rejoined)
+
+
+class BuildRoots:
+    """Build trees as used from any worker"""
+
+    @asynccontextmanager
+    async def tree(self, sketch_path: str, fqbn: str, keep: bool = True, create: bool = True,
+                   discard_on_error: bool = False):
+        """Path of the build tree for a sketch and board, held until the block exits
+
+        Trees that are not kept get a fresh key and are removed afterwards. With
+        create=False the path is None when the sketch has not been built. With
+        discard_on_error the tree is removed if the block raises, for builds
+        whose partial output must not be mistaken for an up-to-date one.
+        """
+        key = build_key(sketch_path, fqbn) if keep else uuid.uuid4().hex
+        ticket = uuid.uuid4().hex
+        try:
+            # As long as the build ahead takes: a timeout here would leave the tree granted to no one
+            tree = await hub.call("builds.acquire", timeout=None, key=key, create=create,
+                                  worker=hub.worker, ticket=ticket)
+        except asyncio.CancelledError:
+            hub.notify("builds.release", key=key, worker=hub.worker, ticket=ticket)
+            raise
+        discard = not keep
+        try:
+            yield tree["path"] if tree else None
+        except BaseException:
+            discard = discard or discard_on_error
+            raise
+        finally:
+            if tree:
+                await hub.call("builds.release", key=key, discard=discard, worker=hub.worker, ticket=ticket)
+
+    async def wait(self, sketch_path: str, fqbn: str):
+        """Wait for the build holding a sketch's tree, such as its warm-up, to finish"""
+        await hub.call("builds.wait", timeout=None, key=build_key(sketch_path, fqbn))
+
+    async def status(self) -> Dict:
+        return await hub.call("builds.status")
+
+    def scratch_dir(self) -> str:
+        """Where throwaway sketch directories go: the RAM tier when there is one"""
+        root = ram_root()
+        return os.path.join(root, SCRATCH_NAME) if root else TEMP_DIR
+
+
+build_roots = BuildRoots()
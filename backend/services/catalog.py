@@ -0,0 +1,131 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+from fastapi import Query, Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Bytes of NDJSON lines gathered before each write of a streamed catalog
+STREAM_CHUNK_BYTES = 64 * 1024
+_MISSING = object()
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[List[str]]]:
+    """'name,latest.version' -> [['name'], ['latest', 'version']]"""
+    if not fields:
+        return None
+    paths = [field.strip().split('.') for field in fields.split(',') if field.strip()]
+    return paths or None
+
+
+def _pick(value, path: List[str]):
+    """The part of value under path, keeping its shape; lists are projected item by item"""
+    if not path:
+        return value
+    if isinstance(value, list):
+        # Entries without the field stay as {} so positions line up when paths are merged
+        return [{} if picked is _MISSING else picked for picked in (_pick(item, path) for item in value)]
+    if not isinstance(value, dict) or path[0] not in value:
+        return _MISSING
+    picked = _pick(value[path[0]], path[1:])
+    return _MISSING if picked is _MISSING else {path[0]: picked}
+
+
+def _merge(into: Dict, part: Dict):
+    for key, value in part.items():
+        if isinstance(value, dict) and isinstance(into.get(key), dict):
+            _merge(into[key], value)
+        elif isinstance(value, list) and isinstance(into.get(key), list):
+            for existing, new in zip(into[key], value):
+                if isinstance(existing, dict) and isinstance(new, dict):
+                    _merge(existing, new)
+        else:
+            into[key] = value
+
+
+def project(item: Dict, paths: Optional[List[List[str]]]) -> Dict:
+    """Keep only the given (possibly nested) fields of a catalog entry"""
+    if paths is None or not isinstance(item, dict):
+        return item
+    projected: Dict = {}
+    for path in paths:
+        part = _pick(item, path)
+        if part is not _MISSING:
+            _merge(projected, part)
+    return projected
+
+
+class CatalogQuery:
+    """Projection, paging and format parameters shared by the catalog endpoints"""
+
+    def __init__(
+        self,
+        request: Request,
+        fields: Optional[str] = Query(None, description="Comma-separated fields to keep, dotted for nested ones (name,latest.version)"),
+        offset: int = Query(0, ge=0),
+        limit: Optional[int] = Query(None, ge=1),
+        format: Optional[str] = Query(None, pattern="^(json|ndjson)$", description="ndjson streams one entry per line"),
+    ):
+        self.fields = parse_fields(fields)
+        self.offset = offset
+        self.limit = limit
+        accept = request.headers.get("accept", "")
+        self.stream = format == "ndjson" or (format is None and NDJSON_MEDIA_TYPE in accept)
+
+    def page(self, items: List) -> List:
+        end = None if self.limit is None else self.offset + self.limit
+        return items[self.offset:end]
+
+
+def _ndjson_lines(items: List, paths) -> Iterator[bytes]:
+    chunk = []
+    size = 0
+    for item in items:
+        line = dumps(project(item, paths)) + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= STREAM_CHUNK_BYTES:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def catalog_response(items: List, key: str, query: CatalogQuery) -> Response:
+    """A page of catalog entries, projected, as one JSON document or as streamed NDJSON
+
+    The total before paging goes in X-Total-Count, and also in the JSON body.
+    """
+    total = len(items)
+    page = query.page(items)
+    headers = {"X-Total-Count": str(total)}
+    if query.stream:
+        return StreamingResponse(_ndjson_lines(page, query.fields), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+    body = {
+        "success": True,
+        key: [project(item, query.fields) for item in page],
+        "total": total,
+        "offset": query.offset,
+        "limit": query.limit
+    }
+    return Response(dumps(body), media_type="application/json", headers=headers)
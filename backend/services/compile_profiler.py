@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+import re
+import shlex
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from services.arduino_cli import cli_environment, record_cli_run, resolve_cli_command
+from services.metrics import registry
+from services.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Section headers arduino-cli prints in verbose mode, in build order
+PHASE_MARKERS = [
+    (re.compile(r'^Detecting libraries used'), 'detect_libraries'),
+    (re.compile(r'^Generating function prototypes'), 'prototypes'),
+    (re.compile(r'^Compiling sketch'), 'sketch'),
+    (re.compile(r'^Compiling librar(y|ies)'), 'libraries'),
+    (re.compile(r'^Compiling core'), 'core'),
+    (re.compile(r'^Linking everything together'), 'link'),
+]
+# Time before the first header: loading the platform, resolving the board and tools
+STARTUP_PHASE = 'startup'
+SOURCE_EXTENSIONS = {'.c', '.cc', '.cpp', '.cxx', '.s', '.S', '.ino'}
+CACHED_UNIT = re.compile(r'^Using previously compiled file: (.+)$')
+# Units kept per profile and across builds
+MAX_PROFILE_UNITS = 50
+MAX_AGGREGATE_UNITS = 1000
+VERBOSE_LINE_LIMIT = 1024 * 1024
+
+compile_phase_duration = registry.histogram(
+    'compile_phase_duration_seconds', 'Wall time of profiled compiles by phase', ('phase',)
+)
+
+
+def parse_compile_unit(line: str) -> Optional[str]:
+    """Source file of a compiler invocation line (`... -c src -o obj.o`), None for anything else"""
+    if ' -c ' not in line or ' -o ' not in line:
+        return None
+    try:
+        args = [arg.strip('"') for arg in shlex.split(line, posix=False)]
+    except ValueError:
+        return None
+    # -E runs are the preprocessor passes used for library detection
+    if '-c' not in args or '-o' not in args or '-E' in args:
+        return None
+    before_output = args[:args.index('-o')]
+    for arg in reversed(before_output):
+        if os.path.splitext(arg)[1] in SOURCE_EXTENSIONS:
+            return arg
+    return None
+
+
+class BuildProfiler:
+    """Attributes wall time to phases and translation units from timestamped verbose output
+
+    A unit's time runs from its compiler command line to the next command line or
+    phase header. With parallel jobs that is the gap between job starts, so unit
+    times are approximate while phase times are exact.
+    """
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phase = STARTUP_PHASE
+        self.phase_started = started
+        self.phases: Dict[str, float] = {}
+        self.unit: Optional[str] = None
+        self.unit_started = started
+        self.units: List[Dict] = []
+        self.cached_units = 0
+        self.finished = None
+
+    def _close_unit(self, now: float):
+        if self.unit:
+            self.units.append({"file": self.unit, "phase": self.phase, "duration": now - self.unit_started})
+            self.unit = None
+
+    def _enter_phase(self, phase: str, now: float):
+        self._close_unit(now)
+        self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.phase_started
+        self.phase = phase
+        self.phase_started = now
+
+    def feed(self, now: float, line: str):
+        line = line.strip()
+        for pattern, phase in PHASE_MARKERS:
+            if pattern.match(line):
+                self._enter_phase(phase, now)
+                return
+        if CACHED_UNIT.match(line):
+            self.cached_units += 1
+            return
+        source = parse_compile_unit(line)
+        if source:
+            self._close_unit(now)
+            self.unit = source
+            self.unit_started = now
+
+    def finish(self, now: float):
+        self._enter_phase(self.phase, now)
+        self.finished = now
+
+    def result(self) -> Dict:
+        slowest = sorted(self.units, key=lambda unit: unit["duration"], reverse=True)[:MAX_PROFILE_UNITS]
+        return {
+            "total": (self.finished or self.phase_started) - self.started,
+            "phases": self.phases,
+            "compiled_units": len(self.units),
+            "cached_units": self.cached_units,
+            "units": slowest
+        }
+
+
+class ProfileStats:
+    """Phase and unit timings aggregated over every profiled build"""
+
+    def __init__(self, max_units: int = MAX_AGGREGATE_UNITS):
+        self.builds = 0
+        self.phases: Dict[str, Dict[str, float]] = {}
+        # File -> {count, total, max}, least recently seen first
+        self.units: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self.max_units = max_units
+
+    def add(self, profile: Dict):
+        self.builds += 1
+        for phase, duration in profile["phases"].items():
+            stats = self.phases.setdefault(phase, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+        for unit in profile["units"]:
+            stats = self.units.pop(unit["file"], None) or {"count": 0, "total": 0.0, "max": 0.0}
+            stats["count"] += 1
+            stats["total"] += unit["duration"]
+            stats["max"] = max(stats["max"], unit["duration"])
+            self.units[unit["file"]] = stats
+            while len(self.units) > self.max_units:
+                self.units.popitem(last=False)
+
+    def summary(self, limit: int = 20) -> Dict:
+        slowest = sorted(self.units.items(), key=lambda item: item[1]["total"] / item[1]["count"], reverse=True)
+        return {
+            "builds": self.builds,
+            "phases": {
+                phase: {"mean": s["total"] / s["count"], "max": s["max"], "total": s["total"], "count": s["count"]}
+                for phase, s in self.phases.items()
+            },
+            "slowest_units": [
+                {"file": name, "mean": s["total"] / s["count"], "max": s["max"], "count": s["count"]}
+                for name, s in slowest[:limit]
+            ]
+        }
+
+
+profile_stats = ProfileStats()
+
+
+async def profile_compile(command: List[str]) -> Dict:
+    """Run a compile with -v and return run_arduino_cli's result plus a timing profile"""
+    if '-v' not in command and '--verbose' not in command:
+        command = command[:2] + ['-v'] + command[2:]
+    command = resolve_cli_command(command)
+    logger.info(f"Profiling command: {' '.join(command)}")
+
+    started = time.perf_counter()
+    profiler = BuildProfiler(started)
+    stdout: List[str] = []
+    stderr: List[str] = []
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=cli_environment(),
+            # Compiler command lines with many include paths outgrow the default 64KB line limit
+            limit=VERBOSE_LINE_LIMIT
+        )
+    except Exception as e:
+        logger.error(f"Exception running arduino-cli: {e}")
+        record_cli_run(command, 0.0, -1, error=str(e))
+        return {'success': False, 'stdout': '', 'stderr': str(e), 'returncode': -1, 'profile': None}
+
+    async def read_output():
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            text = line.decode(errors='replace')
+            profiler.feed(time.perf_counter(), text)
+            stdout.append(text)
+
+    async def read_errors():
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            stderr.append(line.decode(errors='replace'))
+
+    try:
+        await asyncio.gather(read_output(), read_errors())
+        returncode = await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+    profiler.finish(time.perf_counter())
+
+    output, errors = ''.join(stdout), ''.join(stderr)
+    record_cli_run(command, profiler.finished - started, returncode, output, errors)
+    profile = profiler.result()
+    if returncode == 0:
+        profile_stats.add(profile)
+        for phase, duration in profile["phases"].items():
+            compile_phase_duration.labels(phase).observe(duration)
+    telemetry.emit(
+        "compile_profile",
+        success=returncode == 0,
+        total=profile["total"],
+        phases=profile["phases"],
+        compiled_units=profile["compiled_units"],
+        cached_units=profile["cached_units"]
+    )
+    return {
+        'success': returncode == 0,
+        'stdout': output,
+        'stderr': errors,
+        'returncode': returncode,
+        'profile': profile
+    }
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+from typing import Dict
+
+from config.settings import DB_NAME, MONGO_RETRY_INTERVAL, MONGO_URL
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """MongoDB connection shared by the app and the services that persist data
+
+    The Motor client (and pymongo with it) is only imported and created on first
+    use, and connect() pings the server in the background, so the app starts and
+    serves whether or not MongoDB is reachable.
+    """
+
+    def __init__(self, url: str = MONGO_URL, name: str = DB_NAME, retry_interval: float = MONGO_RETRY_INTERVAL):
+        self.url = url
+        self.name = name
+        self.retry_interval = retry_interval
+        self._client = None
+        self.state = "idle"
+        self.error = None
+        self.since = time.time()
+        self.task = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            self._client = AsyncIOMotorClient(self.url)
+        return self._client
+
+    def collection(self, name: str):
+        return self.client[self.name][name]
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def _set_state(self, state: str, error: str = None):
+        if state != self.state:
+            self.since = time.time()
+        self.state = state
+        self.error = error
+
+    async def connect(self):
+        """Start checking reachability in the background; returns immediately"""
+        if not self.task:
+            self._set_state("connecting")
+            self.task = asyncio.create_task(self._connect_loop())
+
+    async def _connect_loop(self):
+        while True:
+            try:
+                await self.client.admin.command('ping')
+                self._set_state("ready")
+                logger.info("Connected to MongoDB")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.state != "unavailable":
+                    logger.error(f"MongoDB unavailable, retrying every {self.retry_interval:g}s: {e}")
+                self._set_state("unavailable", str(e))
+            await asyncio.sleep(self.retry_interval)
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        self._set_state("idle")
+
+    def status(self) -> Dict:
+        return {"state": self.state, "error": self.error, "since": self.since}
+
+
+class LazyCollection:
+    """A collection handle that resolves to the real Motor collection on first use"""
+
+    def __init__(self, database: Database, name: str):
+        self._database = database
+        self._name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = self._database.collection(self._name)
+        return getattr(self._collection, attr)
+
+
+class LazyDatabase:
+    """Hands out collections (db.sketch_revisions, db['x']) without creating the client"""
+
+    def __init__(self, database: Database):
+        self._database = database
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return LazyCollection(self._database, name)
+
+    def __getitem__(self, name):
+        return LazyCollection(self._database, name)
+
+
+database = Database()
+db = LazyDatabase(database)
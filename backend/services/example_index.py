@@ -0,0 +1,301 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.settings import EXAMPLE_INDEX_CACHE, EXAMPLES_SKETCH_DIR
+from services.arduino_cli import run_arduino_cli
+from services.file_store import atomic_write, file_store
+from services.hub import hub
+
+logger = logging.getLogger(__name__)
+
+# Hub channel telling every worker that installed libraries or cores changed
+EXAMPLES_CHANNEL = "examples"
+SKETCH_EXTENSIONS = ('.ino', '.pde', '.h', '.hh', '.hpp', '.c', '.cpp', '.S')
+DESCRIPTION_LENGTH = 300
+LEADING_COMMENT = re.compile(r'\s*(/\*.*?\*/|(?://[^\n]*\n\s*)+)', re.DOTALL)
+WORD = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+')
+# Score of a search term found in each field of an example
+FIELD_WEIGHTS = (("name", 4), ("library", 3), ("category", 2), ("description", 1), ("sentence", 1))
+# Fields of an example kept on the server: where it lives on disk
+PRIVATE_FIELDS = ("path",)
+
+
+def tokens(text: Optional[str]) -> List[str]:
+    """Lowercase search tokens: every word, camelCase parts included, and each whole word"""
+    found = []
+    for word in re.split(r'[^0-9A-Za-z]+', text or ''):
+        if word:
+            found.append(word.lower())
+            found.extend(part.lower() for part in WORD.findall(word))
+    return found
+
+
+def example_id(path: str) -> str:
+    return hashlib.sha1(path.encode()).hexdigest()[:16]
+
+
+def describe(path: str) -> str:
+    """The sketch's leading comment, which is where examples say what they do"""
+    try:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            head = f.read(4096)
+    except OSError:
+        return ''
+    match = LEADING_COMMENT.match(head)
+    if not match:
+        return ''
+    text = re.sub(r'^\s*(/\*+|\*+/?|//+)', '', match.group(1), flags=re.MULTILINE)
+    text = ' '.join(text.replace('*/', '').split())
+    return text[:DESCRIPTION_LENGTH]
+
+
+def public(example: Dict) -> Dict:
+    """An example as clients see it"""
+    return {key: value for key, value in example.items() if key not in PRIVATE_FIELDS}
+
+
+def sketch_files(directory: str) -> List[str]:
+    """Files of a sketch, relative to its directory: top-level sources and everything under src/"""
+    files = []
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.is_file() and entry.name.endswith(SKETCH_EXTENSIONS):
+            files.append(entry.name)
+    for root, dirs, names in os.walk(os.path.join(directory, 'src')):
+        dirs.sort()
+        for name in sorted(names):
+            files.append(os.path.relpath(os.path.join(root, name), directory))
+    return files
+
+
+def find_examples(examples_dir: str) -> Iterator[str]:
+    """Sketch directories under a library's examples/, at any depth"""
+    for root, dirs, names in os.walk(examples_dir):
+        dirs.sort()
+        name = os.path.basename(root)
+        if f"{name}.ino" in names or f"{name}.pde" in names:
+            dirs[:] = []
+            yield root
+
+
+class ExampleIndex:
+    """Searchable catalog of the examples shipped with installed libraries and cores
+
+    Built from `arduino-cli lib list --all`. Each library's examples are cached on
+    disk with a stamp of its directory, so after an install or removal only the
+    libraries whose stamp changed are scanned again.
+    """
+
+    def __init__(self, cache_path=EXAMPLE_INDEX_CACHE, sketch_dir=EXAMPLES_SKETCH_DIR):
+        self.cache_path = str(cache_path)
+        self.sketch_dir = str(sketch_dir)
+        # Library directory -> {"stamp", "examples"}
+        self.libraries: Dict[str, Dict] = {}
+        self.examples: Dict[str, Dict] = {}
+        # Token -> {example id: score}, with the tokens sorted for prefix lookups
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.sorted_tokens: List[str] = []
+        # Bumped by every invalidation; the index is current when loaded matches it
+        self.generation = 0
+        self.loaded = None
+        self.lock = asyncio.Lock()
+        self.listener = None
+
+    async def start(self):
+        self.listener = asyncio.create_task(self._listen(hub.subscribe(EXAMPLES_CHANNEL)))
+        asyncio.create_task(self._warm())
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+
+    async def _warm(self):
+        try:
+            await self.ensure_loaded()
+        except Exception as e:
+            logger.error(f"Error building example index: {e}")
+
+    async def _listen(self, queue: asyncio.Queue):
+        try:
+            while True:
+                await queue.get()
+                self.generation += 1
+        finally:
+            hub.unsubscribe(EXAMPLES_CHANNEL, queue)
+
+    def invalidate(self):
+        """Call after libraries or cores are installed or removed, on any worker"""
+        self.generation += 1
+        hub.publish(EXAMPLES_CHANNEL, {"type": "invalidate"})
+
+    async def ensure_loaded(self):
+        """Rescan whatever changed since the last load; cheap when nothing did"""
+        async with self.lock:
+            # An invalidation that arrives mid-load may have missed the scan, so load again
+            while self.loaded != self.generation:
+                generation = self.generation
+                await asyncio.to_thread(self._load)
+                self.loaded = generation
+
+    def _installed_libraries(self) -> List[Dict]:
+        result = run_arduino_cli(['arduino-cli', 'lib', 'list', '--all', '--format', 'json'])
+        if not result['success']:
+            raise RuntimeError(result['stderr'])
+        data = json.loads(result['stdout'] or '{}')
+        entries = data.get('installed_libraries', []) if isinstance(data, dict) else data
+        return [entry.get('library', entry) for entry in entries or []]
+
+    def _read_cache(self) -> Dict:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f).get("libraries", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _load(self):
+        cached = self.libraries or self._read_cache()
+        libraries = {}
+        scanned = 0
+        for library in self._installed_libraries():
+            directory = library.get('install_dir') or library.get('source_dir')
+            if not directory or not library.get('name'):
+                continue
+            stamp = self._stamp(library, directory)
+            entry = cached.get(directory)
+            if not entry or entry["stamp"] != stamp:
+                entry = {"stamp": stamp, "examples": self._scan(library, directory)}
+                scanned += 1
+            libraries[directory] = entry
+        changed = scanned or set(libraries) != set(cached)
+        self.libraries = libraries
+        self._build_search_index()
+        if changed:
+            logger.info(f"Indexed {len(self.examples)} examples, rescanned {scanned} libraries")
+            try:
+                atomic_write(self.cache_path, json.dumps({"libraries": libraries}).encode('utf-8'))
+            except OSError as e:
+                logger.error(f"Error caching example index: {e}")
+
+    def _stamp(self, library: Dict, directory: str) -> List:
+        stamp = [library.get('version')]
+        for path in (directory, os.path.join(directory, 'examples')):
+            try:
+                stamp.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamp.append(None)
+        return stamp
+
+    def _scan(self, library: Dict, directory: str) -> List[Dict]:
+        examples_dir = os.path.join(directory, 'examples')
+        paths = library.get('examples') or list(find_examples(examples_dir))
+        examples = []
+        for path in paths:
+            name = os.path.basename(path)
+            main = next((f"{name}{ext}" for ext in ('.ino', '.pde') if os.path.isfile(os.path.join(path, f"{name}{ext}"))), None)
+            if not main:
+                continue
+            category = os.path.relpath(os.path.dirname(path), examples_dir)
+            examples.append({
+                "id": example_id(path),
+                "name": name,
+                "library": library['name'],
+                "library_version": library.get('version'),
+                "location": library.get('location'),
+                "category": '' if category == '.' else category.replace(os.sep, '/'),
+                "sentence": library.get('sentence', ''),
+                "description": describe(os.path.join(path, main)),
+                "path": path,
+                "main": main,
+                "files": sketch_files(path)
+            })
+        return examples
+
+    def _build_search_index(self):
+        examples = {}
+        postings: Dict[str, Dict[str, int]] = {}
+        for entry in self.libraries.values():
+            for example in entry["examples"]:
+                examples[example["id"]] = example
+                for field, weight in FIELD_WEIGHTS:
+                    for token in tokens(example.get(field)):
+                        scores = postings.setdefault(token, {})
+                        scores[example["id"]] = max(scores.get(example["id"], 0), weight)
+        self.examples = examples
+        self.postings = postings
+        self.sorted_tokens = sorted(postings)
+
+    def _term_scores(self, term: str) -> Dict[str, int]:
+        """Best score per example of any token starting with term"""
+        scores: Dict[str, int] = {}
+        start = bisect.bisect_left(self.sorted_tokens, term)
+        for token in self.sorted_tokens[start:]:
+            if not token.startswith(term):
+                break
+            # Whole-token matches outrank prefix matches
+            bonus = 1 if token == term else 0
+            for example, score in self.postings[token].items():
+                scores[example] = max(scores.get(example, 0), score * 2 + bonus)
+        return scores
+
+    async def search(self, query: str = '', library: Optional[str] = None) -> List[Dict]:
+        """Examples matching every word of the query, best first; all of them without one"""
+        await self.ensure_loaded()
+        terms = [term for term in dict.fromkeys(re.split(r'[^0-9a-z]+', query.lower())) if term]
+        if terms:
+            ranked: Optional[Dict[str, int]] = None
+            for term in terms:
+                scores = self._term_scores(term)
+                if ranked is None:
+                    ranked = scores
+                else:
+                    ranked = {example: ranked[example] + score for example, score in scores.items() if example in ranked}
+                if not ranked:
+                    break
+            candidates = sorted(ranked or {}, key=lambda example: (-ranked[example], self.examples[example]["name"].lower()))
+        else:
+            candidates = sorted(self.examples, key=lambda example: (self.examples[example]["library"].lower(),
+                                                                    self.examples[example]["category"],
+                                                                    self.examples[example]["name"].lower()))
+        results = [self.examples[example] for example in candidates]
+        if library:
+            results = [example for example in results if example["library"] == library]
+        return results
+
+    async def get(self, example_id: str) -> Optional[Dict]:
+        await self.ensure_loaded()
+        return self.examples.get(example_id)
+
+    def read_files(self, example: Dict) -> List[Dict]:
+        """The example's files with their text, served from the file store's cache"""
+        files = []
+        for name in example["files"]:
+            try:
+                text, digest = file_store.read_text(os.path.join(example["path"], name))
+            except (OSError, UnicodeDecodeError):
+                continue
+            files.append({"name": name, "content": text, "hash": digest})
+        return files
+
+    def sketch_path(self, example: Dict) -> str:
+        """Where the example is opened: the same path every time, so its build tree is reused"""
+        return os.path.join(self.sketch_dir, example["id"], example["name"], example["main"])
+
+    def materialize(self, example: Dict) -> Tuple[str, List[Dict]]:
+        """Copy the example to its sketch path, only writing files that differ"""
+        sketch_dir = os.path.dirname(self.sketch_path(example))
+        files = self.read_files(example)
+        for entry in files:
+            target = os.path.join(sketch_dir, entry["name"])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            file_store.save(target, entry["content"])
+            entry["path"] = target
+        return self.sketch_path(example), files
+
+
+example_index = ExampleIndex()
@@ -0,0 +1,152 @@
+import bisect
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from services.metrics import cache_requests
+
+# Line numbers are indexed per block of this many bytes
+LINE_INDEX_BLOCK = 64 * 1024
+STREAM_CHUNK = 256 * 1024
+MAX_CACHED_INDEXES = 32
+# Largest number of lines returned by one window read
+MAX_LINE_WINDOW = 10000
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `Range: bytes=...` header into inclusive (start, end)
+
+    Returns None when the header is absent or asks for several ranges,
+    in which case the whole file is served.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        return None
+    first, _, last = spec.partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            length = int(last)
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    """Read [start, end] from a file in chunks without loading it whole"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class LineIndex:
+    """Number of lines before each fixed-size block of a file"""
+
+    def __init__(self, path: str, mtime_ns: int, size: int):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.block_lines: List[int] = []
+        self.total_lines = 0
+        self._build()
+
+    def _build(self):
+        lines = 0
+        last = b''
+        with open(self.path, 'rb') as f:
+            while True:
+                block = f.read(LINE_INDEX_BLOCK)
+                if not block:
+                    break
+                self.block_lines.append(lines)
+                lines += block.count(b'\n')
+                last = block[-1:]
+        # A final line without a trailing newline still counts
+        self.total_lines = lines + (1 if last and last != b'\n' else 0)
+
+    def read_lines(self, start: int, end: int) -> List[str]:
+        """Return lines start..end (0-based, end exclusive)"""
+        start = max(start, 0)
+        end = min(end, self.total_lines)
+        if start >= end or self.size == 0:
+            return []
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                position = 0
+                if start > 0:
+                    # Last block that begins before line `start`, then skip the remaining newlines
+                    block = bisect.bisect_left(self.block_lines, start) - 1
+                    position = block * LINE_INDEX_BLOCK
+                    for _ in range(start - self.block_lines[block]):
+                        position = mm.find(b'\n', position) + 1
+                lines = []
+                for _ in range(end - start):
+                    newline = mm.find(b'\n', position)
+                    stop = newline if newline != -1 else self.size
+                    lines.append(mm[position:stop].rstrip(b'\r').decode('utf-8', errors='replace'))
+                    if newline == -1:
+                        break
+                    position = newline + 1
+                return lines
+
+
+class LineIndexCache:
+    """Keeps line indexes of recently paged files while they are unchanged on disk"""
+
+    def __init__(self, max_entries: int = MAX_CACHED_INDEXES):
+        self.max_entries = max_entries
+        self.indexes: "OrderedDict[str, LineIndex]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> LineIndex:
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self.lock:
+            index = self.indexes.get(path)
+            if index and index.mtime_ns == st.st_mtime_ns and index.size == st.st_size:
+                self.indexes.move_to_end(path)
+                cache_requests.labels("line_index", "hit").inc()
+                return index
+        cache_requests.labels("line_index", "miss").inc()
+        index = LineIndex(path, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            self.indexes[path] = index
+            self.indexes.move_to_end(path)
+            while len(self.indexes) > self.max_entries:
+                self.indexes.popitem(last=False)
+        return index
+
+    def read_window(self, path: str, start: int, end: int) -> Dict:
+        index = self.get(path)
+        lines = index.read_lines(start, end)
+        return {
+            "lines": lines,
+            "start": start,
+            "end": start + len(lines),
+            "total_lines": index.total_lines
+        }
+
+
+line_indexes = LineIndexCache()
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import FILE_CACHE_BYTES
+from services.metrics import cache_requests
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """Hash used for change detection, ETags and compile cache keys"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    """Check an If-None-Match header against a content hash"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or f'"{digest}"' in tags or f'W/"{digest}"' in tags
+
+
+def file_lock_name(path: str) -> str:
+    """Name of the hub lock that serializes read-check-write updates of a file"""
+    return f"file:{os.path.abspath(path)}"
+
+
+def atomic_write(path: str, data: bytes):
+    """Write a file through a temporary sibling and rename it into place"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class PatchConflict(Exception):
+    """The client's base revision is not the file's current revision"""
+
+    def __init__(self, current_hash: Optional[str]):
+        super().__init__("File changed since the base revision")
+        self.current_hash = current_hash
+
+
+def apply_patches(text: str, patches: List[Dict]) -> str:
+    """Apply {start, end, text} edits in order, each against the result of the previous one
+
+    Offsets count UTF-16 code units, which is what JavaScript string indices use.
+    """
+    data = bytearray(text.encode('utf-16-le'))
+    for patch in patches:
+        start, end = patch['start'] * 2, patch['end'] * 2
+        if not 0 <= start <= end <= len(data):
+            raise ValueError(f"Patch range {patch['start']}..{patch['end']} is out of bounds")
+        data[start:end] = patch.get('text', '').encode('utf-16-le')
+    return data.decode('utf-16-le')
+
+
+class FileStore:
+    """Saves files atomically and remembers their content hashes"""
+
+    def __init__(self, cache_bytes: int = FILE_CACHE_BYTES):
+        # Path -> (mtime_ns, size, hash), valid while the file's stat matches
+        self.hashes: Dict[str, Tuple[int, int, str]] = {}
+        # Path -> (hash, text) of recently read or written files, least recently used first
+        self.contents: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.lock = threading.Lock()
+
+    def _cache_text(self, path: str, digest: str, text: str):
+        with self.lock:
+            old = self.contents.pop(path, None)
+            if old:
+                self.cached_bytes -= len(old[1])
+            if len(text) > self.cache_bytes:
+                return
+            self.contents[path] = (digest, text)
+            self.cached_bytes += len(text)
+            while self.cached_bytes > self.cache_bytes:
+                _, (_, evicted) = self.contents.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+
+    def _remember(self, path: str, digest: str):
+        st = os.stat(path)
+        with self.lock:
+            self.hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+
+    def current_hash(self, path: str) -> Optional[str]:
+        """Hash of a file on disk, only re-reading it if it changed since last time"""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        cached = self.hashes.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            cache_requests.labels("file_hash", "hit").inc()
+            return cached[2]
+        cache_requests.labels("file_hash", "miss").inc()
+        with open(path, 'rb') as f:
+            digest = content_hash(f.read())
+        with self.lock:
+            self.hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def read_text(self, path: str) -> Tuple[str, str]:
+        """Return (text, hash) of a file, served from memory while it is unchanged on disk"""
+        full_path = os.path.abspath(path)
+        digest = self.current_hash(full_path)
+        if digest is None:
+            raise FileNotFoundError(path)
+        cached = self.contents.get(full_path)
+        if cached and cached[0] == digest:
+            cache_requests.labels("file_text", "hit").inc()
+            with self.lock:
+                self.contents.move_to_end(full_path)
+            return cached[1], digest
+        cache_requests.labels("file_text", "miss").inc()
+        with open(full_path, 'rb') as f:
+            data = f.read()
+        text = data.decode('utf-8')
+        digest = content_hash(data)
+        self._cache_text(full_path, digest, text)
+        return text, digest
+
+    def patch(self, path: str, base_hash: str, patches: List[Dict]) -> Dict:
+        """Apply client edits made against base_hash and save the result"""
+        try:
+            text, digest = self.read_text(path)
+        except FileNotFoundError:
+            raise PatchConflict(None)
+        if digest != base_hash:
+            raise PatchConflict(digest)
+        return self.save(path, apply_patches(text, patches))
+
+    def save(self, path: str, content: str) -> Dict:
+        """Write content unless the file already holds it; returns its hash"""
+        full_path = os.path.abspath(path)
+        data = content.encode('utf-8')
+        digest = content_hash(data)
+        if self.current_hash(full_path) == digest:
+            self._cache_text(full_path, digest, content)
+            return {"path": path, "hash": digest, "changed": False}
+        atomic_write(full_path, data)
+        self._remember(full_path, digest)
+        self._cache_text(full_path, digest, content)
+        return {"path": path, "hash": digest, "changed": True}
+
+
+file_store = FileStore()
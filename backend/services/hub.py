@@ -0,0 +1,536 @@
+import asyncio
+import importlib
+import itertools
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from config.settings import HUB_SOCKET
+from services.metrics import subscriber_overflows
+
+logger = logging.getLogger(__name__)
+
+# Seconds between attempts to reach the hub or take it over
+RECONNECT_DELAY = 0.2
+# Seconds a call waits for the hub to answer, including any failover
+CALL_TIMEOUT = 30
+# Channel messages queued for one worker or one subscriber before the oldest
+# are dropped; replies to calls are never dropped
+QUEUE_SIZE = 1000
+# Longest message line the hub reads; asyncio's default of 64 KiB is smaller
+# than sketches, file contents and build outputs carried in calls and results
+LINE_LIMIT = 64 * 1024 * 1024
+
+
+class HubError(Exception):
+    pass
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _put(queue: asyncio.Queue, item, channel: str):
+    """Queue an item, dropping the oldest one if the reader has fallen behind"""
+    try:
+        queue.put_nowait(item)
+    except asyncio.QueueFull:
+        subscriber_overflows.labels(channel).inc()
+        queue.get_nowait()
+        queue.put_nowait(item)
+
+
+class Peer:
+    """A worker connected to this one's hub
+
+    Replies to its calls, which it may be waiting on without a timeout, go
+    ahead of channel messages and are never dropped; channel messages are
+    dropped oldest first when it falls behind.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.worker: Optional[int] = None
+        self.channels: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.replies: deque = deque()
+        self.ready = asyncio.Event()
+        self.task = asyncio.create_task(self._write())
+
+    def send(self, data: bytes, channel: str):
+        _put(self.queue, data, channel)
+        self.ready.set()
+
+    def reply(self, data: bytes):
+        self.replies.append(data)
+        self.ready.set()
+
+    async def _write(self):
+        try:
+            while True:
+                if self.replies:
+                    data = self.replies.popleft()
+                elif not self.queue.empty():
+                    data = self.queue.get_nowait()
+                else:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                self.writer.write(data)
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+class ChannelQueues:
+    """Live view of the queues a channel's messages wait in on this worker
+
+    Its own subscribers' queues and, on the owner, the outgoing queues of the
+    workers subscribed to the channel. Given to watch_subscribers for the lag metrics.
+    """
+
+    def __init__(self, hub: 'Hub', channel: str):
+        self.hub = hub
+        self.channel = channel
+
+    def _queues(self) -> List[asyncio.Queue]:
+        queues = list(self.hub.subscribers.get(self.channel, ()))
+        queues.extend(peer.queue for peer in list(self.hub.peers) if self.channel in peer.channels)
+        return queues
+
+    def __iter__(self):
+        return iter(self._queues())
+
+    def __len__(self) -> int:
+        return len(self._queues())
+
+    def __contains__(self, queue) -> bool:
+        return queue in self._queues()
+
+
+class NamedLocks:
+    """Locks held on the owner on behalf of any worker, freed when their worker is lost"""
+
+    def __init__(self, connected: Callable[[int], bool]):
+        self.connected = connected
+        self.locks: Dict[str, asyncio.Lock] = {}
+        # Name -> number of tokens holding or waiting for it, to drop unused locks
+        self.users: Dict[str, int] = {}
+        # Name -> (token, worker) of the holder
+        self.holders: Dict[str, tuple] = {}
+        # Token -> worker of those waiting for a lock, and the tokens given up before they got it
+        self.waiting: Dict[str, Optional[int]] = {}
+        self.abandoned: Set[str] = set()
+
+    async def acquire(self, name: str, token: str, worker: Optional[int] = None):
+        lock = self.locks.setdefault(name, asyncio.Lock())
+        self.users[name] = self.users.get(name, 0) + 1
+        self.waiting[token] = worker
+        try:
+            await lock.acquire()
+        except BaseException:
+            self._forget(name)
+            raise
+        finally:
+            self.waiting.pop(token, None)
+        self.holders[name] = (token, worker)
+        if token in self.abandoned or (worker is not None and not self.connected(worker)):
+            self.abandoned.discard(token)
+            await self.release(name, token)
+
+    async def release(self, name: str, token: str):
+        holder = self.holders.get(name)
+        if holder is None or holder[0] != token:
+            if token in self.waiting:
+                self.abandoned.add(token)
+            return
+        del self.holders[name]
+        self.locks[name].release()
+        self._forget(name)
+
+    def _forget(self, name: str):
+        self.users[name] -= 1
+        if not self.users[name]:
+            del self.users[name]
+            del self.locks[name]
+
+    async def worker_lost(self, worker: int):
+        # Its waiting callers have failed with it: a worker that reconnects under
+        # the same pid must not be granted locks no one there will release
+        for token, waiter in self.waiting.items():
+            if waiter == worker:
+                self.abandoned.add(token)
+        for name, (token, holder) in list(self.holders.items()):
+            if holder == worker:
+                await self.release(name, token)
+
+
+class Hub:
+    """Coordinates the workers serving the app over a Unix socket
+
+    The worker holding the lock next to HUB_SOCKET serves the socket and owns
+    what only one process can hold, like the open serial port; the others
+    connect to it. Any worker can call a method registered on the owner
+    (`call`, `notify`) and publish to subscribers on every worker (`publish`,
+    `subscribe`). When the owner exits its lock is released, and the first
+    worker to take it serves in its place.
+
+    Until started, with HUB_SOCKET empty or where Unix sockets are not
+    available, the hub runs in process and this worker owns everything.
+    """
+
+    def __init__(self, path: Optional[str] = HUB_SOCKET):
+        self.path = path if path and fcntl is not None and hasattr(socket, 'AF_UNIX') else None
+        self.worker = os.getpid()
+        self.owner = False
+        self.handlers: Dict[str, Callable[..., Awaitable]] = {}
+        # Method namespace -> module registering its handlers, imported on first call
+        self.providers: Dict[str, str] = {}
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.join_callbacks: List[Callable[[], Awaitable]] = []
+        self.worker_lost_callbacks: List[Callable[[int], Awaitable]] = []
+        self.locks = NamedLocks(self.connected)
+        self.register("hub.lock", self.locks.acquire)
+        self.register("hub.unlock", self.locks.release)
+        self.on_worker_lost(self.locks.worker_lost)
+        self.task = None
+        self.lock_file = None
+        # Owner side
+        self.server = None
+        self.peers: Set[Peer] = set()
+        # Client side
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.joined = asyncio.Event()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.ids = itertools.count()
+
+    @property
+    def local(self) -> bool:
+        """Calls and messages stay in this process"""
+        return self.owner or self.task is None
+
+    def register(self, method: str, handler: Callable[..., Awaitable]):
+        """Make a coroutine callable from every worker; it runs on the owner"""
+        self.handlers[method] = handler
+
+    def provide(self, namespace: str, module: str):
+        """Import module the first time a `namespace.*` method is called, so it registers them
+
+        Lets a worker answer other workers' calls without importing every
+        service at startup.
+        """
+        self.providers[namespace] = module
+
+    def on_join(self, callback: Callable[[], Awaitable]):
+        """Run callback each time this worker becomes the owner or (re)connects to one"""
+        self.join_callbacks.append(callback)
+
+    def on_worker_lost(self, callback: Callable[[int], Awaitable]):
+        """Run callback on the owner with the pid of each worker that disconnects"""
+        self.worker_lost_callbacks.append(callback)
+
+    async def start(self):
+        if self.task or self.owner:
+            return
+        if self.path is None:
+            await self._become_owner()
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.lock_file = open(self.path + '.lock', 'a')
+        if self._take_lock():
+            await self._serve()
+        else:
+            # Calls wait until this worker has reached the owner
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.server:
+            self.server.close()
+            for peer in list(self.peers):
+                peer.close()
+            self.peers.clear()
+            self.server = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        if self.lock_file:
+            self.lock_file.close()
+            self.lock_file = None
+        self.owner = False
+        self.joined.clear()
+
+    def connected(self, worker: int) -> bool:
+        """Whether a worker is this one or one connected to it"""
+        return worker == self.worker or any(peer.worker == worker for peer in self.peers)
+
+    def status(self) -> Dict:
+        if self.path is None:
+            mode = "local"
+        else:
+            mode = "owner" if self.owner else "client"
+        status = {"mode": mode, "worker": self.worker, "socket": self.path}
+        if self.owner:
+            status["workers"] = sorted(peer.worker for peer in self.peers if peer.worker)
+        else:
+            status["connected"] = self.joined.is_set()
+        return status
+
+    # Calls
+
+    async def call(self, method: str, timeout: Optional[float] = CALL_TIMEOUT, **params):
+        """Run a registered method on the owner and return its result
+
+        timeout=None waits as long as the method takes, for methods that wait
+        their turn for something.
+        """
+        if not self.local:
+            try:
+                await asyncio.wait_for(self.joined.wait(), CALL_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HubError("No hub to call")
+        if self.local:
+            return await self._handle(method, params)
+        call_id = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[call_id] = future
+        self.writer.write(_encode({"op": "call", "id": call_id, "method": method, "params": params}))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise HubError(f"{method} timed out")
+        finally:
+            self.pending.pop(call_id, None)
+
+    def notify(self, method: str, **params):
+        """Run a registered method on the owner without waiting; dropped while the owner is unreachable"""
+        if self.local:
+            asyncio.create_task(self._handle_logged(method, params))
+        elif self.joined.is_set():
+            self.writer.write(_encode({"op": "call", "id": None, "method": method, "params": params}))
+
+    async def _handle(self, method: str, params: Dict):
+        handler = self.handlers.get(method)
+        module = self.providers.get(method.split('.', 1)[0])
+        if handler is None and module is not None:
+            await asyncio.to_thread(importlib.import_module, module)
+            handler = self.handlers.get(method)
+        if handler is None:
+            raise HubError(f"Unknown hub method {method}")
+        return await handler(**params)
+
+    async def _handle_logged(self, method: str, params: Dict):
+        try:
+            await self._handle(method, params)
+        except Exception as e:
+            logger.error(f"Error handling {method}: {e}")
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        """Hold a lock shared by every worker until the block exits"""
+        token = uuid.uuid4().hex
+        try:
+            await self.call("hub.lock", timeout=None, name=name, token=token, worker=self.worker)
+        except asyncio.CancelledError:
+            self.notify("hub.unlock", name=name, token=token)
+            raise
+        try:
+            yield
+        finally:
+            self.notify("hub.unlock", name=name, token=token)
+
+    @asynccontextmanager
+    async def lock_all(self, names: Iterable[str]):
+        """Hold several shared locks, taken in sorted order so overlapping sets cannot deadlock"""
+        async with AsyncExitStack() as stack:
+            for name in sorted(set(names)):
+                await stack.enter_async_context(self.lock(name))
+            yield
+
+    # Messages
+
+    def subscribe(self, channel: str, maxsize: int = QUEUE_SIZE) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=maxsize)
+        subscribers = self.subscribers.setdefault(channel, set())
+        subscribers.add(queue)
+        if len(subscribers) == 1 and self.joined.is_set() and not self.owner:
+            self.writer.write(_encode({"op": "subscribe", "channel": channel}))
+        return queue
+
+    def channel_queues(self, channel: str) -> ChannelQueues:
+        return ChannelQueues(self, channel)
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        subscribers = self.subscribers.get(channel, set())
+        subscribers.discard(queue)
+        if not subscribers:
+            self.subscribers.pop(channel, None)
+            if self.joined.is_set() and not self.owner:
+                self.writer.write(_encode({"op": "unsubscribe", "channel": channel}))
+
+    def publish(self, channel: str, message):
+        """Deliver message to the channel's subscribers on every worker"""
+        if self.local:
+            self._fanout(channel, message)
+        elif self.joined.is_set():
+            self.writer.write(_encode({"op": "publish", "channel": channel, "message": message}))
+
+    def _deliver(self, channel: str, message):
+        for queue in self.subscribers.get(channel, ()):
+            _put(queue, message, channel)
+
+    def _fanout(self, channel: str, message):
+        self._deliver(channel, message)
+        data = None
+        for peer in self.peers:
+            if channel in peer.channels:
+                data = data or _encode({"op": "message", "channel": channel, "message": message})
+                peer.send(data, channel)
+
+    # Ownership and connection
+
+    def _take_lock(self) -> bool:
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    async def _run(self):
+        while True:
+            if self._take_lock():
+                await self._serve()
+                return
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+            except OSError:
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            await self._connected(reader, writer)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _serve(self):
+        try:
+            # The previous owner's socket may still be on disk
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self.server = await asyncio.start_unix_server(self._serve_peer, path=self.path, limit=LINE_LIMIT)
+        except OSError as e:
+            logger.error(f"Cannot serve the hub on {self.path}, running in process: {e}")
+        await self._become_owner()
+
+    async def _become_owner(self):
+        self.owner = True
+        self.joined.set()
+        logger.info(f"Worker {self.worker} owns the hub")
+        await self._run_join_callbacks()
+
+    async def _run_join_callbacks(self):
+        for callback in self.join_callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Error in hub join callback: {e}")
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = Peer(writer)
+        self.peers.add(peer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message["op"]
+                if op == "hello":
+                    peer.worker = message["worker"]
+                    peer.channels.update(message["channels"])
+                elif op == "subscribe":
+                    peer.channels.add(message["channel"])
+                elif op == "unsubscribe":
+                    peer.channels.discard(message["channel"])
+                elif op == "publish":
+                    self._fanout(message["channel"], message["message"])
+                elif op == "call":
+                    asyncio.create_task(self._answer(peer, message))
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Dropping hub connection from worker {peer.worker}: {e}")
+        finally:
+            self.peers.discard(peer)
+            peer.close()
+            if peer.worker is not None:
+                logger.info(f"Worker {peer.worker} left the hub")
+                for callback in self.worker_lost_callbacks:
+                    try:
+                        await callback(peer.worker)
+                    except Exception as e:
+                        logger.error(f"Error in hub worker lost callback: {e}")
+
+    async def _answer(self, peer: Peer, message: Dict):
+        try:
+            result = await self._handle(message["method"], message["params"])
+            reply = {"op": "result", "id": message["id"], "result": result}
+        except Exception as e:
+            if message["id"] is None:
+                logger.error(f"Error handling {message['method']}: {e}")
+                return
+            reply = {"op": "error", "id": message["id"], "error": str(e)}
+        if message["id"] is not None:
+            peer.reply(_encode(reply))
+
+    async def _connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.writer = writer
+        writer.write(_encode({"op": "hello", "worker": self.worker, "channels": list(self.subscribers)}))
+        self.joined.set()
+        logger.info(f"Worker {self.worker} joined the hub")
+        await self._run_join_callbacks()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                op = message["op"]
+                if op == "message":
+                    self._deliver(message["channel"], message["message"])
+                elif op in ("result", "error"):
+                    future = self.pending.get(message["id"])
+                    if future and not future.done():
+                        if op == "result":
+                            future.set_result(message["result"])
+                        else:
+                            future.set_exception(HubError(message["error"]))
+        except (ConnectionError, ValueError) as e:
+            logger.error(f"Lost the hub connection: {e}")
+        finally:
+            self.joined.clear()
+            self.writer = None
+            writer.close()
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(HubError("Lost the hub connection"))
+            self.pending.clear()
+
+
+hub = Hub()
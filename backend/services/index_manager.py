@@ -0,0 +1,310 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from config.settings import (
+    ARDUINO_DATA_DIR, INDEX_ACCEPT_UNVERIFIED, INDEX_KEYRING, INDEX_MIRROR_DIR, INDEX_REFRESH_INTERVAL, INDEX_STATE_PATH,
+    LIBRARY_INDEX_URL, PACKAGE_INDEX_URL
+)
+from services.batch_installer import batch_installer
+from services.file_store import atomic_write
+from services.hub import hub
+from services.library_resolver import library_index
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+FETCH_TIMEOUT = 60
+# Signature verdicts remembered, oldest forgotten first
+MAX_SIGNATURE_RESULTS = 64
+
+
+def index_sources() -> List[Dict]:
+    """Indexes kept fresh, by the file name arduino-cli reads them from"""
+    return [
+        {"name": "package_index.json", "url": PACKAGE_INDEX_URL},
+        {"name": "library_index.json", "url": LIBRARY_INDEX_URL},
+    ]
+
+
+def _file_hash(path: str) -> Optional[str]:
+    try:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def _unlink(path: Optional[str]):
+    if path:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class IndexManager:
+    """Refreshes the platform and library indexes in the background
+
+    Fetches are conditional (ETag / Last-Modified for URLs, mtime and size for a
+    mirror directory), signature checks are cached by content hash, and new files
+    are renamed into place and parsed before any request needs them.
+    """
+
+    def __init__(self, data_dir=ARDUINO_DATA_DIR, sources: Optional[List[Dict]] = None,
+                 mirror_dir: Optional[str] = INDEX_MIRROR_DIR, interval: float = INDEX_REFRESH_INTERVAL,
+                 keyring: Optional[str] = INDEX_KEYRING, state_path=INDEX_STATE_PATH,
+                 accept_unverified: bool = INDEX_ACCEPT_UNVERIFIED):
+        self.data_dir = str(data_dir)
+        self.sources = sources if sources is not None else index_sources()
+        self.mirror_dir = mirror_dir
+        self.interval = interval
+        self.keyring = keyring
+        self.accept_unverified = accept_unverified
+        self.state_path = str(state_path)
+        self.state = self._load_state()
+        self.lock = asyncio.Lock()
+        self.task = None
+        self.last_refresh = None
+        self.next_refresh = None
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        for key in ("http", "mirror", "signatures", "indexes"):
+            state.setdefault(key, {})
+        return state
+
+    def _save_state(self):
+        try:
+            atomic_write(self.state_path, json.dumps(self.state, indent=2).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Error saving index state: {e}")
+
+    async def start(self):
+        if not self.task and self.interval > 0:
+            self.task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                # With several workers only the hub's owner refreshes on schedule
+                if hub.owner:
+                    await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing indexes: {e}")
+            self.next_refresh = time.time() + self.interval
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self, force: bool = False) -> List[Dict]:
+        """Check every index once; returns what happened to each"""
+        async with self.lock:
+            results = []
+            for source in self.sources:
+                try:
+                    result = await asyncio.to_thread(self._refresh_source, source, force)
+                except Exception as e:
+                    logger.error(f"Error refreshing {source['name']}: {e}")
+                    result = {"name": source["name"], "status": "error", "error": str(e)}
+                self.state["indexes"].setdefault(source["name"], {}).update(
+                    checked=datetime.now(timezone.utc).isoformat(),
+                    last_status=result["status"],
+                    last_error=result.get("error")
+                )
+                results.append(result)
+            self._save_state()
+            self.last_refresh = time.time()
+
+            if any(result["status"] == "updated" for result in results):
+                await self._warm()
+            return results
+
+    async def _warm(self):
+        """Parse swapped-in indexes now so the next request finds them ready"""
+        try:
+            await asyncio.to_thread(batch_installer.indexes.refresh, True, True)
+            await library_index.ensure_loaded()
+        except Exception as e:
+            logger.error(f"Error loading refreshed indexes: {e}")
+
+    def _refresh_source(self, source: Dict, force: bool) -> Dict:
+        name = source["name"]
+        target = os.path.join(self.data_dir, name)
+        if self.mirror_dir:
+            fetched = self._fetch_mirror(name, force)
+        else:
+            fetched = self._fetch_url(source["url"], force)
+        if fetched is None:
+            return {"name": name, "status": "unchanged"}
+
+        data_path, signature_path, commit = fetched
+        try:
+            digest = _file_hash(data_path)
+            if digest == _file_hash(target):
+                commit()
+                return {"name": name, "status": "unchanged"}
+            verdict = self.verify(data_path, signature_path, digest)
+            if verdict != "valid" and not (self.accept_unverified and verdict in ("unsigned", "unverified")):
+                logger.warning(f"Keeping the current {name}: signature {verdict}")
+                return {"name": name, "status": "rejected", "signature": verdict}
+
+            os.replace(data_path, target)
+            data_path = None
+            if signature_path:
+                os.replace(signature_path, f"{target}.sig")
+                signature_path = None
+            commit()
+            self.state["indexes"].setdefault(name, {}).update(
+                updated=datetime.now(timezone.utc).isoformat(),
+                hash=digest,
+                signature=verdict
+            )
+            logger.info(f"Updated {name} (signature {verdict})")
+            return {"name": name, "status": "updated", "signature": verdict}
+        finally:
+            _unlink(data_path)
+            _unlink(signature_path)
+
+    def _temp_path(self, name: str) -> str:
+        fd, path = tempfile.mkstemp(dir=self.data_dir, prefix=f".{name}.", suffix='.tmp')
+        os.close(fd)
+        return path
+
+    def _fetch_mirror(self, name: str, force: bool):
+        source = os.path.join(self.mirror_dir, name)
+        st = os.stat(source)
+        stamp = [st.st_mtime_ns, st.st_size]
+        if not force and self.state["mirror"].get(name) == stamp:
+            return None
+        data_path = self._temp_path(name)
+        shutil.copyfile(source, data_path)
+        signature_path = None
+        if os.path.exists(f"{source}.sig"):
+            signature_path = self._temp_path(f"{name}.sig")
+            shutil.copyfile(f"{source}.sig", signature_path)
+
+        def commit():
+            self.state["mirror"][name] = stamp
+
+        return data_path, signature_path, commit
+
+    def _download(self, url: str, path: str, headers: Optional[Dict] = None):
+        request = urllib.request.Request(url, headers=headers or {})
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            stream = gzip.GzipFile(fileobj=response) if url.endswith('.gz') else response
+            with open(path, 'wb') as out:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+            return response.headers
+
+    def _fetch_url(self, url: str, force: bool):
+        validators = {} if force else self.state["http"].get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        name = os.path.basename(url)
+        data_path = self._temp_path(name)
+        try:
+            response_headers = self._download(url, data_path, headers)
+        except urllib.error.HTTPError as e:
+            _unlink(data_path)
+            if e.code == 304:
+                return None
+            raise
+        except BaseException:
+            _unlink(data_path)
+            raise
+
+        signature_url = (url[:-len('.gz')] if url.endswith('.gz') else url) + '.sig'
+        signature_path = self._temp_path(f"{name}.sig")
+        try:
+            self._download(signature_url, signature_path)
+        except urllib.error.HTTPError as e:
+            _unlink(signature_path)
+            signature_path = None
+            if e.code != 404:
+                _unlink(data_path)
+                raise
+        except BaseException:
+            _unlink(signature_path)
+            _unlink(data_path)
+            raise
+
+        def commit():
+            self.state["http"][url] = {
+                "etag": response_headers.get("ETag"),
+                "last_modified": response_headers.get("Last-Modified")
+            }
+
+        return data_path, signature_path, commit
+
+    def verify(self, data_path: str, signature_path: Optional[str], digest: str) -> str:
+        """'valid', 'invalid', 'unsigned' or 'unverified' (no keyring or gpg to check with)"""
+        if not signature_path:
+            return "unsigned"
+        key = f"{digest}:{_file_hash(signature_path)}"
+        cached = self.state["signatures"].get(key)
+        if cached:
+            return cached
+        gpg = shutil.which('gpg')
+        if not self.keyring or not gpg:
+            return "unverified"
+        result = subprocess.run(
+            [gpg, '--batch', '--no-default-keyring', '--keyring', self.keyring, '--verify', signature_path, data_path],
+            capture_output=True
+        )
+        verdict = "valid" if result.returncode == 0 else "invalid"
+        if verdict == "invalid":
+            logger.error(f"Signature check failed for {data_path}: {result.stderr.decode(errors='replace')}")
+        signatures = self.state["signatures"]
+        signatures[key] = verdict
+        for stale in list(signatures)[:-MAX_SIGNATURE_RESULTS]:
+            del signatures[stale]
+        return verdict
+
+    def status(self) -> Dict:
+        indexes = {}
+        for source in self.sources:
+            path = os.path.join(self.data_dir, source["name"])
+            try:
+                st = os.stat(path)
+                on_disk = {"size": st.st_size, "modified": datetime.fromtimestamp(st.st_mtime, timezone.utc).isoformat()}
+            except FileNotFoundError:
+                on_disk = None
+            indexes[source["name"]] = {"file": on_disk, **self.state["indexes"].get(source["name"], {})}
+        return {
+            "source": self.mirror_dir or "http",
+            "interval": self.interval,
+            "last_refresh": self.last_refresh,
+            "next_refresh": self.next_refresh,
+            "indexes": indexes
+        }
+
+
+index_manager = IndexManager()
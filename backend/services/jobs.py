@@ -0,0 +1,97 @@
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from services.hub import hub
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for status lookups after they end
+JOB_HISTORY = 200
+
+
+class JobRegistry:
+    """Compile and upload jobs of every worker
+
+    Each worker tracks its own running jobs and reports them to the hub's owner,
+    which keeps the table every worker reads. Jobs are reported again whenever
+    a worker (re)joins the hub, so a new owner learns about them after a failover.
+    """
+
+    def __init__(self, history: int = JOB_HISTORY):
+        self.history = history
+        # The owner's table of every worker's jobs, oldest first
+        self.jobs: OrderedDict = OrderedDict()
+        # This worker's running jobs
+        self.own: Dict[str, Dict] = {}
+
+    @asynccontextmanager
+    async def track(self, kind: str, **info):
+        """Report a job as running until the block exits; set job["success"] for the outcome"""
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "state": "running",
+            "worker": hub.worker,
+            "started": time.time(),
+            "finished": None,
+            "success": None,
+            **info
+        }
+        self.own[job["id"]] = job
+        hub.notify("jobs.update", job=dict(job))
+        try:
+            yield job
+        finally:
+            del self.own[job["id"]]
+            job["state"] = "succeeded" if job["success"] else "failed"
+            job["finished"] = time.time()
+            hub.notify("jobs.update", job=dict(job))
+
+    async def list(self, state: Optional[str] = None) -> List[Dict]:
+        return await hub.call("jobs.list", state=state)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await hub.call("jobs.get", job_id=job_id)
+
+    # Run on the owner
+
+    async def update(self, job: Dict):
+        self.jobs.pop(job["id"], None)
+        self.jobs[job["id"]] = job
+        finished = [job_id for job_id, entry in self.jobs.items() if entry["state"] != "running"]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    async def list_jobs(self, state: Optional[str] = None) -> List[Dict]:
+        jobs = [job for job in self.jobs.values() if state is None or job["state"] == state]
+        return sorted(jobs, key=lambda job: job["started"], reverse=True)
+
+    async def get_job(self, job_id: str) -> Optional[Dict]:
+        return self.jobs.get(job_id)
+
+    async def worker_lost(self, worker: int):
+        for job in self.jobs.values():
+            if job["worker"] == worker and job["state"] == "running":
+                job["state"] = "lost"
+                job["finished"] = time.time()
+
+    async def rejoined(self):
+        if hub.owner:
+            # Whatever an earlier owner reported is out of date; workers report again as they rejoin
+            self.jobs = OrderedDict((job["id"], dict(job)) for job in self.own.values())
+        else:
+            for job in self.own.values():
+                hub.notify("jobs.update", job=dict(job))
+
+
+job_registry = JobRegistry()
+
+hub.register("jobs.update", job_registry.update)
+hub.register("jobs.list", job_registry.list_jobs)
+hub.register("jobs.get", job_registry.get_job)
+hub.on_worker_lost(job_registry.worker_lost)
+hub.on_join(job_registry.rejoined)
@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Set
+
+from config.settings import LIBRARY_HEADER_CACHE, LIBRARY_INDEX_PATH, LIBRARY_INSTALL_CONCURRENCY
+from services.arduino_cli import run_arduino_cli
+from services.example_index import example_index
+from services.file_store import atomic_write
+from services.scheduler import RateLimited, scheduler
+
+logger = logging.getLogger(__name__)
+
+INCLUDE_PATTERN = re.compile(r'^[ \t]*#[ \t]*include[ \t]*[<"]([^>"\n]+)[>"]', re.MULTILINE)
+COMMENT_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/', re.DOTALL)
+HEADER_EXTENSIONS = ('.h', '.hh', '.hpp')
+# How gcc reports an include it cannot find
+MISSING_INCLUDE_PATTERN = re.compile(r'fatal error: ([^\s:]+): No such file or directory')
+# Candidate libraries reported per missing header
+MAX_CANDIDATES = 5
+
+
+def scan_includes(code: str) -> List[str]:
+    """Headers a source file includes, in order of first appearance"""
+    code = COMMENT_PATTERN.sub(lambda match: '\n' * match.group(0).count('\n'), code)
+    seen = []
+    for header in INCLUDE_PATTERN.findall(code):
+        header = header.strip()
+        if header not in seen:
+            seen.append(header)
+    return seen
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def rank_candidates(header: str, names: Iterable[str]) -> List[str]:
+    """Order providers of a header, preferring libraries named after it (Servo.h -> Servo)"""
+    stem = _normalize(os.path.splitext(os.path.basename(header))[0])
+
+    def key(name: str):
+        normalized = _normalize(name)
+        return (0 if normalized == stem else 1 if stem and stem in normalized else 2, len(name), name)
+
+    return sorted(set(names), key=key)
+
+
+def _headers_in(directory: Optional[str]) -> List[str]:
+    if not directory or not os.path.isdir(directory):
+        return []
+    return [entry for entry in os.listdir(directory) if entry.endswith(HEADER_EXTENSIONS)]
+
+
+class LibraryHeaderIndex:
+    """Maps header file names to the installed and installable libraries that provide them
+
+    The installable side comes from the CLI's library_index.json and is cached on
+    disk, keyed by the index file's mtime, so it is only rebuilt after an index update.
+    """
+
+    def __init__(self, index_path=LIBRARY_INDEX_PATH, cache_path=LIBRARY_HEADER_CACHE):
+        self.index_path = str(index_path)
+        self.cache_path = str(cache_path)
+        self.available: Dict[str, List[str]] = {}
+        self.available_stamp = None
+        self.installed: Dict[str, List[str]] = {}
+        self.installed_loaded = False
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self._warm())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def _warm(self):
+        try:
+            await self.ensure_loaded()
+        except Exception as e:
+            logger.error(f"Error building library header index: {e}")
+
+    def _index_stamp(self):
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _load_available(self, stamp) -> Dict[str, List[str]]:
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            if cached.get("stamp") == stamp:
+                return cached["headers"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        with open(self.index_path, 'rb') as f:
+            index = json.load(f)
+        providers: Dict[str, Set[str]] = {}
+        for release in index.get("libraries", []):
+            for header in release.get("providesIncludes") or []:
+                providers.setdefault(header, set()).add(release["name"])
+        headers = {header: rank_candidates(header, names) for header, names in providers.items()}
+        try:
+            atomic_write(self.cache_path, json.dumps({"stamp": stamp, "headers": headers}).encode('utf-8'))
+        except OSError as e:
+            logger.error(f"Error caching library header index: {e}")
+        return headers
+
+    def _load_installed(self):
+        result = run_arduino_cli(['arduino-cli', 'lib', 'list', '--all', '--format', 'json'])
+        if not result['success']:
+            raise RuntimeError(result['stderr'])
+        data = json.loads(result['stdout'] or '{}')
+        entries = data.get('installed_libraries', []) if isinstance(data, dict) else data
+        installed: Dict[str, List[str]] = {}
+        for entry in entries or []:
+            library = entry.get('library', entry)
+            name = library.get('name')
+            if not name:
+                continue
+            headers = library.get('provides_includes') or _headers_in(
+                library.get('source_dir') or library.get('install_dir')
+            )
+            for header in headers:
+                installed.setdefault(header, []).append(name)
+        return installed
+
+    async def ensure_loaded(self):
+        """Load whatever is missing or stale; cheap when nothing changed"""
+        async with self.lock:
+            stamp = self._index_stamp()
+            if stamp and stamp != self.available_stamp:
+                self.available = await asyncio.to_thread(self._load_available, stamp)
+                self.available_stamp = stamp
+            if not self.installed_loaded:
+                self.installed = await asyncio.to_thread(self._load_installed)
+                self.installed_loaded = True
+
+    def invalidate_installed(self):
+        """Call after libraries are installed or removed"""
+        self.installed_loaded = False
+
+    def resolve(self, includes: List[str], local_headers: Set[str] = frozenset()) -> Dict:
+        """Sort includes into satisfied, installable (with candidates) and unknown
+
+        Unknown headers are usually provided by the core or toolchain.
+        """
+        resolved = {}
+        missing = {}
+        unknown = []
+        for header in includes:
+            if header in local_headers or os.path.basename(header) in local_headers:
+                continue
+            if header in self.installed:
+                resolved[header] = self.installed[header][0]
+            elif header in self.available:
+                missing[header] = self.available[header][:MAX_CANDIDATES]
+            else:
+                unknown.append(header)
+        return {"includes": includes, "resolved": resolved, "missing": missing, "unknown": unknown}
+
+    async def install(self, libraries: List[str], user: str) -> Dict:
+        """Install libraries concurrently in one of the user's install slots
+
+        Returns the installed names and errors by name.
+        """
+        slots = asyncio.Semaphore(LIBRARY_INSTALL_CONCURRENCY)
+
+        async def install_one(name: str):
+            async with slots:
+                return name, await asyncio.to_thread(run_arduino_cli, ['arduino-cli', 'lib', 'install', name])
+
+        async with scheduler.slot("install", user):
+            results = await asyncio.gather(*(install_one(name) for name in libraries))
+        self.invalidate_installed()
+        example_index.invalidate()
+        return {
+            "installed": [name for name, result in results if result['success']],
+            "failed": {name: result['stderr'] for name, result in results if not result['success']}
+        }
+
+    async def check_sketch(self, code: str, sketch_dir: Optional[str] = None, install: bool = False,
+                           user: Optional[str] = None) -> Dict:
+        """Scan a sketch's includes and report, or install for user, the libraries it is missing"""
+        await self.ensure_loaded()
+        local_headers = set(_headers_in(sketch_dir))
+        report = self.resolve(scan_includes(code), local_headers)
+        if install and report["missing"]:
+            # One library per header: the best-ranked candidate
+            wanted = list(dict.fromkeys(candidates[0] for candidates in report["missing"].values()))
+            outcome = await self.install(wanted, user)
+            await self.ensure_loaded()
+            report = self.resolve(report["includes"], local_headers)
+            report.update(outcome)
+        return report
+
+
+library_index = LibraryHeaderIndex()
+
+
+async def compile_preflight(code: str, sketch_dir: Optional[str], install: bool, user: str) -> Optional[Dict]:
+    """Library check run before a compile; None when it cannot run, so the compile goes ahead"""
+    try:
+        return await library_index.check_sketch(code, sketch_dir, install=install, user=user)
+    except RateLimited:
+        raise
+    except Exception as e:
+        logger.error(f"Skipping library check: {e}")
+        return None
+
+
+def failed_includes(output: str) -> List[str]:
+    """Headers a failed build could not find, from the compiler's errors"""
+    return list(dict.fromkeys(MISSING_INCLUDE_PATTERN.findall(output)))
+
+
+def missing_libraries_message(report: Dict) -> str:
+    lines = ["Missing libraries:"]
+    for header, candidates in report["missing"].items():
+        if candidates:
+            lines.append(f"  {header}: install {' or '.join(candidates)}")
+        else:
+            lines.append(f"  {header}: no known library provides it")
+    for name, error in report.get("failed", {}).items():
+        lines.append(f"  {name} failed to install: {error.strip()}")
+    return '\n'.join(lines)
@@ -0,0 +1,304 @@
+import bisect
+import threading
+import time
+from typing import Callable, Collection, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond API calls up to long compiles
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        # Label lookups and updates also happen in worker threads running arduino-cli
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics report zero before their first update
+            self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child in sorted(self.children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}']
+
+
+class _Value:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        """callback, when given, is called at scrape time and returns {label values: value}"""
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def render(self) -> List[str]:
+        if self.callback:
+            for key, value in self.callback().items():
+                self.labels(*key).set(value)
+        return super().render()
+
+
+class _HistogramValue:
+    __slots__ = ('buckets', 'counts', 'sum', 'lock')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _render_child(self, key, child) -> List[str]:
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by router', ('router', 'method', 'status')
+)
+cli_spawns = registry.counter(
+    'arduino_cli_spawns_total', 'arduino-cli processes started by subcommand', ('subcommand', 'outcome')
+)
+cli_duration = registry.histogram(
+    'arduino_cli_duration_seconds', 'arduino-cli run time by subcommand', ('subcommand',)
+)
+compile_queue_depth = registry.gauge('compile_queue_depth', 'Compiles waiting for a free slot')
+compiles_running = registry.gauge('compiles_running', 'Compiles currently running')
+cache_requests = registry.counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit or miss)', ('cache', 'result')
+)
+serial_bytes = registry.counter(
+    'serial_bytes_total', 'Bytes moved through serial sessions', ('port', 'direction')
+)
+subscriber_overflows = registry.counter(
+    'websocket_subscriber_overflows_total', 'Events replaced by a resync because a subscriber fell behind', ('channel',)
+)
+
+# Channel name -> the live set of subscriber queues, inspected at scrape time
+_subscriber_channels: Dict[str, Collection] = {}
+
+
+def watch_subscribers(channel: str, subscribers: Collection):
+    """Report the backlog of a channel's subscriber queues as websocket_subscriber_lag_events"""
+    _subscriber_channels[channel] = subscribers
+
+
+def _subscriber_lag() -> Dict[Tuple[str, ...], float]:
+    return {
+        (channel,): max((queue.qsize() for queue in list(subscribers)), default=0)
+        for channel, subscribers in _subscriber_channels.items()
+    }
+
+
+registry.gauge(
+    'websocket_subscriber_lag_events', 'Largest number of undelivered events among a channel\'s subscribers',
+    ('channel',), callback=_subscriber_lag
+)
+registry.gauge(
+    'websocket_subscribers', 'Connected subscribers per channel', ('channel',),
+    callback=lambda: {(channel,): len(subscribers) for channel, subscribers in _subscriber_channels.items()}
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests, labelled by the router that handled them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_duration.labels(route_group(scope), scope['method'], status).observe(
+                time.perf_counter() - started
+            )
+
+
+def route_group(scope) -> str:
+    """First path segment after /api of the matched route, e.g. 'files'; bounded for unmatched paths"""
+    route = scope.get('route')
+    if route is None:
+        return 'unmatched'
+    parts = [part for part in getattr(route, 'path', '').split('/') if part]
+    if parts and parts[0] == 'api':
+        parts = parts[1:]
+    if not parts:
+        return 'root'
+    return parts[0] if not parts[0].startswith('{') else 'root'
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from config.settings import DISCOVERY_TOOLS, DISCOVERY_TOOLS_DIR
+from services.metrics import subscriber_overflows, watch_subscribers
+
+logger = logging.getLogger(__name__)
+
+# Give up on a garbled stream instead of buffering it forever
+MAX_BUFFER_SIZE = 1024 * 1024
+RESTART_DELAYS = [1, 2, 5, 10, 30]
+
+
+def find_discovery_tool(name: str) -> Optional[str]:
+    """Return the newest bundled executable of a pluggable discovery tool"""
+    tool_dir = DISCOVERY_TOOLS_DIR / name
+    if not tool_dir.is_dir():
+        return None
+    executable = f"{name}.exe" if os.name == 'nt' else name
+
+    def version_key(path: Path):
+        return [int(part) if part.isdigit() else part for part in path.name.replace('-', '.').split('.')]
+
+    for version_dir in sorted(tool_dir.iterdir(), key=version_key, reverse=True):
+        candidate = version_dir / executable
+        if candidate.is_file() and os.access(candidate, os.X_OK):
+            return str(candidate)
+    return None
+
+
+def port_key(port: Dict) -> str:
+    return f"{port.get('protocol', 'serial')}://{port.get('address', '')}"
+
+
+class DiscoveryProcess:
+    """Runs one discovery tool in START_SYNC mode and forwards its events"""
+
+    def __init__(self, name: str, path: str, discovery: 'PortDiscovery'):
+        self.name = name
+        self.path = path
+        self.discovery = discovery
+        self.process = None
+        self.task = None
+        # Set once the tool has acknowledged START_SYNC
+        self.synced = False
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self):
+        attempt = 0
+        while True:
+            try:
+                await self.run_once()
+                attempt = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Discovery tool {self.name} failed: {e}")
+            self.discovery.remove_all(self.name)
+            delay = RESTART_DELAYS[min(attempt, len(RESTART_DELAYS) - 1)]
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def run_once(self):
+        self.process = await asyncio.create_subprocess_exec(
+            self.path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            self.process.stdin.write(b'HELLO 1 "arduino-editor"\nSTART_SYNC\n')
+            await self.process.stdin.drain()
+            logger.info(f"Started discovery tool {self.name}")
+
+            decoder = json.JSONDecoder()
+            buffer = ''
+            while True:
+                chunk = await self.process.stdout.read(4096)
+                if not chunk:
+                    break
+                buffer += chunk.decode(errors='replace')
+                while True:
+                    buffer = buffer.lstrip()
+                    if not buffer:
+                        break
+                    try:
+                        message, end = decoder.raw_decode(buffer)
+                    except json.JSONDecodeError:
+                        if len(buffer) > MAX_BUFFER_SIZE:
+                            buffer = ''
+                        break
+                    buffer = buffer[end:]
+                    self.handle_message(message)
+        finally:
+            self.synced = False
+            if self.process.returncode is None:
+                try:
+                    self.process.stdin.write(b'QUIT\n')
+                    await asyncio.wait_for(self.process.wait(), timeout=1)
+                except (ConnectionError, asyncio.TimeoutError):
+                    self.process.kill()
+                    await self.process.wait()
+            logger.info(f"Discovery tool {self.name} exited")
+
+    def handle_message(self, message: Dict):
+        event_type = message.get('eventType')
+        if event_type == 'start_sync' and message.get('message') == 'OK':
+            self.synced = True
+        elif event_type == 'add' and message.get('port'):
+            self.discovery.add(self.name, message['port'])
+        elif event_type == 'remove' and message.get('port'):
+            self.discovery.remove(self.name, message['port'])
+        elif event_type == 'error' or message.get('error'):
+            logger.error(f"Discovery tool {self.name} error: {message.get('message')}")
+
+
+class PortDiscovery:
+    """Live table of detected ports kept up to date by the bundled discovery tools"""
+
+    def __init__(self):
+        self.ports: Dict[str, Dict] = {}
+        self.owners: Dict[str, str] = {}
+        self.processes: List[DiscoveryProcess] = []
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def running(self) -> bool:
+        return any(process.synced for process in self.processes)
+
+    async def start(self):
+        if self.processes:
+            return
+        for name in DISCOVERY_TOOLS:
+            path = find_discovery_tool(name)
+            if not path:
+                logger.info(f"Discovery tool {name} is not bundled, skipping")
+                continue
+            process = DiscoveryProcess(name, path, self)
+            process.start()
+            self.processes.append(process)
+
+    async def stop(self):
+        for process in self.processes:
+            await process.stop()
+        self.processes = []
+        self.ports.clear()
+        self.owners.clear()
+
+    def detected_ports(self) -> List[Dict]:
+        """Ports in the same shape as `arduino-cli board list --format json`"""
+        return [{"port": port} for port in self.ports.values()]
+
+    def add(self, owner: str, port: Dict):
+        key = port_key(port)
+        self.ports[key] = port
+        self.owners[key] = owner
+        self.publish({"type": "add", "port": port})
+
+    def remove(self, owner: str, port: Dict):
+        key = port_key(port)
+        removed = self.ports.pop(key, None)
+        self.owners.pop(key, None)
+        if removed:
+            self.publish({"type": "remove", "port": removed})
+
+    def remove_all(self, owner: str):
+        for key in [key for key, name in self.owners.items() if name == owner]:
+            self.remove(owner, self.ports[key])
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=100)
+        queue.put_nowait({"type": "snapshot", "ports": self.detected_ports()})
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: Dict):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber_overflows.labels("ports").inc()
+                # A slow subscriber gets a fresh snapshot instead of a backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "snapshot", "ports": self.detected_ports()})
+
+
+discovery = PortDiscovery()
+watch_subscribers("ports", discovery.subscribers)
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from config.settings import PREWARM_CONCURRENCY, PREWARM_NICE
+from services.arduino_cli import cli_environment, record_cli_run, resolve_cli_command
+from services.build_roots import build_key, build_roots
+from services.hub import hub
+from services.jobs import job_registry
+from services.scheduler import scheduler
+from services.telemetry import PhaseTimer
+
+logger = logging.getLogger(__name__)
+
+# Hub channel on which real compiles tell warm-ups on every worker to stop
+PREWARM_CHANNEL = "prewarm"
+
+
+class WarmupCancelled(Exception):
+    pass
+
+
+def low_priority(command: List[str]) -> List[str]:
+    """Prefix a command with ionice's idle class and nice, where those tools exist"""
+    prefix = []
+    ionice = shutil.which('ionice')
+    if ionice:
+        prefix += [ionice, '-c', '3']
+    nice = shutil.which('nice')
+    if nice:
+        prefix += [nice, '-n', str(PREWARM_NICE)]
+    return prefix + command
+
+
+async def raise_priority(pid: int) -> bool:
+    """Give a build's process group normal CPU and I/O priority; False where that is not permitted"""
+    if not hasattr(os, 'setpriority'):
+        return False
+    try:
+        os.setpriority(os.PRIO_PGRP, pid, 0)
+    except OSError:
+        # Lowering niceness usually needs CAP_SYS_NICE
+        return False
+    ionice = shutil.which('ionice')
+    if ionice:
+        process = await asyncio.create_subprocess_exec(
+            ionice, '-c', '2', '-P', str(pid),
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        await process.wait()
+    return True
+
+
+def _kill(process: asyncio.subprocess.Process):
+    """Kill the build with the compilers it started"""
+    try:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_until_stopped(command: List[str], stop: asyncio.Event, boost: Optional[asyncio.Event] = None) -> Dict:
+    """Run arduino-cli at low priority, killing it if stop is set first
+
+    Once boost is set the build runs at normal priority, as a real compile
+    waits for it; where its priority cannot be raised it is stopped instead.
+    """
+    boost = boost or asyncio.Event()
+    resolved = resolve_cli_command(command)
+    logger.info(f"Warming up: {' '.join(resolved)}")
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *(resolved if boost.is_set() else low_priority(resolved)),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=cli_environment(),
+        # Its own process group, so the compilers it runs are killed with it
+        start_new_session=os.name != 'nt',
+        creationflags=0 if boost.is_set() else getattr(subprocess, 'IDLE_PRIORITY_CLASS', 0)
+    )
+    output = asyncio.ensure_future(process.communicate())
+    stopped = asyncio.ensure_future(stop.wait())
+    boosted = None if boost.is_set() else asyncio.ensure_future(boost.wait())
+    try:
+        while not output.done() and not stopped.done():
+            await asyncio.wait({output, stopped, boosted} - {None}, return_when=asyncio.FIRST_COMPLETED)
+            if boosted is not None and boosted.done():
+                boosted = None
+                if os.name == 'nt' or not await raise_priority(process.pid):
+                    stop.set()
+    except asyncio.CancelledError:
+        _kill(process)
+        raise
+    finally:
+        stopped.cancel()
+        if boosted is not None:
+            boosted.cancel()
+    if not output.done():
+        _kill(process)
+        await output
+        raise WarmupCancelled()
+    stdout, stderr = (data.decode('utf-8', errors='replace') for data in output.result())
+    record_cli_run(resolved, time.perf_counter() - started, process.returncode, stdout, stderr)
+    return {"success": process.returncode == 0, "stdout": stdout, "stderr": stderr, "returncode": process.returncode}
+
+
+class Warmup:
+    def __init__(self, sketch_path: str, fqbn: str, timer: PhaseTimer):
+        self.sketch_path = sketch_path
+        self.fqbn = fqbn
+        # Its build tree, which a compile of the same sketch and board waits for rather than stops
+        self.key = build_key(sketch_path, fqbn)
+        self.timer = timer
+        self.stop = asyncio.Event()
+        # Set when a real compile waits for this warm-up's tree
+        self.boost = asyncio.Event()
+        self.task = None
+
+
+class Prewarmer:
+    """Background builds that fill a sketch's build tree for a board before it is verified
+
+    A warm-up compiles the sketch into the tree its real compiles use, which
+    builds the core and every library the sketch includes; Verify then only
+    recompiles the sketch. Warm-ups run at the lowest CPU and I/O priority,
+    outside the scheduler's slots, and stop as soon as a real compile of
+    another sketch or board starts on any worker, removing the tree they left
+    half built. A compile of the warm-up's own sketch and board waits for it
+    instead, before taking a compile slot, and reuses its tree; the warm-up is
+    raised to normal priority meanwhile, or stopped where it cannot be.
+    Sketches whose tree already exists are warm and are skipped.
+    """
+
+    def __init__(self, concurrency: int = PREWARM_CONCURRENCY):
+        self.concurrency = concurrency
+        # User -> their warm-up on this worker
+        self.warmups: Dict[str, Warmup] = {}
+        self.listener = None
+
+    async def start(self):
+        self.listener = asyncio.create_task(self._listen(hub.subscribe(PREWARM_CHANNEL)))
+
+    async def stop(self):
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+        tasks = [warmup.task for warmup in self.warmups.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _listen(self, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                self.cancel_all(message.get("key"))
+        finally:
+            hub.unsubscribe(PREWARM_CHANNEL, queue)
+
+    def cancel_all(self, keep: Optional[str] = None):
+        """Stop every warm-up but the one building the tree keep, which a compile now waits for"""
+        for warmup in self.warmups.values():
+            if warmup.key == keep:
+                warmup.boost.set()
+            else:
+                warmup.stop.set()
+
+    def yield_cpu(self, key: Optional[str] = None):
+        """Call when a real compile starts, on any worker, with the key of the tree it builds"""
+        if self.warmups:
+            self.cancel_all(key)
+        hub.publish(PREWARM_CHANNEL, {"type": "cancel", "key": key})
+
+    async def warm(self, user: str, sketch_path: str, fqbn: str, timer: PhaseTimer) -> Dict:
+        """Start warming a sketch for a board, replacing the user's previous warm-up"""
+        previous = self.warmups.get(user)
+        if previous:
+            previous.stop.set()
+        if sum(1 for other, warmup in self.warmups.items() if other != user) >= self.concurrency:
+            return {"started": False, "reason": "Other warm-ups are running"}
+        pools = await scheduler.status()
+        if pools["compile"]["running"] or pools["compile"]["waiting"]:
+            return {"started": False, "reason": "Compiles are running"}
+        warmup = Warmup(sketch_path, fqbn, timer)
+        warmup.task = asyncio.create_task(self._run(user, warmup, previous))
+        self.warmups[user] = warmup
+        return {"started": True}
+
+    async def _run(self, user: str, warmup: Warmup, previous=None):
+        try:
+            if previous:
+                await asyncio.gather(previous.task, return_exceptions=True)
+            if warmup.stop.is_set():
+                return
+            async with build_roots.tree(warmup.sketch_path, warmup.fqbn, create=False) as existing:
+                if existing:
+                    warmup.timer.emit(success=True, warm=True)
+                    return
+            await self._build(warmup)
+        except Exception as e:
+            logger.error(f"Error warming up {warmup.sketch_path} for {warmup.fqbn}: {e}")
+        finally:
+            if self.warmups.get(user) is warmup:
+                del self.warmups[user]
+
+    async def _build(self, warmup: Warmup):
+        async with job_registry.track("prewarm", board=warmup.fqbn, sketch_path=warmup.sketch_path) as job:
+            try:
+                async with build_roots.tree(warmup.sketch_path, warmup.fqbn, discard_on_error=True) as build_path:
+                    if warmup.stop.is_set():
+                        raise WarmupCancelled()
+                    with warmup.timer.phase("compile"):
+                        command = [
+                            'arduino-cli', 'compile',
+                            '--fqbn', warmup.fqbn,
+                            '--build-path', build_path,
+                            warmup.sketch_path
+                        ]
+                        result = await run_until_stopped(command, warmup.stop, warmup.boost)
+                        if not result["success"]:
+                            # Its objects are of no use to the next build
+                            raise WarmupCancelled()
+            except WarmupCancelled:
+                job["cancelled"] = warmup.stop.is_set()
+                warmup.timer.emit(success=False, cancelled=job["cancelled"])
+                return
+            job["success"] = True
+        warmup.timer.emit(success=True, returncode=result["returncode"])
+
+
+prewarmer = Prewarmer()
@@ -0,0 +1,68 @@
+import importlib
+import logging
+import time
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Paths that describe every route, so all routers are loaded before serving them
+SCHEMA_PATHS = ('/docs', '/redoc', '/openapi.json')
+
+
+class RouterLoader:
+    """Includes API routers the first time a request reaches their prefix
+
+    `routers` maps the first path segment after the prefix (e.g. 'boards') to the
+    module defining `router`, so a router and everything it imports is only loaded
+    once something uses it. Routers are included in the order they are loaded, so
+    their prefixes must not overlap.
+    """
+
+    def __init__(self, app, routers: Dict[str, str], prefix: str = "/api"):
+        self.app = app
+        self.prefix = prefix
+        self.pending = dict(routers)
+        self.loaded: List[Dict] = []
+
+    def load(self, name: str):
+        module_name = self.pending.get(name)
+        if module_name is None:
+            return
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        self.app.include_router(module.router, prefix=self.prefix)
+        # Rebuild the OpenAPI schema with the new routes next time it is asked for
+        self.app.openapi_schema = None
+        # A module can serve several segments; it is included once for all of them
+        names = [other for other, target in self.pending.items() if target == module_name]
+        for other in names:
+            del self.pending[other]
+        elapsed = time.perf_counter() - started
+        self.loaded.append({"routers": names, "module": module_name, "seconds": elapsed})
+        logger.info(f"Loaded {module_name} in {elapsed * 1000:.1f} ms")
+
+    def load_all(self):
+        for name in list(self.pending):
+            self.load(name)
+
+    def load_for(self, path: str):
+        if path in SCHEMA_PATHS:
+            self.load_all()
+        elif path.startswith(self.prefix + '/'):
+            self.load(path[len(self.prefix) + 1:].split('/', 1)[0])
+
+    def status(self) -> Dict:
+        return {"loaded": self.loaded, "pending": sorted(self.pending)}
+
+
+class LazyRouterMiddleware:
+    """Pure ASGI middleware loading the router a request needs before it is routed"""
+
+    def __init__(self, app, loader: RouterLoader):
+        self.app = app
+        self.loader = loader
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and self.loader.pending:
+            self.loader.load_for(scope["path"])
+        await self.app(scope, receive, send)
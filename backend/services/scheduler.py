@@ -0,0 +1,341 @@
+import asyncio
+import ipaddress
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import Request
+
+try:
+    import jwt
+except ImportError:
+    jwt = None
+
+from config.settings import (
+    COMPILE_CONCURRENCY, COMPILE_USER_BURST, COMPILE_USER_CONCURRENCY, COMPILE_USER_QUEUE, COMPILE_USER_RATE,
+    INSTALL_CONCURRENCY, INSTALL_USER_BURST, INSTALL_USER_CONCURRENCY, INSTALL_USER_QUEUE, INSTALL_USER_RATE,
+    SESSION_COOKIE, SUPABASE_JWT_SECRET, TRUSTED_PROXIES
+)
+from services.hub import HubError, hub
+from services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Limits of each kind of heavy operation; concurrency is shared by every user,
+# the rest applies to each user on their own
+POOLS = {
+    "compile": {
+        "concurrency": COMPILE_CONCURRENCY,
+        "per_user": COMPILE_USER_CONCURRENCY,
+        "rate": COMPILE_USER_RATE,
+        "burst": COMPILE_USER_BURST,
+        "queue": COMPILE_USER_QUEUE
+    },
+    "install": {
+        "concurrency": INSTALL_CONCURRENCY,
+        "per_user": INSTALL_USER_CONCURRENCY,
+        "rate": INSTALL_USER_RATE,
+        "burst": INSTALL_USER_BURST,
+        "queue": INSTALL_USER_QUEUE
+    }
+}
+# Seconds an operation is assumed to take until some have finished
+DEFAULT_HOLD_SECONDS = 5.0
+
+scheduler_rejections = registry.counter(
+    'scheduler_rejections_total', 'Operations refused with 429 by pool and reason (rate or queue)', ('pool', 'reason')
+)
+
+
+class RateLimited(Exception):
+    """Answered with 429 and a Retry-After header"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in TRUSTED_PROXIES]
+
+
+def _trusted(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_address(request: Request) -> str:
+    """The client's address, read through X-Forwarded-For when it comes from trusted proxies"""
+    address = request.client.host if request.client else 'unknown'
+    if not _trusted(address):
+        return address
+    # Proxies append the address they received from: the last untrusted hop is the client
+    hops = [hop.strip() for hop in request.headers.get('x-forwarded-for', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            return hop
+    return hops[0] if hops else address
+
+
+def client_identity(request: Request) -> str:
+    """Who a request is from: its verified Supabase user, else its session cookie if enabled, else its address
+
+    Without a token secret or session cookie, clients sharing an address (a
+    classroom NAT, an untrusted proxy) are one user to the scheduler.
+    """
+    authorization = request.headers.get('authorization', '')
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() == 'bearer' and token and SUPABASE_JWT_SECRET and jwt is not None:
+        try:
+            claims = jwt.decode(token, SUPABASE_JWT_SECRET, algorithms=['HS256'], options={"verify_aud": False})
+            if claims.get('sub'):
+                return f"user:{claims['sub']}"
+        except jwt.InvalidTokenError:
+            pass
+    if SESSION_COOKIE and request.cookies.get(SESSION_COOKIE):
+        return f"session:{request.cookies[SESSION_COOKIE]}"
+    return f"ip:{client_address(request)}"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Take a token: 0 if there was one, else seconds until there will be"""
+        if self.rate <= 0:
+            return 0
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def full(self) -> bool:
+        self._refill()
+        return self.rate <= 0 or self.tokens >= self.burst
+
+
+class UserQueue:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # Ticket -> future resolved when it may run, oldest first
+        self.waiting: OrderedDict = OrderedDict()
+        # Ticket -> when it started running
+        self.running: Dict[str, float] = {}
+
+
+class Pool:
+    """Slots for one kind of operation, handed out to users in turn
+
+    Users with operations waiting take turns: each turn grants the next user's
+    oldest operation, skipping users already at their own cap. A user with many
+    operations queued therefore waits for their own, while others' wait stays
+    about one operation per user ahead of them.
+    """
+
+    def __init__(self, name: str, concurrency: int, per_user: int, rate: float, burst: int, queue: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.per_user = max(1, per_user)
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.queue = queue
+        self.users: Dict[str, UserQueue] = {}
+        # Users with operations waiting, the next to be served first
+        self.turns: deque = deque()
+        # Ticket -> (user, worker)
+        self.tickets: Dict[str, tuple] = {}
+        self.running = 0
+        self.hold_seconds = DEFAULT_HOLD_SECONDS
+
+    def _user(self, user: str) -> UserQueue:
+        if user not in self.users:
+            self._forget_idle()
+            self.users[user] = UserQueue(TokenBucket(self.rate, self.burst))
+        return self.users[user]
+
+    def _forget_idle(self):
+        """Drop users with nothing queued or running whose bucket has refilled"""
+        for user, queue in list(self.users.items()):
+            if not queue.waiting and not queue.running and queue.bucket.full():
+                del self.users[user]
+
+    async def acquire(self, user: str, ticket: str, worker: Optional[int] = None) -> Dict:
+        queue = self._user(user)
+        if len(queue.waiting) >= self.queue:
+            waits = math.ceil((len(queue.waiting) + len(queue.running)) / self.per_user)
+            return {"granted": False, "reason": "queue", "retry_after": waits * self.hold_seconds}
+        retry_after = queue.bucket.take()
+        if retry_after:
+            return {"granted": False, "reason": "rate", "retry_after": retry_after}
+        future = asyncio.get_running_loop().create_future()
+        queue.waiting[ticket] = future
+        self.tickets[ticket] = (user, worker)
+        if user not in self.turns:
+            self.turns.append(user)
+        self._dispatch()
+        try:
+            granted = await future
+        except asyncio.CancelledError:
+            self.release(ticket)
+            raise
+        if not granted:
+            return {"granted": False, "reason": "lost", "retry_after": 0}
+        return {"granted": True}
+
+    def release(self, ticket: str):
+        """Give back a slot, or stop waiting for one"""
+        entry = self.tickets.pop(ticket, None)
+        if entry is None:
+            return
+        queue = self.users[entry[0]]
+        future = queue.waiting.pop(ticket, None)
+        if future is not None:
+            if not future.done():
+                future.set_result(False)
+        elif ticket in queue.running:
+            started = queue.running.pop(ticket)
+            self.running -= 1
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * (time.monotonic() - started)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.running < self.concurrency and self._grant_next():
+            pass
+
+    def _grant_next(self) -> bool:
+        """Grant the oldest operation of the next user in turn who may run one more"""
+        for _ in range(len(self.turns)):
+            user = self.turns.popleft()
+            queue = self.users.get(user)
+            if queue is None or not queue.waiting:
+                continue
+            self.turns.append(user)
+            if len(queue.running) >= self.per_user:
+                continue
+            ticket, future = queue.waiting.popitem(last=False)
+            if not queue.waiting:
+                self.turns.remove(user)
+            if future.done():
+                # Cancelled, and released as soon as its task runs
+                return True
+            queue.running[ticket] = time.monotonic()
+            self.running += 1
+            future.set_result(True)
+            return True
+        return False
+
+    def worker_lost(self, worker: int):
+        for ticket, (_, owner) in list(self.tickets.items()):
+            if owner == worker:
+                self.release(ticket)
+
+    def status(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "per_user": self.per_user,
+            "running": self.running,
+            "waiting": sum(len(queue.waiting) for queue in self.users.values()),
+            "users_waiting": len(self.turns),
+            "hold_seconds": round(self.hold_seconds, 3)
+        }
+
+
+class SchedulerManager:
+    """The pools, run on the hub's owner so limits hold across every worker"""
+
+    def __init__(self, pools: Dict[str, Dict] = POOLS):
+        self.pools = {name: Pool(name, **limits) for name, limits in pools.items()}
+
+    async def acquire(self, pool: str, user: str, ticket: str, worker: Optional[int] = None) -> Dict:
+        return await self.pools[pool].acquire(user, ticket, worker)
+
+    async def release(self, pool: str, ticket: str):
+        self.pools[pool].release(ticket)
+
+    async def status(self) -> Dict:
+        return {name: pool.status() for name, pool in self.pools.items()}
+
+    async def worker_lost(self, worker: int):
+        for pool in self.pools.values():
+            pool.worker_lost(worker)
+
+
+scheduler_manager = SchedulerManager()
+
+registry.gauge(
+    'scheduler_waiting', 'Operations waiting for their turn by pool', ('pool',),
+    callback=lambda: {(name,): pool.status()["waiting"] for name, pool in scheduler_manager.pools.items()}
+)
+
+hub.register("scheduler.acquire", scheduler_manager.acquire)
+hub.register("scheduler.release", scheduler_manager.release)
+hub.register("scheduler.status", scheduler_manager.status)
+hub.on_worker_lost(scheduler_manager.worker_lost)
+
+
+class Scheduler:
+    """Fair slots for heavy operations as used from any worker"""
+
+    async def acquire(self, pool: str, user: str) -> str:
+        """Wait for the user's turn; the ticket returned is given back with release
+
+        Raises RateLimited when the user is over their rate or has too many
+        operations waiting already.
+        """
+        ticket = uuid.uuid4().hex
+        try:
+            try:
+                grant = await hub.call("scheduler.acquire", timeout=None, pool=pool, user=user,
+                                       ticket=ticket, worker=hub.worker)
+            except HubError:
+                # The owner went away while this waited; wait again on the next one
+                ticket = uuid.uuid4().hex
+                grant = await hub.call("scheduler.acquire", timeout=None, pool=pool, user=user,
+                                       ticket=ticket, worker=hub.worker)
+        except asyncio.CancelledError:
+            await self.release(pool, ticket)
+            raise
+        if not grant["granted"]:
+            if grant["reason"] == "lost":
+                raise HubError(f"Lost the {pool} slot while waiting for it")
+            scheduler_rejections.labels(pool, grant["reason"]).inc()
+            if grant["reason"] == "rate":
+                message = f"Too many {pool} requests, try again in {math.ceil(grant['retry_after'])} s"
+            else:
+                message = f"Too many {pool} requests waiting already"
+            raise RateLimited(message, grant["retry_after"])
+        return ticket
+
+    async def release(self, pool: str, ticket: str):
+        hub.notify("scheduler.release", pool=pool, ticket=ticket)
+
+    @asynccontextmanager
+    async def slot(self, pool: str, user: str):
+        """Hold one of the pool's slots for the user until the block exits"""
+        ticket = await self.acquire(pool, user)
+        try:
+            yield
+        finally:
+            await self.release(pool, ticket)
+
+    async def status(self) -> Dict:
+        return await hub.call("scheduler.status")
+
+
+scheduler = Scheduler()
@@ -0,0 +1,275 @@
+import bisect
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import struct
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config.settings import RECORDINGS_DIR, RECORDING_MAX_BYTES, RECORDING_SEGMENT_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Every record on disk is a fixed header (timestamp, payload length) followed by the payload
+RECORD_HEADER = struct.Struct('<dI')
+# One sparse index entry is kept per this many bytes of segment data
+INDEX_INTERVAL = 64 * 1024
+# Ids are what SerialRecording.create generates; anything else is not a recording
+RECORDING_ID = re.compile(r'[0-9a-f]{12}')
+
+
+def recording_dir(recording_id: str) -> Optional[Path]:
+    """Directory of a recording, or None for an id that could name anything else"""
+    if not RECORDING_ID.fullmatch(recording_id):
+        return None
+    return RECORDINGS_DIR / recording_id
+
+
+class RecordingSegment:
+    """One append-only segment file of a recording"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = path.stat().st_size if path.exists() else 0
+        self.start_ts: Optional[float] = None
+        self.end_ts: Optional[float] = None
+        # Sparse (timestamp, offset) pairs used to seek without scanning the whole file
+        self.index: List[Tuple[float, int]] = []
+        self._indexed_size = 0
+
+    def note_record(self, ts: float, offset: int, length: int):
+        """Update bounds and the sparse index for a record appended at offset"""
+        if self.start_ts is None:
+            self.start_ts = ts
+        self.end_ts = ts
+        if not self.index or offset - self.index[-1][1] >= INDEX_INTERVAL:
+            self.index.append((ts, offset))
+        self.size = offset + RECORD_HEADER.size + length
+        self._indexed_size = self.size
+
+    def build_index(self):
+        """Scan record headers of a segment written by an earlier session"""
+        size = self.path.stat().st_size
+        if size == self._indexed_size:
+            return
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = self._indexed_size
+                while offset + RECORD_HEADER.size <= size:
+                    ts, length = RECORD_HEADER.unpack_from(mm, offset)
+                    if offset + RECORD_HEADER.size + length > size:
+                        # Torn write at the tail; ignore the partial record
+                        break
+                    self.note_record(ts, offset, length)
+                    offset += RECORD_HEADER.size + length
+
+    def read_range(self, start: Optional[float], end: Optional[float]) -> Iterator[Tuple[float, bytes]]:
+        """Yield (timestamp, payload) pairs in [start, end] by memory-mapping the segment"""
+        if self.size == 0:
+            return
+        offset = 0
+        if start is not None and self.index:
+            pos = bisect.bisect_right(self.index, (start, float('inf'))) - 1
+            if pos > 0:
+                offset = self.index[pos][1]
+        with open(self.path, 'rb') as f:
+            with mmap.mmap(f.fileno(), self.size, access=mmap.ACCESS_READ) as mm:
+                while offset + RECORD_HEADER.size <= self.size:
+                    ts, length = RECORD_HEADER.unpack_from(mm, offset)
+                    body = offset + RECORD_HEADER.size
+                    if body + length > self.size:
+                        break
+                    offset = body + length
+                    if start is not None and ts < start:
+                        continue
+                    if end is not None and ts > end:
+                        break
+                    yield ts, mm[body:body + length]
+
+
+class SerialRecording:
+    """A bounded on-disk capture of the bytes read from one serial port"""
+
+    def __init__(self, directory: Path, meta: Dict):
+        self.directory = directory
+        self.meta = meta
+        self.segments: List[RecordingSegment] = [
+            RecordingSegment(path) for path in sorted(directory.glob('*.seg'))
+        ]
+        self._file = None
+
+    @property
+    def id(self) -> str:
+        return self.meta['id']
+
+    @property
+    def active(self) -> bool:
+        return self._file is not None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(segment.size for segment in self.segments)
+
+    @classmethod
+    def create(cls, port: str, name: Optional[str] = None,
+               segment_bytes: int = RECORDING_SEGMENT_BYTES,
+               max_bytes: int = RECORDING_MAX_BYTES) -> 'SerialRecording':
+        recording_id = uuid.uuid4().hex[:12]
+        directory = RECORDINGS_DIR / recording_id
+        directory.mkdir(parents=True, exist_ok=True)
+        meta = {
+            'id': recording_id,
+            'name': name or f"{port} {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            'port': port,
+            'started': time.time(),
+            'stopped': None,
+            'segment_bytes': segment_bytes,
+            'max_bytes': max_bytes,
+        }
+        recording = cls(directory, meta)
+        recording._write_meta()
+        recording._open_segment()
+        return recording
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional['SerialRecording']:
+        try:
+            meta = json.loads((directory / 'recording.json').read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        return cls(directory, meta)
+
+    def _write_meta(self):
+        tmp_path = self.directory / 'recording.json.tmp'
+        tmp_path.write_text(json.dumps(self.meta))
+        os.replace(tmp_path, self.directory / 'recording.json')
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        sequence = int(self.segments[-1].path.stem) + 1 if self.segments else 0
+        segment = RecordingSegment(self.directory / f"{sequence:08d}.seg")
+        self._file = open(segment.path, 'ab')
+        self.segments.append(segment)
+
+    def _enforce_limit(self):
+        # Drop whole segments from the front so total size stays within max_bytes
+        while len(self.segments) > 1 and self.total_bytes > self.meta['max_bytes']:
+            oldest = self.segments.pop(0)
+            try:
+                oldest.path.unlink()
+            except OSError as e:
+                logger.error(f"Error removing recording segment {oldest.path}: {e}")
+
+    def append(self, data: bytes, ts: Optional[float] = None):
+        """Append a timestamped chunk of serial data"""
+        if not self._file or not data:
+            return
+        ts = time.time() if ts is None else ts
+        segment = self.segments[-1]
+        offset = segment.size
+        self._file.write(RECORD_HEADER.pack(ts, len(data)))
+        self._file.write(data)
+        segment.note_record(ts, offset, len(data))
+        if segment.size >= self.meta['segment_bytes']:
+            self._open_segment()
+            self._enforce_limit()
+
+    def stop(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self.meta['stopped'] = time.time()
+        self._write_meta()
+
+    def read_range(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Tuple[float, bytes]]:
+        """Yield recorded chunks between two epoch timestamps"""
+        if self._file:
+            self._file.flush()
+        for segment in list(self.segments):
+            if not segment.path.exists():
+                continue
+            if not self._file or segment is not self.segments[-1]:
+                segment.build_index()
+            if segment.start_ts is None:
+                continue
+            if end is not None and segment.start_ts > end:
+                break
+            if start is not None and segment.end_ts < start:
+                continue
+            yield from segment.read_range(start, end)
+
+    def info(self) -> Dict:
+        return {
+            **self.meta,
+            'active': self.active,
+            'size': self.total_bytes,
+            'segments': len(self.segments),
+        }
+
+
+class SerialRecorder:
+    """Keeps track of active recordings and the ones stored on disk"""
+
+    def __init__(self):
+        self.active: Dict[str, SerialRecording] = {}
+
+    def start(self, port: str, name: Optional[str] = None) -> SerialRecording:
+        recording = SerialRecording.create(port, name)
+        self.active[recording.id] = recording
+        logger.info(f"Started serial recording {recording.id} for {port}")
+        return recording
+
+    def stop(self, recording_id: str) -> Optional[SerialRecording]:
+        recording = self.active.pop(recording_id, None)
+        if recording:
+            recording.stop()
+            logger.info(f"Stopped serial recording {recording_id}")
+        return recording
+
+    def record(self, port: str, data: bytes):
+        """Feed bytes read from a port to every recording of that port"""
+        if not self.active:
+            return
+        ts = time.time()
+        for recording in self.active.values():
+            if recording.meta['port'] == port:
+                try:
+                    recording.append(data, ts)
+                except OSError as e:
+                    logger.error(f"Error writing serial recording {recording.id}: {e}")
+
+    def get(self, recording_id: str) -> Optional[SerialRecording]:
+        if recording_id in self.active:
+            return self.active[recording_id]
+        directory = recording_dir(recording_id)
+        if directory is None or not directory.is_dir():
+            return None
+        return SerialRecording.load(directory)
+
+    def list(self) -> List[Dict]:
+        recordings = []
+        if RECORDINGS_DIR.is_dir():
+            for directory in sorted(RECORDINGS_DIR.iterdir()):
+                recording = self.get(directory.name)
+                if recording:
+                    recordings.append(recording.info())
+        return sorted(recordings, key=lambda r: r['started'], reverse=True)
+
+    def delete(self, recording_id: str) -> bool:
+        directory = recording_dir(recording_id)
+        if directory is None:
+            return False
+        self.stop(recording_id)
+        if not directory.is_dir():
+            return False
+        shutil.rmtree(directory, ignore_errors=True)
+        return True
+
+
+recorder = SerialRecorder()
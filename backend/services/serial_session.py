@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import serial
+from fastapi import WebSocket
+
+from config.settings import SERIAL_RECONNECT_TIMEOUT
+from services.hub import hub
+from services.metrics import serial_bytes, watch_subscribers
+from services.port_discovery import discovery
+from services.serial_recorder import recorder
+from services.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Hub channel carrying what the port sends and session status changes
+SERIAL_CHANNEL = "serial"
+
+# Backoff bounds used while waiting for a device to come back
+RECONNECT_INITIAL_DELAY = 0.05
+RECONNECT_MAX_DELAY = 1.0
+
+
+class ConnectionManager:
+    """The open serial port, held by the worker that owns the hub
+
+    Everything read from the port is published on the hub, so websockets on
+    any worker see it; other workers reach these methods through hub calls.
+    """
+
+    def __init__(self):
+        self.serial_connection = None
+        self.port = None
+        self.baud_rate = 9600
+        self.read_task = None
+        self.reconnect_task = None
+        # True while the port is released for an upload or lost after a reset
+        self.suspended = False
+        # Per-session counters reported to telemetry when the session ends
+        self.session_started = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reconnects = 0
+
+    async def broadcast(self, message: str):
+        hub.publish(SERIAL_CHANNEL, {"type": "data", "data": message})
+
+    async def broadcast_status(self, state: str):
+        hub.publish(SERIAL_CHANNEL, {"type": "status", "state": state, "port": self.port})
+
+    def _cancel_reconnect(self):
+        if self.reconnect_task:
+            self.reconnect_task.cancel()
+            self.reconnect_task = None
+
+    def _close_serial(self):
+        if self.read_task:
+            self.read_task.cancel()
+            self.read_task = None
+        if self.serial_connection and self.serial_connection.is_open:
+            self.serial_connection.close()
+        self.serial_connection = None
+
+    def _begin_session(self):
+        self.session_started = time.monotonic()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reconnects = 0
+
+    def _end_session(self, reason: str):
+        if self.session_started is None:
+            return
+        telemetry.emit(
+            "serial_session",
+            port=self.port,
+            baud_rate=self.baud_rate,
+            duration=time.monotonic() - self.session_started,
+            bytes_in=self.bytes_in,
+            bytes_out=self.bytes_out,
+            reconnects=self.reconnects,
+            reason=reason
+        )
+        self.session_started = None
+
+    async def connect_serial(self, port: str, baud_rate: int):
+        try:
+            self._cancel_reconnect()
+            self._close_serial()
+            self._end_session("replaced")
+
+            self.serial_connection = serial.Serial(port, baud_rate, timeout=0)
+            self.port = port
+            self.baud_rate = baud_rate
+            self.suspended = False
+            self._begin_session()
+
+            self.read_task = asyncio.create_task(self.read_serial())
+
+            return True
+        except Exception as e:
+            logger.error(f"Error connecting to serial port: {e}")
+            return False
+
+    async def disconnect_serial(self):
+        try:
+            self._cancel_reconnect()
+            self._close_serial()
+            self.suspended = False
+            self._end_session("closed")
+
+            return True
+        except Exception as e:
+            logger.error(f"Error disconnecting from serial port: {e}")
+            return False
+
+    async def release_port(self, port: str) -> bool:
+        """Close the port so another process can use it, keeping subscribers attached"""
+        if port != self.port or not (self.serial_connection or self.suspended):
+            return False
+        self._cancel_reconnect()
+        self._close_serial()
+        self.suspended = True
+        logger.info(f"Released serial port {port}")
+        await self.broadcast_status("suspended")
+        return True
+
+    async def reacquire_port(self):
+        """Reopen the released port in the background as soon as the device reappears"""
+        self._cancel_reconnect()
+        self.reconnect_task = asyncio.create_task(self._reconnect())
+        return True
+
+    async def status(self) -> Dict:
+        return {
+            "port": self.port,
+            "baud_rate": self.baud_rate,
+            "connected": bool(self.serial_connection and self.serial_connection.is_open),
+            "suspended": self.suspended,
+            "owner": hub.worker
+        }
+
+    async def start_recording(self, port: Optional[str], name: Optional[str]) -> Dict:
+        # Recordings are fed by read_serial, so they live where the port is open
+        port = port or self.port
+        if not port:
+            raise ValueError("No serial port to record")
+        return recorder.start(port, name).info()
+
+    async def stop_recording(self, recording_id: str) -> Optional[Dict]:
+        recording = recorder.stop(recording_id)
+        return recording.info() if recording else None
+
+    async def delete_recording(self, recording_id: str) -> bool:
+        return recorder.delete(recording_id)
+
+    def _device_present(self) -> bool:
+        if not discovery.running:
+            # Without a live port table the only way to know is to try opening it
+            return True
+        return any(entry["port"].get("address") == self.port for entry in discovery.detected_ports())
+
+    async def _reconnect(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SERIAL_RECONNECT_TIMEOUT
+        delay = RECONNECT_INITIAL_DELAY
+        while True:
+            if self._device_present():
+                try:
+                    self.serial_connection = serial.Serial(self.port, self.baud_rate, timeout=0)
+                    self.suspended = False
+                    self.read_task = asyncio.create_task(self.read_serial())
+                    self.reconnect_task = None
+                    self.reconnects += 1
+                    logger.info(f"Reacquired serial port {self.port}")
+                    await self.broadcast_status("connected")
+                    return
+                except (serial.SerialException, OSError):
+                    self.serial_connection = None
+            if loop.time() + delay > deadline:
+                self.suspended = False
+                self.reconnect_task = None
+                self._end_session("lost")
+                logger.error(f"Gave up reacquiring serial port {self.port}")
+                await self.broadcast_status("lost")
+                return
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def send_serial(self, data: str):
+        try:
+            if self.serial_connection and self.serial_connection.is_open:
+                written = self.serial_connection.write(data.encode()) or 0
+                self.bytes_out += written
+                serial_bytes.labels(self.port, "out").inc(written)
+                return True
+            return False
+        except Exception as e:
+            logger.error(f"Error sending data to serial port: {e}")
+            return False
+
+    async def read_serial(self):
+        try:
+            while self.serial_connection and self.serial_connection.is_open:
+                if self.serial_connection.in_waiting > 0:
+                    raw = self.serial_connection.read(self.serial_connection.in_waiting)
+                    self.bytes_in += len(raw)
+                    serial_bytes.labels(self.port, "in").inc(len(raw))
+                    recorder.record(self.port, raw)
+                    await self.broadcast(raw.decode(errors='replace'))
+                await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # The device went away (reset or re-enumeration); wait for it to come back
+            logger.error(f"Error reading from serial port: {e}")
+            if self.serial_connection:
+                try:
+                    self.serial_connection.close()
+                except Exception:
+                    pass
+            self.serial_connection = None
+            self.read_task = None
+            self.suspended = True
+            await self.broadcast_status("reconnecting")
+            await self.reacquire_port()
+
+manager = ConnectionManager()
+
+hub.register("serial.connect", manager.connect_serial)
+hub.register("serial.disconnect", manager.disconnect_serial)
+hub.register("serial.send", manager.send_serial)
+hub.register("serial.release", manager.release_port)
+hub.register("serial.reacquire", manager.reacquire_port)
+hub.register("serial.status", manager.status)
+hub.register("serial.recording.start", manager.start_recording)
+hub.register("serial.recording.stop", manager.stop_recording)
+hub.register("serial.recording.delete", manager.delete_recording)
+# Relay queues of this worker, and on the owner those of the workers it fans out to
+watch_subscribers("serial", hub.channel_queues(SERIAL_CHANNEL))
+
+
+class SerialSession:
+    """This worker's websockets on the serial session and its calls to the port's owner"""
+
+    def __init__(self):
+        self.active_connections: List[WebSocket] = []
+        self.relay_task = None
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.active_connections.append(websocket)
+        if self.relay_task is None:
+            # Subscribed only while this worker has someone to relay to
+            self.relay_task = asyncio.create_task(self._relay(hub.subscribe(SERIAL_CHANNEL)))
+
+    def disconnect(self, websocket: WebSocket):
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+        if not self.active_connections and self.relay_task:
+            self.relay_task.cancel()
+            self.relay_task = None
+
+    async def _relay(self, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                for connection in list(self.active_connections):
+                    try:
+                        if message["type"] == "data":
+                            await connection.send_text(message["data"])
+                        else:
+                            await connection.send_json(message)
+                    except Exception:
+                        self.disconnect(connection)
+        finally:
+            hub.unsubscribe(SERIAL_CHANNEL, queue)
+
+    async def _call(self, method: str, **params):
+        try:
+            return await hub.call(method, **params)
+        except Exception as e:
+            logger.error(f"Error calling {method} on the serial port's owner: {e}")
+            return False
+
+    async def connect_serial(self, port: str, baud_rate: int) -> bool:
+        return await self._call("serial.connect", port=port, baud_rate=baud_rate)
+
+    async def disconnect_serial(self) -> bool:
+        return await self._call("serial.disconnect")
+
+    async def send_serial(self, data: str) -> bool:
+        return await self._call("serial.send", data=data)
+
+    async def status(self) -> Dict:
+        return await hub.call("serial.status")
+
+    async def start_recording(self, port: Optional[str], name: Optional[str]) -> Dict:
+        return await hub.call("serial.recording.start", port=port, name=name)
+
+    async def stop_recording(self, recording_id: str) -> Optional[Dict]:
+        return await hub.call("serial.recording.stop", recording_id=recording_id)
+
+    async def delete_recording(self, recording_id: str) -> bool:
+        return await hub.call("serial.recording.delete", recording_id=recording_id)
+
+    @asynccontextmanager
+    async def hold_port(self, port: str):
+        """Keep the session off a port for the duration of an upload"""
+        released = await self._call("serial.release", port=port)
+        try:
+            yield
+        finally:
+            if released:
+                await self._call("serial.reacquire")
+
+serial_session = SerialSession()
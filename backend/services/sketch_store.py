@@ -0,0 +1,313 @@
+import asyncio
+import difflib
+import json
+import logging
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from bson import Binary
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError
+
+from config.settings import SKETCH_FLUSH_BATCH, SKETCH_FLUSH_INTERVAL, SKETCH_SNAPSHOT_INTERVAL
+from services.database import db
+from services.file_store import content_hash
+from services.hub import hub
+
+logger = logging.getLogger(__name__)
+
+
+def compute_delta(old: str, new: str) -> List:
+    """Line-based edit script turning old into new: [[first_line, last_line, replacement], ...]"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, ''.join(new_lines[j1:j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+
+
+def apply_delta(text: str, delta: List) -> str:
+    lines = text.splitlines(keepends=True)
+    # Apply from the end so earlier line numbers stay valid
+    for first, last, replacement in reversed(delta):
+        lines[first:last] = [replacement] if replacement else []
+    return ''.join(lines)
+
+
+def pack(value) -> Binary:
+    return Binary(zlib.compress(json.dumps(value).encode('utf-8'), 6))
+
+
+def unpack(data: bytes):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+class SketchRepository:
+    """Sketch revisions stored as compressed deltas against periodic full snapshots, run on the hub's owner
+
+    Every worker's saves go through one process, so each sketch's latest
+    revision is kept in memory there and numbers revisions without a write
+    of its own; revisions reach MongoDB in batches.
+    """
+
+    def __init__(self, db):
+        self.collection = db.sketch_revisions
+        # (user_id, sketch_id) -> latest revision number, text, hash and last snapshot
+        self.heads: Dict[Tuple[str, str], Dict] = {}
+        self.locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        # Revision documents waiting for the next bulk insert, and the batch being inserted
+        self.pending: List[Dict] = []
+        self.flushing: List[Dict] = []
+        self.flush_task = None
+        self.flush_lock = asyncio.Lock()
+
+    async def start(self):
+        self.flush_task = asyncio.create_task(self._flush_loop())
+        asyncio.create_task(self._create_indexes())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        await self.flush()
+
+    async def _create_indexes(self):
+        try:
+            await self.collection.create_index(
+                [("user_id", ASCENDING), ("sketch_id", ASCENDING), ("rev", ASCENDING)], unique=True
+            )
+            await self.collection.create_index(
+                [("user_id", ASCENDING), ("sketch_id", ASCENDING), ("ts", DESCENDING)]
+            )
+        except Exception as e:
+            logger.error(f"Error creating sketch revision indexes: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(SKETCH_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing sketch revisions: {e}")
+
+    async def flush(self):
+        """Write buffered revisions with one insert_many"""
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            self.flushing = self.pending
+            self.pending = []
+            try:
+                await self.collection.insert_many(self.flushing, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                failed = {error["index"] for error in errors if error.get("code") != 11000}
+                duplicates = [self.flushing[error["index"]] for error in errors if error.get("code") == 11000]
+                # A retried batch may have been stored before; anything else taking its rev is a conflict
+                for doc in await self._conflicting(duplicates):
+                    logger.error(
+                        f"Revision {doc['rev']} of sketch {doc['sketch_id']} of {doc['user_id']} "
+                        f"conflicts with a stored one and was not saved"
+                    )
+                self.pending = [d for i, d in enumerate(self.flushing) if i in failed] + self.pending
+                raise
+            except Exception:
+                # Keep the batch for the next attempt, ahead of anything queued meanwhile
+                self.pending = self.flushing + self.pending
+                raise
+            finally:
+                self.flushing = []
+
+    async def _conflicting(self, docs: List[Dict]) -> List[Dict]:
+        """The revisions among docs whose rev is stored with different content"""
+        conflicts = []
+        for doc in docs:
+            stored = await self.collection.find_one(
+                {"user_id": doc["user_id"], "sketch_id": doc["sketch_id"], "rev": doc["rev"]},
+                projection={"hash": 1}
+            )
+            if not stored or stored["hash"] != doc["hash"]:
+                conflicts.append(doc)
+        return conflicts
+
+    def _lock(self, key: Tuple[str, str]) -> asyncio.Lock:
+        if key not in self.locks:
+            self.locks[key] = asyncio.Lock()
+        return self.locks[key]
+
+    async def _head(self, user_id: str, sketch_id: str) -> Optional[Dict]:
+        key = (user_id, sketch_id)
+        if key not in self.heads:
+            latest = await self.collection.find_one(
+                {"user_id": user_id, "sketch_id": sketch_id},
+                sort=[("rev", DESCENDING)],
+                projection={"rev": 1}
+            )
+            if not latest:
+                return None
+            text = await self._load(user_id, sketch_id, latest["rev"])
+            snapshot = await self.collection.find_one(
+                {"user_id": user_id, "sketch_id": sketch_id, "kind": "snapshot"},
+                sort=[("rev", DESCENDING)],
+                projection={"rev": 1}
+            )
+            self.heads[key] = {
+                "rev": latest["rev"],
+                "text": text,
+                "hash": content_hash(text.encode('utf-8')),
+                "snapshot_rev": snapshot["rev"] if snapshot else 0
+            }
+        return self.heads[key]
+
+    async def save(self, user_id: str, sketch_id: str, content: str) -> Dict:
+        """Record a new revision unless content matches the latest one"""
+        key = (user_id, sketch_id)
+        async with self._lock(key):
+            head = await self._head(user_id, sketch_id)
+            digest = content_hash(content.encode('utf-8'))
+            if head and head["hash"] == digest:
+                return {"rev": head["rev"], "hash": digest, "changed": False}
+
+            rev = head["rev"] + 1 if head else 1
+            doc = {
+                "user_id": user_id,
+                "sketch_id": sketch_id,
+                "rev": rev,
+                "ts": datetime.now(timezone.utc),
+                "hash": digest,
+                "size": len(content)
+            }
+            delta = None
+            if head and rev - head["snapshot_rev"] < SKETCH_SNAPSHOT_INTERVAL:
+                delta = compute_delta(head["text"], content)
+            if delta is not None and len(json.dumps(delta)) < len(content) // 2:
+                doc.update(kind="delta", data=pack(delta))
+                snapshot_rev = head["snapshot_rev"]
+            else:
+                doc.update(kind="snapshot", data=pack(content))
+                snapshot_rev = rev
+
+            self.pending.append(doc)
+            self.heads[key] = {"rev": rev, "text": content, "hash": digest, "snapshot_rev": snapshot_rev}
+
+        if len(self.pending) >= SKETCH_FLUSH_BATCH:
+            asyncio.create_task(self._flush_quietly())
+        return {"rev": rev, "hash": digest, "changed": True}
+
+    async def _flush_quietly(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing sketch revisions: {e}")
+
+    def _pending_for(self, user_id: str, sketch_id: str) -> List[Dict]:
+        return [
+            d for d in self.flushing + self.pending
+            if d["user_id"] == user_id and d["sketch_id"] == sketch_id
+        ]
+
+    async def _load(self, user_id: str, sketch_id: str, rev: int) -> Optional[str]:
+        """Rebuild a revision from the nearest snapshot at or before it plus the deltas after"""
+        query = {"user_id": user_id, "sketch_id": sketch_id}
+        docs = {d["rev"]: d for d in self._pending_for(user_id, sketch_id) if d["rev"] <= rev}
+        snapshot_rev = max((r for r, d in docs.items() if d["kind"] == "snapshot"), default=None)
+        if snapshot_rev is None:
+            snapshot = await self.collection.find_one(
+                {**query, "kind": "snapshot", "rev": {"$lte": rev}},
+                sort=[("rev", DESCENDING)]
+            )
+            if not snapshot:
+                return None
+            snapshot_rev = snapshot["rev"]
+            docs[snapshot_rev] = snapshot
+            cursor = self.collection.find({**query, "rev": {"$gt": snapshot_rev, "$lte": rev}})
+            async for doc in cursor:
+                docs.setdefault(doc["rev"], doc)
+
+        text = unpack(docs[snapshot_rev]["data"])
+        for r in range(snapshot_rev + 1, rev + 1):
+            if r not in docs:
+                return None
+            text = apply_delta(text, unpack(docs[r]["data"]))
+        return text
+
+    async def load(self, user_id: str, sketch_id: str, rev: Optional[int] = None) -> Optional[Dict]:
+        """Get a revision's content; the latest one when rev is None"""
+        head = await self._head(user_id, sketch_id)
+        if not head:
+            return None
+        if rev is None or rev == head["rev"]:
+            return {"rev": head["rev"], "hash": head["hash"], "content": head["text"]}
+        text = await self._load(user_id, sketch_id, rev)
+        if text is None:
+            return None
+        return {"rev": rev, "hash": content_hash(text.encode('utf-8')), "content": text}
+
+    async def history(self, user_id: str, sketch_id: str, limit: int = 100) -> List[Dict]:
+        """Revision metadata, newest first"""
+        revisions = {
+            d["rev"]: d for d in self._pending_for(user_id, sketch_id)
+        }
+        cursor = self.collection.find(
+            {"user_id": user_id, "sketch_id": sketch_id},
+            projection={"data": 0, "_id": 0},
+            sort=[("rev", DESCENDING)],
+            limit=limit
+        )
+        async for doc in cursor:
+            revisions.setdefault(doc["rev"], doc)
+        return [
+            {"rev": d["rev"], "ts": d["ts"].isoformat(), "hash": d["hash"], "size": d["size"], "kind": d["kind"]}
+            for _, d in sorted(revisions.items(), reverse=True)[:limit]
+        ]
+
+    async def list_sketches(self, user_id: str) -> List[Dict]:
+        await self.flush()
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$group": {"_id": "$sketch_id", "rev": {"$max": "$rev"}, "updated": {"$max": "$ts"}}},
+            {"$sort": {"updated": -1}}
+        ]
+        sketches = []
+        async for doc in self.collection.aggregate(pipeline):
+            sketches.append({"sketch_id": doc["_id"], "rev": doc["rev"], "updated": doc["updated"].isoformat()})
+        return sketches
+
+
+sketch_repository_manager = SketchRepository(db)
+
+hub.register("sketches.save", sketch_repository_manager.save)
+hub.register("sketches.load", sketch_repository_manager.load)
+hub.register("sketches.history", sketch_repository_manager.history)
+hub.register("sketches.list", sketch_repository_manager.list_sketches)
+
+
+class SketchRevisions:
+    """Sketch revisions as used from any worker"""
+
+    async def start(self):
+        await sketch_repository_manager.start()
+
+    async def stop(self):
+        # Flushes what this worker buffered while it owned the hub
+        await sketch_repository_manager.stop()
+
+    async def save(self, user_id: str, sketch_id: str, content: str) -> Dict:
+        return await hub.call("sketches.save", user_id=user_id, sketch_id=sketch_id, content=content)
+
+    async def load(self, user_id: str, sketch_id: str, rev: Optional[int] = None) -> Optional[Dict]:
+        return await hub.call("sketches.load", user_id=user_id, sketch_id=sketch_id, rev=rev)
+
+    async def history(self, user_id: str, sketch_id: str, limit: int = 100) -> List[Dict]:
+        return await hub.call("sketches.history", user_id=user_id, sketch_id=sketch_id, limit=limit)
+
+    async def list_sketches(self, user_id: str) -> List[Dict]:
+        return await hub.call("sketches.list", user_id=user_id)
+
+
+sketch_repository = SketchRevisions()
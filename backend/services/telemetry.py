@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from config.settings import TELEMETRY_BATCH_SIZE, TELEMETRY_BUFFER_SIZE, TELEMETRY_FLUSH_INTERVAL
+from services.database import db
+
+logger = logging.getLogger(__name__)
+
+
+class Telemetry:
+    """Buffers structured events in memory and writes them to MongoDB in batches
+
+    emit() never blocks: once the buffer is full the oldest events are dropped
+    and counted, so a slow or unavailable database cannot grow memory.
+    """
+
+    def __init__(self, collection, buffer_size: int = TELEMETRY_BUFFER_SIZE,
+                 batch_size: int = TELEMETRY_BATCH_SIZE, flush_interval: float = TELEMETRY_FLUSH_INTERVAL):
+        self.collection = collection
+        self.buffer = deque()
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # emit() is also called from worker threads running arduino-cli
+        self.lock = threading.Lock()
+        self.emitted = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed_batches = 0
+        self.flush_task = None
+
+    def emit(self, kind: str, **fields):
+        event = {"kind": kind, "ts": datetime.now(timezone.utc), **fields}
+        with self.lock:
+            self.emitted += 1
+            if len(self.buffer) >= self.buffer_size:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append(event)
+
+    def _take_batch(self) -> List[Dict]:
+        with self.lock:
+            count = min(len(self.buffer), self.batch_size)
+            return [self.buffer.popleft() for _ in range(count)]
+
+    async def flush(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                self.written += len(batch)
+            except Exception as e:
+                # Telemetry is best effort: count the loss instead of retrying forever
+                self.failed_batches += 1
+                with self.lock:
+                    self.dropped += len(batch)
+                logger.error(f"Error writing telemetry batch: {e}")
+                return
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        if not self.flush_task:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            await asyncio.gather(self.flush_task, return_exceptions=True)
+            self.flush_task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "emitted": self.emitted,
+            "buffered": len(self.buffer),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_batches": self.failed_batches
+        }
+
+
+telemetry = Telemetry(db.telemetry_events)
+
+
+class PhaseTimer:
+    """Times the consecutive phases of one operation and reports them as a single event"""
+
+    def __init__(self, kind: str, **fields):
+        self.kind = kind
+        self.fields = fields
+        self.phases: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def emit(self, **fields):
+        telemetry.emit(
+            self.kind,
+            phases=self.phases,
+            duration=time.perf_counter() - self.started,
+            **self.fields,
+            **fields
+        )
@@ -0,0 +1,291 @@
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import struct
+import sys
+from typing import Dict, List, Optional, Set
+
+from config.settings import WORKSPACE_DIR, WORKSPACE_IGNORE, WORKSPACE_POLL_INTERVAL
+from services.metrics import subscriber_overflows, watch_subscribers
+
+logger = logging.getLogger(__name__)
+
+# inotify event flags (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """Minimal non-blocking inotify binding over libc"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WorkspaceTree:
+    """In-memory workspace listing, loaded per directory and kept current by a watcher"""
+
+    def __init__(self, root: str, ignore: List[str]):
+        self.root = root
+        self.real_root = os.path.realpath(root)
+        self.ignore = ignore
+        # Directory path -> {entry name: node} for every directory listed so far
+        self.dirs: Dict[str, Dict[str, Dict]] = {}
+        self.mtimes: Dict[str, int] = {}
+        self.watches: Dict[int, str] = {}
+        self.watched: Dict[str, int] = {}
+        # Directories that have to be checked by the periodic mtime scan
+        self.poll_dirs: Set[str] = set()
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.inotify: Optional[Inotify] = None
+        self.poll_task = None
+
+    async def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        if sys.platform.startswith('linux'):
+            try:
+                self.inotify = Inotify()
+                asyncio.get_running_loop().add_reader(self.inotify.fd, self._on_inotify)
+            except (OSError, AttributeError) as e:
+                logger.info(f"inotify unavailable, polling the workspace instead: {e}")
+                self.inotify = None
+        self.poll_task = asyncio.create_task(self._poll())
+
+    async def stop(self):
+        if self.poll_task:
+            self.poll_task.cancel()
+            await asyncio.gather(self.poll_task, return_exceptions=True)
+            self.poll_task = None
+        if self.inotify:
+            asyncio.get_running_loop().remove_reader(self.inotify.fd)
+            self.inotify.close()
+            self.inotify = None
+        self.dirs.clear()
+        self.mtimes.clear()
+        self.watches.clear()
+        self.watched.clear()
+        self.poll_dirs.clear()
+
+    def is_ignored(self, name: str) -> bool:
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore)
+
+    def resolve(self, path: Optional[str]) -> str:
+        """Map a client path to a directory inside the workspace"""
+        if not path:
+            return self.root
+        real_path = os.path.realpath(path)
+        if real_path != self.real_root and not real_path.startswith(self.real_root + os.sep):
+            raise ValueError("Path is outside the workspace")
+        relative = os.path.relpath(real_path, self.real_root)
+        return self.root if relative == '.' else os.path.join(self.root, relative)
+
+    def _scan(self, path: str) -> Dict[str, Dict]:
+        entries = {}
+        with os.scandir(path) as it:
+            for entry in it:
+                if self.is_ignored(entry.name):
+                    continue
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entries[entry.name] = {
+                    "name": entry.name,
+                    "path": os.path.join(path, entry.name),
+                    "type": "directory" if is_dir else "file"
+                }
+        return entries
+
+    def _watch(self, path: str):
+        if self.inotify:
+            try:
+                wd = self.inotify.add_watch(path)
+                self.watches[wd] = path
+                self.watched[path] = wd
+                self.poll_dirs.discard(path)
+                return
+            except OSError as e:
+                logger.error(f"Cannot watch {path}, falling back to polling: {e}")
+        self.poll_dirs.add(path)
+
+    def _forget(self, path: str):
+        """Drop a directory and everything cached below it"""
+        prefix = path + os.sep
+        for cached in [p for p in self.dirs if p == path or p.startswith(prefix)]:
+            self.dirs.pop(cached, None)
+            self.mtimes.pop(cached, None)
+            self.poll_dirs.discard(cached)
+            wd = self.watched.pop(cached, None)
+            if wd is not None:
+                self.watches.pop(wd, None)
+                if self.inotify:
+                    self.inotify.rm_watch(wd)
+
+    def list_dir(self, path: str) -> Dict[str, Dict]:
+        if self.poll_task is None:
+            # Nothing keeps a cache current before start(), so read straight from disk
+            return self._scan(path)
+        entries = self.dirs.get(path)
+        if entries is None:
+            # Watch first so nothing created during the scan is missed
+            self._watch(path)
+            self.dirs[path] = {}
+            try:
+                self.mtimes[path] = os.stat(path).st_mtime_ns
+                entries = self._scan(path)
+            except OSError:
+                self._forget(path)
+                raise
+            self.dirs[path] = entries
+        return entries
+
+    def tree(self, path: Optional[str] = None, depth: Optional[int] = None) -> List[Dict]:
+        """Nested listing of a directory; directories below depth are left unexpanded"""
+        return self._build(self.resolve(path), depth)
+
+    def _build(self, path: str, depth: Optional[int]) -> List[Dict]:
+        result = []
+        nodes = sorted(self.list_dir(path).values(), key=lambda n: (n["type"] != "directory", n["name"].lower()))
+        for node in nodes:
+            item = dict(node)
+            if node["type"] == "directory":
+                if depth is None or depth > 1:
+                    try:
+                        item["children"] = self._build(node["path"], None if depth is None else depth - 1)
+                    except OSError:
+                        item["children"] = []
+                else:
+                    item["loaded"] = False
+            result.append(item)
+        return result
+
+    def _refresh(self, path: str):
+        """Rescan one cached directory and publish what changed"""
+        old_entries = self.dirs.get(path)
+        if old_entries is None:
+            return
+        try:
+            self.mtimes[path] = os.stat(path).st_mtime_ns
+            new_entries = self._scan(path)
+        except OSError:
+            self._forget(path)
+            return
+        self.dirs[path] = new_entries
+        for name in old_entries.keys() - new_entries.keys():
+            self._removed(old_entries[name])
+        for name in new_entries.keys() - old_entries.keys():
+            self.publish({"type": "created", "path": new_entries[name]["path"], "kind": new_entries[name]["type"]})
+
+    def _removed(self, node: Dict):
+        if node["type"] == "directory":
+            self._forget(node["path"])
+        self.publish({"type": "deleted", "path": node["path"], "kind": node["type"]})
+
+    def _on_inotify(self):
+        for wd, mask, name in self.inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost; rescan every cached directory
+                for path in list(self.dirs):
+                    self._refresh(path)
+                continue
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                self.watched.pop(path, None)
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self._forget(path)
+                continue
+            entries = self.dirs.get(path)
+            if entries is None or not name or self.is_ignored(name):
+                continue
+            kind = "directory" if mask & IN_ISDIR else "file"
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                node = {"name": name, "path": os.path.join(path, name), "type": kind}
+                entries[name] = node
+                self.publish({"type": "created", "path": node["path"], "kind": kind})
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                node = entries.pop(name, None)
+                if node:
+                    self._removed(node)
+            elif mask & IN_CLOSE_WRITE:
+                self.publish({"type": "modified", "path": os.path.join(path, name), "kind": kind})
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(WORKSPACE_POLL_INTERVAL)
+            for path in list(self.poll_dirs):
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    self._forget(path)
+                    continue
+                if mtime != self.mtimes.get(path):
+                    self._refresh(path)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=1000)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event: Dict):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscriber_overflows.labels("workspace").inc()
+                # Too far behind to replay; tell the client to reload instead
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "reset", "path": self.root})
+
+
+workspace_tree = WorkspaceTree(str(WORKSPACE_DIR), WORKSPACE_IGNORE)
+watch_subscribers("workspace", workspace_tree.subscribers)
@@ -11,7 +11,11 @@ const LibraryManager = () => {
     searchLibraries,
     installLibrary,
     setShowLibraryManager,
-    loadLibraries
+    loadLibraries,
+    examples,
+    isSearchingExamples,
+    searchExamples,
+    openExample
   } = useArduino();
   
   const [activeTab, setActiveTab] = useState('installed');
@@ -31,8 +35,10 @@ const LibraryManager = () => {
     setSearchTimeout(setTimeout(() => {
       if (activeTab === 'available') {
         searchLibraries(query);
+      } else if (activeTab === 'examples') {
+        searchExamples(query);
       }
-    }, 500));
+    }, activeTab === 'examples' ? 150 : 500));
   };
   
   // Filter installed libraries based on search query
@@ -49,6 +55,8 @@ const LibraryManager = () => {
   useEffect(() => {
     if (activeTab === 'available') {
       searchLibraries(searchQuery);
+    } else if (activeTab === 'examples') {
+      searchExamples(searchQuery);
     }
   }, [activeTab, searchLibraries]);
   
@@ -61,6 +69,8 @@ const LibraryManager = () => {
   const handleRefresh = async () => {
     if (activeTab === 'installed') {
       await loadLibraries();
+    } else if (activeTab === 'examples') {
+      await searchExamples(searchQuery);
     } else {
       await searchLibraries(searchQuery);
     }
@@ -89,12 +99,22 @@ const LibraryManager = () => {
           >
             Available
           </button>
+          <button 
+            className={`tab-button ${activeTab === 'examples' ? 'active' : ''}`}
+            onClick={() => setActiveTab('examples')}
+          >
+            Examples
+          </button>
         </div>
         
         <div className="modal-search">
           <input
             type="text"
-            placeholder={activeTab === 'installed' ? "Filter installed libraries..." : "Search libraries..."}
+            placeholder={{
+              installed: "Filter installed libraries...",
+              available: "Search libraries...",
+              examples: "Search examples..."
+            }[activeTab]}
             value={searchQuery}
             onChange={handleSearchChange}
           />
@@ -133,6 +153,40 @@ const LibraryManager = () => {
                 </div>
               )}
             </div>
+          ) : activeTab === 'examples' ? (
+            <div className="available-libraries">
+              {isSearchingExamples && examples.length === 0 ? (
+                <div className="loading-message">
+                  Searching examples...
+                </div>
+              ) : examples.length > 0 ? (
+                <div className="libraries-list">
+                  {examples.map(example => (
+                    <div key={example.id} className="library-item">
+                      <div className="library-info">
+                        <div className="library-name">{example.name}</div>
+                        <div className="library-author">
+                          {example.library}{example.category ? ` / ${example.category}` : ''}
+                        </div>
+                        <div className="library-description">
+                          {example.description || 'No description available.'}
+                        </div>
+                      </div>
+                      <button 
+                        className="install-button"
+                        onClick={() => openExample(example.id)}
+                      >
+                        Open
+                      </button>
+                    </div>
+                  ))}
+                </div>
+              ) : (
+                <div className="no-items-message">
+                  {searchQuery ? 'No examples match your search.' : 'No examples in the installed libraries.'}
+                </div>
+              )}
+            </div>
           ) : (
             <div className="available-libraries">
               {isSearchingLibraries ? (
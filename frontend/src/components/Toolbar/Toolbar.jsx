@@ -16,7 +16,7 @@ const Toolbar = () => {
     setSelectedPort,
     boards,
     selectedBoard,
-    setSelectedBoard,
+    selectBoard,
     loadPorts
   } = useArduino();
 
@@ -56,7 +56,7 @@ const Toolbar = () => {
         <select 
           className="board-select" 
           value={selectedBoard} 
-          onChange={(e) => setSelectedBoard(e.target.value)}
+          onChange={(e) => selectBoard(e.target.value)}
         >
           <option value="">Select Board</option>
           {boards.map((board) => (
@@ -26,10 +26,16 @@ export const ArduinoProvider = ({ children }) => {
   const [availablePlatforms, setAvailablePlatforms] = useState([]);
   const [isInstallingCore, setIsInstallingCore] = useState(false);
   
+  // State for examples
+  const [examples, setExamples] = useState([]);
+  const [isSearchingExamples, setIsSearchingExamples] = useState(false);
+  
   // State for code
   const [code, setCode] = useState(`void setup() {\n  Serial.begin(9600);\n  pinMode(LED_BUILTIN, OUTPUT);\n}\n\nvoid loop() {\n  digitalWrite(LED_BUILTIN, HIGH);\n  delay(1000);\n  digitalWrite(LED_BUILTIN, LOW);\n  delay(1000);\n  Serial.println("Hello Arduino!");\n}`);
   const [activeTab, setActiveTab] = useState('main.ino');
   const [tabs, setTabs] = useState([{ name: 'main.ino', content: '', path: '/tmp/arduino_workspace/main.ino' }]);
+  // Sketch path of an opened example; compiles there keep their build tree
+  const [sketchPath, setSketchPath] = useState(null);
   
   // State for workspace
   const [workspaceTree, setWorkspaceTree] = useState([]);
@@ -64,6 +70,43 @@ export const ArduinoProvider = ({ children }) => {
     searchLibraries(); // Load initial library list
   }, []);
   
+  // Keep ports up to date from hot-plug events
+  useEffect(() => {
+    const ws = api.ports.connectWebSocket();
+    
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      const sameAddress = (entry) => entry.port.address === message.port.address;
+      if (message.type === 'snapshot') {
+        setPorts(message.ports);
+      } else if (message.type === 'add') {
+        setPorts(prev => [...prev.filter(entry => !sameAddress(entry)), { port: message.port }]);
+      } else if (message.type === 'remove') {
+        setPorts(prev => prev.filter(entry => !sameAddress(entry)));
+      }
+    };
+    
+    return () => ws.close();
+  }, []);
+  
+  // Reload the workspace tree when files are created or deleted on the server
+  useEffect(() => {
+    const ws = api.files.connectWorkspaceWebSocket();
+    let reloadTimer = null;
+    
+    ws.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'modified') return;
+      clearTimeout(reloadTimer);
+      reloadTimer = setTimeout(loadWorkspace, 200);
+    };
+    
+    return () => {
+      clearTimeout(reloadTimer);
+      ws.close();
+    };
+  }, []);
+  
   // Load boards
   const loadBoards = async () => {
     try {
@@ -172,7 +215,16 @@ export const ArduinoProvider = ({ children }) => {
     try {
       const response = await api.libraries.searchLibraries(query);
       if (response.success) {
-        setAvailableLibraries(response.libraries || []);
+        // Search results keep their details under the latest release
+        const librariesArray = (response.libraries || []).map(lib => ({
+          name: lib.name,
+          version: lib.latest?.version,
+          author: lib.latest?.author,
+          sentence: lib.latest?.sentence,
+          paragraph: lib.latest?.paragraph,
+          category: lib.latest?.category
+        }));
+        setAvailableLibraries(librariesArray);
       }
     } catch (error) {
       console.error('Error searching libraries:', error);
@@ -180,6 +232,48 @@ export const ArduinoProvider = ({ children }) => {
     setIsSearchingLibraries(false);
   };
   
+  // Search examples
+  const searchExamples = async (query = '') => {
+    setIsSearchingExamples(true);
+    try {
+      const response = await api.examples.searchExamples(query);
+      if (response.success) {
+        setExamples(response.examples || []);
+      }
+    } catch (error) {
+      console.error('Error searching examples:', error);
+    }
+    setIsSearchingExamples(false);
+  };
+  
+  // Select a board, building the open sketch for it in the background so Verify is quick
+  const selectBoard = (fqbn) => {
+    setSelectedBoard(fqbn);
+    if (fqbn && sketchPath) {
+      api.code.prewarmSketch(code, fqbn, sketchPath, tabs).catch(() => {});
+    }
+  };
+  
+  // Open an example in the editor
+  const openExample = async (exampleId) => {
+    try {
+      const response = await api.examples.openExample(exampleId);
+      if (response.success) {
+        const files = response.files.map(file => ({ name: file.name, content: file.content, path: file.path }));
+        const main = files.find(file => file.name === response.example.main) || files[0];
+        setTabs(files);
+        setActiveTab(main.name);
+        setCode(main.content);
+        setSketchPath(response.sketch_path);
+        setShowLibraryManager(false);
+      } else {
+        alert('Failed to open example: ' + response.error);
+      }
+    } catch (error) {
+      console.error('Error opening example:', error);
+    }
+  };
+  
   // Install library
   const installLibrary = async (libraryName) => {
     setIsInstallingLibrary(true);
@@ -232,10 +326,16 @@ export const ArduinoProvider = ({ children }) => {
     setIsCompiling(true);
     setCompileOutput('Compiling...');
     try {
-      const response = await api.code.compileCode(code, selectedBoard, '/tmp/arduino_workspace');
-      setCompileOutput(response.message);
+      if (sketchPath) {
+        const response = await api.code.compileSketch(code, selectedBoard, sketchPath, tabs);
+        setCompileOutput(response.output);
+      } else {
+        const response = await api.code.compileCode(code, selectedBoard, '/tmp/arduino_workspace');
+        setCompileOutput(response.message);
+      }
     } catch (error) {
-      setCompileOutput(`Error: ${error.message}`);
+      // A 429 from the scheduler says how long to wait
+      setCompileOutput(`Error: ${error.response?.data?.error || error.message}`);
     }
     setIsCompiling(false);
   };
@@ -250,10 +350,16 @@ export const ArduinoProvider = ({ children }) => {
     setIsUploading(true);
     setUploadOutput('Uploading...');
     try {
-      const response = await api.code.uploadCode(code, selectedBoard, selectedPort, '/tmp/arduino_workspace');
-      setUploadOutput(response.message);
+      if (sketchPath) {
+        const response = await api.code.uploadSketch(code, selectedBoard, selectedPort, sketchPath, tabs);
+        setUploadOutput(response.output);
+      } else {
+        const response = await api.code.uploadCode(code, selectedBoard, selectedPort, '/tmp/arduino_workspace');
+        setUploadOutput(response.message);
+      }
     } catch (error) {
-      setUploadOutput(`Error: ${error.message}`);
+      // A 429 from the scheduler says how long to wait
+      setUploadOutput(`Error: ${error.response?.data?.error || error.message}`);
     }
     setIsUploading(false);
   };
@@ -263,18 +369,21 @@ export const ArduinoProvider = ({ children }) => {
     if (!selectedPort) return;
     
     const ws = api.serial.connectWebSocket(selectedPort);
-    
+    // Messages carry output as it arrives, so a line may span several of them
+    let partialLine = '';
+
     ws.onmessage = (event) => {
       const data = event.data;
-      setSerialOutput(prev => prev + data + '\n');
-      
-      // Try to parse as numeric data for plotting
-      const numericValue = parseFloat(data);
-      if (!isNaN(numericValue)) {
-        setPlotData(prev => [...prev.slice(-49), { 
-          time: Date.now(), 
-          value: numericValue 
-        }]);
+      setSerialOutput(prev => prev + data);
+
+      const lines = (partialLine + data).split(/\r?\n/);
+      partialLine = lines.pop();
+
+      // Try to parse complete lines as numeric data for plotting
+      const values = lines.map(line => parseFloat(line)).filter(value => !isNaN(value));
+      if (values.length) {
+        const time = Date.now();
+        setPlotData(prev => [...prev, ...values.map(value => ({ time, value }))].slice(-50));
       }
     };
     
@@ -301,6 +410,7 @@ export const ArduinoProvider = ({ children }) => {
     availableBoards,
     selectedBoard,
     setSelectedBoard,
+    selectBoard,
     loadBoards,
     loadAvailableBoards,
     
@@ -327,6 +437,13 @@ export const ArduinoProvider = ({ children }) => {
     loadAvailablePlatforms,
     installCore,
     
+    // Examples
+    examples,
+    isSearchingExamples,
+    searchExamples,
+    openExample,
+    sketchPath,
+    
     // Code
     code,
     setCode,
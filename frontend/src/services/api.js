@@ -1,13 +1,39 @@
 import axios from 'axios';
+import { supabase } from './supabase';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// The backend shares compile and install capacity fairly between users; send the
+// signed-in user's token so they are told apart from others behind the same address
+axios.interceptors.request.use(async (config) => {
+  if (config.url && config.url.startsWith(API)) {
+    try {
+      const { data } = await supabase.auth.getSession();
+      const token = data?.session?.access_token;
+      if (token) {
+        config.headers.Authorization = `Bearer ${token}`;
+      }
+    } catch (error) {
+      console.error('Error reading the auth session:', error);
+    }
+  }
+  return config;
+});
+
+// Catalog endpoints return arduino-cli's full entries unless asked for fewer fields;
+// these are the ones the UI reads.
+const BOARD_FIELDS = 'name,fqbn';
+const LIBRARY_FIELDS = 'library.name,library.version,library.author,library.maintainer,library.website,library.category';
+const LIBRARY_SEARCH_FIELDS = 'name,latest.version,latest.author,latest.sentence,latest.paragraph,latest.category';
+const PLATFORM_FIELDS = 'id,name,boards.name,latest_version,installed_version';
+const EXAMPLE_FIELDS = 'id,name,library,category,description';
+
 // Boards API
 export const boardsApi = {
   getBoards: async () => {
     try {
-      const response = await axios.get(`${API}/boards`);
+      const response = await axios.get(`${API}/boards`, { params: { fields: BOARD_FIELDS } });
       return response.data;
     } catch (error) {
       console.error('Error loading boards:', error);
@@ -17,7 +43,7 @@ export const boardsApi = {
   
   getAvailableBoards: async () => {
     try {
-      const response = await axios.get(`${API}/boards/available`);
+      const response = await axios.get(`${API}/boards/available`, { params: { fields: BOARD_FIELDS } });
       return response.data;
     } catch (error) {
       console.error('Error loading available boards:', error);
@@ -36,6 +62,11 @@ export const portsApi = {
       console.error('Error loading ports:', error);
       throw error;
     }
+  },
+  
+  connectWebSocket: () => {
+    const wsUrl = `${BACKEND_URL.replace('http', 'ws')}/api/ports/ws`;
+    return new WebSocket(wsUrl);
   }
 };
 
@@ -43,7 +74,7 @@ export const portsApi = {
 export const librariesApi = {
   getLibraries: async () => {
     try {
-      const response = await axios.get(`${API}/libraries`);
+      const response = await axios.get(`${API}/libraries`, { params: { fields: LIBRARY_FIELDS } });
       return response.data;
     } catch (error) {
       console.error('Error loading libraries:', error);
@@ -53,7 +84,9 @@ export const librariesApi = {
   
   searchLibraries: async (query = '') => {
     try {
-      const response = await axios.post(`${API}/libraries/search`, { query });
+      const response = await axios.post(`${API}/libraries/search`, { query }, {
+        params: { fields: LIBRARY_SEARCH_FIELDS }
+      });
       return response.data;
     } catch (error) {
       console.error('Error searching libraries:', error);
@@ -96,7 +129,7 @@ export const coresApi = {
   
   searchCores: async () => {
     try {
-      const response = await axios.get(`${API}/cores/search`);
+      const response = await axios.get(`${API}/cores/search`, { params: { fields: PLATFORM_FIELDS } });
       return response.data;
     } catch (error) {
       console.error('Error loading available platforms:', error);
@@ -125,6 +158,67 @@ export const coresApi = {
   }
 };
 
+// Examples API
+export const examplesApi = {
+  searchExamples: async (query = '') => {
+    try {
+      const response = await axios.get(`${API}/examples`, {
+        params: { q: query, fields: EXAMPLE_FIELDS, limit: 200 }
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error searching examples:', error);
+      throw error;
+    }
+  },
+  
+  openExample: async (exampleId) => {
+    try {
+      const response = await axios.post(`${API}/examples/${exampleId}/open`);
+      return response.data;
+    } catch (error) {
+      console.error('Error opening example:', error);
+      throw error;
+    }
+  }
+};
+
+// Hex SHA-256 of a file's text, or null where the browser has no crypto.subtle (plain http)
+const sha256 = async (text) => {
+  if (!window.crypto || !window.crypto.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest)).map(byte => byte.toString(16).padStart(2, '0')).join('');
+};
+
+// Hashes the server holds for each sketch's files, by sketch path and file name
+const sketchHashes = new Map();
+
+// A sketch's tabs as sent to the server: files it already holds go by hash alone
+const sketchFiles = async (sketchPath, tabs, resend = false) => {
+  const held = sketchHashes.get(sketchPath) || {};
+  return Promise.all(tabs.map(async (tab) => {
+    const hash = await sha256(tab.content);
+    if (!resend && hash && held[tab.name] === hash) {
+      return { name: tab.name, hash };
+    }
+    return { name: tab.name, content: tab.content, hash };
+  }));
+};
+
+// Post a sketch build or upload, sending full content again if the server lost track of a file
+const postSketch = async (url, body, sketchPath, tabs) => {
+  let response = await axios.post(url, { ...body, sketch_path: sketchPath, files: await sketchFiles(sketchPath, tabs) });
+  if (response.data.stale_files) {
+    response = await axios.post(url, { ...body, sketch_path: sketchPath, files: await sketchFiles(sketchPath, tabs, true) });
+  }
+  if (response.data.files) {
+    sketchHashes.set(sketchPath, Object.fromEntries(
+      response.data.files.filter(file => file.hash).map(file => [file.name, file.hash])
+    ));
+  }
+  return response.data;
+};
+
 // Code API
 export const codeApi = {
   compileCode: async (code, board, sketchPath) => {
@@ -141,6 +235,36 @@ export const codeApi = {
     }
   },
   
+  // Compile at a fixed sketch path, so the build tree is kept and reused; only
+  // edited tabs are rewritten, so only their translation units are rebuilt
+  compileSketch: async (code, board, sketchPath, tabs) => {
+    try {
+      return await postSketch(`${API}/compile/verify`, { code, board }, sketchPath, tabs);
+    } catch (error) {
+      console.error('Error compiling code:', error);
+      throw error;
+    }
+  },
+  
+  // Build the sketch for a newly selected board in the background, at low priority
+  prewarmSketch: async (code, board, sketchPath, tabs) => {
+    try {
+      return await postSketch(`${API}/compile/prewarm`, { code, board }, sketchPath, tabs);
+    } catch (error) {
+      console.error('Error starting warm-up build:', error);
+      throw error;
+    }
+  },
+  
+  uploadSketch: async (code, board, port, sketchPath, tabs) => {
+    try {
+      return await postSketch(`${API}/compile/upload`, { code, board, port }, sketchPath, tabs);
+    } catch (error) {
+      console.error('Error uploading code:', error);
+      throw error;
+    }
+  },
+  
   uploadCode: async (code, board, port, sketchPath) => {
     try {
       const response = await axios.post(`${API}/upload`, {
@@ -157,11 +281,24 @@ export const codeApi = {
   }
 };
 
+// Last fetched content and hash per path, used for conditional reads
+const fileRevisions = new Map();
+
 // Files API
 export const filesApi = {
   getFile: async (filePath) => {
     try {
-      const response = await axios.get(`${API}/files/${filePath}`);
+      const cached = fileRevisions.get(filePath);
+      const response = await axios.get(`${API}/files/${filePath}`, {
+        headers: cached ? { 'If-None-Match': `"${cached.hash}"` } : {},
+        validateStatus: (status) => status === 200 || status === 304
+      });
+      if (response.status === 304) {
+        return { success: true, content: cached.content, hash: cached.hash };
+      }
+      if (response.data.success) {
+        fileRevisions.set(filePath, { content: response.data.content, hash: response.data.hash });
+      }
       return response.data;
     } catch (error) {
       console.error('Error getting file:', error);
@@ -169,9 +306,44 @@ export const filesApi = {
     }
   },
   
+  // Page through a large text file: lines start..end (end exclusive)
+  getFileLines: async (path, start, end) => {
+    try {
+      const response = await axios.get(`${API}/files/lines`, { params: { path, start, end } });
+      return response.data;
+    } catch (error) {
+      console.error('Error getting file lines:', error);
+      throw error;
+    }
+  },
+  
+  // Streamed download URL; supports HTTP Range requests
+  getRawFileUrl: (path) => `${API}/files/raw?path=${encodeURIComponent(path)}`,
+  
+  // patches: [{ start, end, text }] in string indices, applied in order against baseHash.
+  // A 409 response means the file moved on; re-read it and retry.
+  patchFile: async (path, baseHash, patches) => {
+    try {
+      const response = await axios.post(`${API}/files/patch`, {
+        path,
+        base_hash: baseHash,
+        patches
+      }, {
+        validateStatus: (status) => status === 200 || status === 409
+      });
+      return response.data;
+    } catch (error) {
+      console.error('Error patching file:', error);
+      throw error;
+    }
+  },
+  
   saveFile: async (path, content) => {
     try {
       const response = await axios.post(`${API}/files`, { path, content });
+      if (response.data.success) {
+        fileRevisions.set(path, { content, hash: response.data.hash });
+      }
       return response.data;
     } catch (error) {
       console.error('Error saving file:', error);
@@ -179,6 +351,17 @@ export const filesApi = {
     }
   },
   
+  // files: [{ path, content }]; returns the content hash of every file
+  saveFiles: async (files) => {
+    try {
+      const response = await axios.post(`${API}/files/batch`, { files });
+      return response.data;
+    } catch (error) {
+      console.error('Error saving files:', error);
+      throw error;
+    }
+  },
+  
   getWorkspace: async () => {
     try {
       const response = await axios.get(`${API}/workspace`);
@@ -187,6 +370,11 @@ export const filesApi = {
       console.error('Error loading workspace:', error);
       throw error;
     }
+  },
+  
+  connectWorkspaceWebSocket: () => {
+    const wsUrl = `${BACKEND_URL.replace('http', 'ws')}/api/workspace/ws`;
+    return new WebSocket(wsUrl);
   }
 };
 
@@ -204,6 +392,7 @@ const api = {
   ports: portsApi,
   libraries: librariesApi,
   cores: coresApi,
+  examples: examplesApi,
   code: codeApi,
   files: filesApi,
   serial: serialApi
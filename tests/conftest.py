@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The backend imports its modules as top-level packages (services, api, config)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+# Settings are read at import time: keep everything the tests touch in a scratch
+# directory, in process, and off tmpfs
+os.environ.setdefault('TEMP', tempfile.mkdtemp(prefix='arduino-tests-'))
+os.environ['HUB_SOCKET'] = ''
+os.environ['BUILD_RAM_DIR'] = ''
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from services import batch_installer as installer_module
+from services.batch_installer import InstallError, PackageIndexes
+
+
+def release(name, version, dependencies=()):
+    return {"name": name, "version": version, "url": f"https://example.invalid/{name}-{version}.zip",
+            "archiveFileName": f"{name}-{version}.zip", "checksum": "SHA-256:00", "size": "10",
+            "dependencies": [dict(dependency) for dependency in dependencies]}
+
+
+def tool(name, version, hosts):
+    return {"name": name, "version": version, "systems": [
+        {"host": host, "url": f"https://example.invalid/{name}-{host}.tar.bz2",
+         "archiveFileName": f"{name}-{host}.tar.bz2", "checksum": "SHA-256:00", "size": "5"}
+        for host in hosts
+    ]}
+
+
+@pytest.fixture
+def indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(installer_module, "host_patterns", lambda: [r'^x86_64-.*linux-gnu$', r'^all$'])
+    (tmp_path / "package_index.json").write_text(json.dumps({"packages": [{
+        "name": "arduino",
+        "platforms": [
+            {"architecture": "avr", "version": version, "url": f"https://example.invalid/avr-{version}.tar.bz2",
+             "archiveFileName": f"avr-{version}.tar.bz2", "checksum": "SHA-256:00", "size": "100",
+             "toolsDependencies": [{"packager": "arduino", "name": "avr-gcc", "version": "7.3.0"}],
+             "discoveryDependencies": [{"packager": "arduino", "name": "serial-discovery"}]}
+            for version in ("1.8.5", "1.8.6")
+        ],
+        "tools": [
+            tool("avr-gcc", "7.3.0", ["i686-mingw32", "x86_64-pc-linux-gnu"]),
+            tool("serial-discovery", "1.3.0", ["all"]),
+            tool("serial-discovery", "1.4.1", ["all"]),
+        ]
+    }]}))
+    (tmp_path / "library_index.json").write_text(json.dumps({"libraries": [
+        release("Servo", "1.1.8"),
+        release("Servo", "1.2.1"),
+        release("Sensor", "2.0.0", [{"name": "Bus", "version": "^1.0.0"}, {"name": "Servo", "version": "1.1.8"}]),
+        release("Bus", "1.0.0", [{"name": "Sensor"}]),
+        release("Bus", "1.2.0-beta", [{"name": "Sensor"}]),
+        release("Bus", "1.2.0", [{"name": "Sensor"}]),
+        release("Broken", "1.0.0", [{"name": "Bus", "version": "9.9.9"}]),
+    ]}))
+    return PackageIndexes(data_dir=tmp_path, library_index_path=tmp_path / "library_index.json")
+
+
+def test_a_core_brings_its_tools_built_for_this_host(indexes):
+    items = {item["id"]: item for item in indexes.resolve(["arduino:avr@1.8.5"], [])}
+
+    assert sorted(items) == ["arduino:avr-gcc@7.3.0", "arduino:avr@1.8.5", "arduino:serial-discovery@1.4.1"]
+    assert items["arduino:avr-gcc@7.3.0"]["archive"] == "avr-gcc-x86_64-pc-linux-gnu.tar.bz2"
+    assert items["arduino:serial-discovery@1.4.1"]["archive"] == "serial-discovery-all.tar.bz2"
+
+
+def test_library_dependencies_resolve_once_each_with_constraints_taking_the_latest(indexes):
+    items = indexes.resolve([], ["Sensor"])
+
+    assert sorted(item["id"] for item in items) == ["Bus@1.2.0", "Sensor@2.0.0", "Servo@1.1.8"]
+    assert {item["staging_dir"] for item in items} == {"libraries"}
+
+
+def test_a_requested_version_wins_over_a_dependency_on_another(indexes):
+    items = indexes.resolve([], ["Sensor", "Servo@1.2.1"])
+
+    assert "Servo@1.2.1" in {item["id"] for item in items}
+
+
+def test_an_exact_version_missing_from_the_index_is_an_error(indexes):
+    with pytest.raises(InstallError, match="Library Bus is not in the library index"):
+        indexes.resolve([], ["Broken"])
+    with pytest.raises(InstallError, match="Core arduino:avr@2.0.0 is not in the package index"):
+        indexes.resolve(["arduino:avr@2.0.0"], [])
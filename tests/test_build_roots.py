@@ -0,0 +1,42 @@
+import asyncio
+
+from services import build_roots
+from services.build_roots import BuildRootManager
+
+
+def test_tree_given_up_while_waiting_is_not_left_held(tmp_path):
+    async def scenario():
+        manager = BuildRootManager(None, disk_dir=tmp_path)
+        await manager.acquire("blink", ticket="first")
+        waiter = asyncio.create_task(manager.acquire("blink", ticket="second"))
+        await asyncio.sleep(0)
+        # The caller of the second acquire timed out or was cancelled
+        await manager.release("blink", ticket="second")
+        await manager.release("blink", ticket="first")
+        granted = await waiter
+        return granted, manager.trees["blink"].lock.locked()
+
+    granted, locked = asyncio.run(scenario())
+
+    assert granted is None
+    assert not locked
+
+
+def test_tree_waited_for_by_a_lost_worker_is_not_left_held(tmp_path, monkeypatch):
+    # The lost worker reconnects under the same pid before the tree comes free
+    monkeypatch.setattr(build_roots.hub, "connected", lambda worker: True)
+
+    async def scenario():
+        manager = BuildRootManager(None, disk_dir=tmp_path)
+        await manager.acquire("blink", worker=1, ticket="first")
+        waiter = asyncio.create_task(manager.acquire("blink", worker=2, ticket="second"))
+        await asyncio.sleep(0)
+        await manager.worker_lost(2)
+        await manager.release("blink", worker=1, ticket="first")
+        granted = await waiter
+        return granted, manager.trees["blink"].lock.locked()
+
+    granted, locked = asyncio.run(scenario())
+
+    assert granted is None
+    assert not locked
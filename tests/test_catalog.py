@@ -0,0 +1,55 @@
+import json
+
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from services.catalog import CatalogQuery, catalog_response, parse_fields, project
+
+LIBRARIES = [
+    {"name": f"Lib{i}", "author": "someone", "latest": {"version": f"1.{i}.0", "size": 100 + i},
+     "releases": [{"version": f"1.{i}.0", "url": "u"}, {"version": "0.1.0"}]}
+    for i in range(5)
+]
+
+
+def catalog_client():
+    app = FastAPI()
+
+    @app.get("/libraries")
+    async def libraries(query: CatalogQuery = Depends()):
+        return catalog_response(LIBRARIES, "libraries", query)
+
+    return TestClient(app)
+
+
+def test_projection_keeps_nested_fields_and_list_positions():
+    paths = parse_fields("name, latest.version,releases.url")
+
+    projected = project(LIBRARIES[2], paths)
+
+    assert projected == {"name": "Lib2", "latest": {"version": "1.2.0"}, "releases": [{"url": "u"}, {}]}
+    assert project(LIBRARIES[2], parse_fields("missing")) == {}
+    assert parse_fields(" , ") is None
+
+
+def test_pages_carry_the_total_before_paging():
+    response = catalog_client().get("/libraries", params={"offset": 1, "limit": 2, "fields": "name"})
+
+    assert response.headers["x-total-count"] == "5"
+    assert response.json() == {"success": True, "libraries": [{"name": "Lib1"}, {"name": "Lib2"}],
+                               "total": 5, "offset": 1, "limit": 2}
+
+
+def test_ndjson_streams_one_projected_entry_per_line():
+    client = catalog_client()
+
+    response = client.get("/libraries", params={"offset": 3, "fields": "latest.version"},
+                          headers={"Accept": "application/x-ndjson"})
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        {"latest": {"version": "1.3.0"}}, {"latest": {"version": "1.4.0"}}
+    ]
+    assert client.get("/libraries", params={"format": "json"},
+                      headers={"Accept": "application/x-ndjson"}).json()["total"] == 5
+    assert client.get("/libraries", params={"limit": 0}).status_code == 422
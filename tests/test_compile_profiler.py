@@ -0,0 +1,64 @@
+import pytest
+
+from services.compile_profiler import BuildProfiler, ProfileStats, parse_compile_unit
+
+GPP = '"/opt/avr-gcc/bin/avr-g++" -c -g -Os -w -std=gnu++11 -MMD -mmcu=atmega328p "-I/opt/avr/cores/arduino"'
+
+
+@pytest.mark.parametrize("line, source", [
+    (f'{GPP} "/tmp/build/sketch/Blink.ino.cpp" -o "/tmp/build/sketch/Blink.ino.cpp.o"', "/tmp/build/sketch/Blink.ino.cpp"),
+    ('/opt/avr-gcc/bin/avr-gcc -c -x assembler-with-cpp /opt/avr/cores/arduino/wiring_pulse.S -o /tmp/b/wiring_pulse.S.o',
+     "/opt/avr/cores/arduino/wiring_pulse.S"),
+    # Library detection runs the preprocessor only
+    (f'{GPP} -w -x c++ -E -CC "/tmp/build/sketch/Blink.ino.cpp" -o /dev/null', None),
+    ('"/opt/avr-gcc/bin/avr-gcc-ar" rcs "/tmp/build/core/core.a" "/tmp/build/core/wiring.c.o"', None),
+    ('Using previously compiled file: /tmp/build/core/wiring.c.o', None),
+    (f'{GPP} "/tmp/unterminated.cpp -o x.o', None),
+])
+def test_compiler_invocations_name_their_source(line, source):
+    assert parse_compile_unit(line) == source
+
+
+def test_verbose_output_is_split_into_phases_and_units():
+    profiler = BuildProfiler(started=0.0)
+    for now, line in [
+        (0.5, "Detecting libraries used..."),
+        (1.0, "Generating function prototypes..."),
+        (1.5, "Compiling sketch..."),
+        (1.6, f'{GPP} "/b/sketch/Blink.ino.cpp" -o "/b/sketch/Blink.ino.cpp.o"'),
+        (2.0, "Compiling libraries..."),
+        (2.1, f'{GPP} "/libs/Servo/src/Servo.cpp" -o "/b/libraries/Servo/Servo.cpp.o"'),
+        (2.4, f'{GPP} "/libs/Servo/src/avr/ServoTimers.cpp" -o "/b/libraries/Servo/ServoTimers.cpp.o"'),
+        (2.5, "Compiling core..."),
+        (2.6, "Using previously compiled file: /b/core/wiring.c.o"),
+        (2.7, "Using previously compiled file: /b/core/main.cpp.o"),
+        (3.0, "Linking everything together..."),
+    ]:
+        profiler.feed(now, line)
+    profiler.finish(3.5)
+
+    result = profiler.result()
+
+    assert result["total"] == 3.5
+    assert result["phases"] == pytest.approx({"startup": 0.5, "detect_libraries": 0.5, "prototypes": 0.5,
+                                              "sketch": 0.5, "libraries": 0.5, "core": 0.5, "link": 0.5})
+    assert result["compiled_units"] == 3
+    assert result["cached_units"] == 2
+    assert [(unit["file"], unit["phase"]) for unit in result["units"]] == [
+        ("/b/sketch/Blink.ino.cpp", "sketch"),
+        ("/libs/Servo/src/Servo.cpp", "libraries"),
+        ("/libs/Servo/src/avr/ServoTimers.cpp", "libraries"),
+    ]
+    assert [unit["duration"] for unit in result["units"]] == pytest.approx([0.4, 0.3, 0.1])
+
+
+def test_stats_average_builds_and_forget_the_least_recent_units():
+    stats = ProfileStats(max_units=2)
+    stats.add({"phases": {"link": 1.0}, "units": [{"file": "a.cpp", "duration": 2.0}, {"file": "b.cpp", "duration": 1.0}]})
+    stats.add({"phases": {"link": 3.0}, "units": [{"file": "a.cpp", "duration": 4.0}, {"file": "c.cpp", "duration": 5.0}]})
+
+    summary = stats.summary()
+
+    assert summary["builds"] == 2
+    assert summary["phases"]["link"] == {"mean": 2.0, "max": 3.0, "total": 4.0, "count": 2}
+    assert [(unit["file"], unit["mean"]) for unit in summary["slowest_units"]] == [("c.cpp", 5.0), ("a.cpp", 3.0)]
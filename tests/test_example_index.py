@@ -0,0 +1,37 @@
+import asyncio
+import threading
+
+from services.example_index import ExampleIndex, public
+
+
+def test_an_invalidation_during_a_load_loads_again(tmp_path):
+    async def scenario():
+        index = ExampleIndex(cache_path=tmp_path / "examples.json", sketch_dir=tmp_path / "sketches")
+        started = threading.Event()
+        release = threading.Event()
+        loads = []
+
+        def load():
+            loads.append(index.generation)
+            if len(loads) == 1:
+                started.set()
+                release.wait(5)
+
+        index._load = load
+        loading = asyncio.create_task(index.ensure_loaded())
+        await asyncio.to_thread(started.wait, 5)
+        index.invalidate()
+        release.set()
+        await loading
+
+        assert loads == [0, 1]
+        await index.ensure_loaded()
+        assert len(loads) == 2
+
+    asyncio.run(scenario())
+
+
+def test_examples_are_listed_without_their_server_path():
+    example = {"id": "abc", "name": "Blink", "path": "/opt/arduino/libraries/Basics/examples/Blink", "main": "Blink.ino"}
+
+    assert public(example) == {"id": "abc", "name": "Blink", "main": "Blink.ino"}
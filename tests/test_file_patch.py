@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from api.files import FileBatch, FileContent, FilePatch, TextPatch, patch_file, save_files, router as files_router
+from services.file_store import apply_patches, content_hash, file_store
+
+
+def test_concurrent_patches_on_one_base_conflict(tmp_path, monkeypatch):
+    path = tmp_path / "sketch.ino"
+    path.write_text("void setup() {}\n")
+    base = content_hash(path.read_bytes())
+
+    # Widen the window between reading the base and writing the result
+    read_text = file_store.read_text
+
+    def slow_read_text(*args):
+        result = read_text(*args)
+        time.sleep(0.1)
+        return result
+
+    monkeypatch.setattr(file_store, "read_text", slow_read_text)
+
+    def edit(text):
+        return FilePatch(path=str(path), base_hash=base, patches=[TextPatch(start=0, end=0, text=text)])
+
+    async def both():
+        return await asyncio.gather(patch_file(edit("// a\n")), patch_file(edit("// b\n")))
+
+    results = asyncio.run(both())
+    conflicts = [result for result in results if isinstance(result, JSONResponse)]
+    applied = [result for result in results if not isinstance(result, JSONResponse)]
+    assert len(conflicts) == 1 and conflicts[0].status_code == 409
+    assert len(applied) == 1 and applied[0]["success"]
+    assert path.read_text().count("//") == 1
+
+
+def test_batch_save_waits_for_a_patch_in_progress(tmp_path, monkeypatch):
+    path = tmp_path / "sketch.ino"
+    path.write_text("void setup() {}\n")
+    other = tmp_path / "helpers.h"
+    base = content_hash(path.read_bytes())
+    read_text = file_store.read_text
+
+    def slow_read_text(*args):
+        result = read_text(*args)
+        time.sleep(0.1)
+        return result
+
+    monkeypatch.setattr(file_store, "read_text", slow_read_text)
+    patch = FilePatch(path=str(path), base_hash=base, patches=[TextPatch(start=0, end=0, text="// a\n")])
+    batch = FileBatch(files=[
+        FileContent(path=str(path), content="void loop() {}\n"),
+        FileContent(path=str(other), content="#pragma once\n")
+    ])
+
+    async def both():
+        patched = asyncio.ensure_future(patch_file(patch))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(patched, save_files(batch))
+
+    patched, saved = asyncio.run(both())
+    assert patched["success"] and saved["success"]
+    # The save came second: its content is the file's, not the patch's result
+    assert path.read_text() == "void loop() {}\n"
+
+
+def test_patch_offsets_count_utf16_code_units():
+    # The emoji is one code point but two UTF-16 units, as JavaScript indexes it
+    text = "// 🎉 party\nint x;\n"
+
+    patched = apply_patches(text, [
+        {"start": 6, "end": 11, "text": "fiesta"},
+        {"start": 13, "end": 16, "text": "long"},
+    ])
+
+    assert patched == "// 🎉 fiesta\nlong x;\n"
+    with pytest.raises(ValueError):
+        apply_patches(text, [{"start": 4, "end": 100, "text": ""}])
+
+
+def test_file_reads_answer_304_for_a_matching_etag(tmp_path):
+    path = tmp_path / "sketch.ino"
+    path.write_text("void loop() {}\n")
+    app = FastAPI()
+    app.include_router(files_router, prefix="/api")
+    client = TestClient(app)
+
+    first = client.get("/api/files/get", params={"path": str(path)})
+    etag = first.headers["etag"]
+    assert first.json()["content"] == "void loop() {}\n"
+
+    assert client.get("/api/files/get", params={"path": str(path)}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/files/get", params={"path": str(path)},
+                      headers={"If-None-Match": f'"other", W/{etag}'}).status_code == 304
+    path.write_text("void loop() { tick(); }\n")
+    changed = client.get("/api/files/get", params={"path": str(path)}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
@@ -0,0 +1,118 @@
+import asyncio
+
+from services.hub import QUEUE_SIZE, Hub, NamedLocks, Peer
+
+
+class StalledWriter:
+    """Takes writes but does not drain until released, like a worker that fell behind"""
+
+    def __init__(self):
+        self.written = []
+        self.released = asyncio.Event()
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        await self.released.wait()
+
+    def close(self):
+        pass
+
+
+def test_replies_survive_a_full_channel_queue_and_go_first():
+    async def scenario():
+        writer = StalledWriter()
+        peer = Peer(writer)
+        peer.send(b"first\n", "serial")
+        await asyncio.sleep(0)
+        for i in range(QUEUE_SIZE + 10):
+            peer.send(f"line {i}\n".encode(), "serial")
+        peer.reply(b"grant\n")
+        writer.released.set()
+        for _ in range(QUEUE_SIZE + 20):
+            await asyncio.sleep(0)
+        peer.close()
+        return writer.written
+
+    written = asyncio.run(scenario())
+
+    assert written[:2] == [b"first\n", b"grant\n"]
+    assert written[-1] == f"line {QUEUE_SIZE + 9}\n".encode()
+    assert len(written) == 2 + QUEUE_SIZE
+
+
+def test_lock_waited_for_by_a_lost_worker_is_released_once_granted():
+    async def scenario():
+        # The lost worker reconnects under the same pid before the lock comes free
+        locks = NamedLocks(connected=lambda worker: True)
+        await locks.acquire("file:/sketch.ino", "held", worker=1)
+        waiter = asyncio.create_task(locks.acquire("file:/sketch.ino", "lost", worker=2))
+        await asyncio.sleep(0)
+        await locks.worker_lost(2)
+        await locks.release("file:/sketch.ino", "held")
+        await waiter
+        return locks.holders, locks.locks
+
+    holders, held = asyncio.run(scenario())
+
+    assert holders == {}
+    assert held == {}
+
+
+def test_calls_and_locks_from_a_connected_worker(tmp_path):
+    async def scenario():
+        owner = Hub(str(tmp_path / "hub.sock"))
+        client = Hub(owner.path)
+        client.worker = owner.worker + 1
+
+        async def echo(text):
+            return text
+
+        owner.register("test.echo", echo)
+        await owner.start()
+        await client.start()
+        try:
+            reply = await client.call("test.echo", text="x" * 100_000)
+            order = []
+
+            async def hold(hub, name):
+                async with hub.lock("file:/sketch.ino"):
+                    order.append(f"{name} in")
+                    await asyncio.sleep(0.05)
+                    order.append(f"{name} out")
+
+            await asyncio.gather(hold(client, "client"), hold(owner, "owner"))
+            # Unlocking does not wait for the owner
+            await asyncio.sleep(0.05)
+            return len(reply), order, owner.locks.locks
+        finally:
+            await client.stop()
+            await owner.stop()
+
+    size, order, held = asyncio.run(scenario())
+
+    assert size == 100_000
+    assert order in (
+        ["client in", "client out", "owner in", "owner out"],
+        ["owner in", "owner out", "client in", "client out"]
+    )
+    assert held == {}
+
+
+# Hub the provider module below registers with
+provided = Hub(None)
+
+
+def test_a_provided_module_is_imported_by_the_first_call(tmp_path, monkeypatch):
+    (tmp_path / "lazy_provider.py").write_text(
+        "from tests.test_hub import provided\n"
+        "async def ping(value):\n"
+        "    return value + 1\n"
+        "provided.register('lazy.ping', ping)\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    provided.provide("lazy", "lazy_provider")
+
+    assert asyncio.run(provided.call("lazy.ping", value=1)) == 2
+
@@ -0,0 +1,58 @@
+import os
+import urllib.error
+
+import pytest
+
+from services.index_manager import IndexManager
+
+
+def manager(tmp_path, **options):
+    data_dir = tmp_path / "data"
+    mirror_dir = tmp_path / "mirror"
+    data_dir.mkdir()
+    mirror_dir.mkdir()
+    (data_dir / "package_index.json").write_text('{"old": true}')
+    (mirror_dir / "package_index.json").write_text('{"new": true}')
+    return IndexManager(
+        data_dir=data_dir, sources=[{"name": "package_index.json", "url": "unused"}],
+        mirror_dir=str(mirror_dir), interval=0, keyring=None, state_path=tmp_path / "state.json", **options
+    )
+
+
+@pytest.mark.parametrize("signed", [False, True])
+def test_an_index_that_is_not_verified_keeps_the_current_one(tmp_path, signed):
+    indexes = manager(tmp_path)
+    if signed:
+        (tmp_path / "mirror" / "package_index.json.sig").write_bytes(b"signature")
+
+    result = indexes._refresh_source(indexes.sources[0], force=True)
+
+    assert result == {"name": "package_index.json", "status": "rejected",
+                      "signature": "unverified" if signed else "unsigned"}
+    assert (tmp_path / "data" / "package_index.json").read_text() == '{"old": true}'
+    assert sorted(os.listdir(tmp_path / "data")) == ["package_index.json"]
+
+
+def test_unverified_indexes_are_swapped_in_when_allowed(tmp_path):
+    indexes = manager(tmp_path, accept_unverified=True)
+
+    result = indexes._refresh_source(indexes.sources[0], force=True)
+
+    assert result["status"] == "updated"
+    assert (tmp_path / "data" / "package_index.json").read_text() == '{"new": true}'
+
+
+def test_a_failed_signature_fetch_leaves_no_temp_files(tmp_path, monkeypatch):
+    indexes = manager(tmp_path)
+    indexes.mirror_dir = None
+
+    def download(url, path, headers=None):
+        if url.endswith('.sig'):
+            raise urllib.error.URLError("unreachable")
+        return {}
+
+    monkeypatch.setattr(indexes, "_download", download)
+
+    with pytest.raises(urllib.error.URLError):
+        indexes._fetch_url("https://example.invalid/package_index.json", force=True)
+    assert sorted(os.listdir(tmp_path / "data")) == ["package_index.json"]
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from api import compile as compile_api
+from api.compile import CompileRequest, compile_sketch
+from services.library_resolver import LibraryHeaderIndex, failed_includes, rank_candidates, scan_includes
+
+
+def test_includes_are_scanned_outside_comments_in_order():
+    code = '#include <Servo.h>\n// #include <Old.h>\n/* #include "Gone.h" */\n  #  include "util/pins.h"\n#include <Servo.h>\n'
+
+    assert scan_includes(code) == ["Servo.h", "util/pins.h"]
+
+
+def test_libraries_named_after_a_header_rank_first():
+    assert rank_candidates("Servo.h", ["ServoEasing", "Adafruit PWM Servo", "Servo"]) == [
+        "Servo", "ServoEasing", "Adafruit PWM Servo"
+    ]
+
+
+def test_includes_resolve_to_installed_installable_local_or_unknown():
+    index = LibraryHeaderIndex()
+    index.installed = {"Wire.h": ["Wire"]}
+    index.available = {"Servo.h": ["Servo", "ServoEasing"], "config.h": ["Config"]}
+
+    report = index.resolve(["Wire.h", "Servo.h", "config.h", "avr/io.h"], local_headers={"config.h"})
+
+    assert report["resolved"] == {"Wire.h": "Wire"}
+    assert report["missing"] == {"Servo.h": ["Servo", "ServoEasing"]}
+    assert report["unknown"] == ["avr/io.h"]
+
+
+def test_headers_the_compiler_could_not_find():
+    stderr = (
+        "/sketch/sketch.ino:1:10: fatal error: Servo.h: No such file or directory\n"
+        " #include <Servo.h>\n"
+        "src/imu.cpp:2:10: fatal error: sensors/imu.h: No such file or directory\n"
+    )
+
+    assert failed_includes(stderr) == ["Servo.h", "sensors/imu.h"]
+
+
+@pytest.fixture
+def flagged_servo(monkeypatch):
+    async def preflight(*args):
+        # The index thinks Servo.h is missing, as it does for platform-bundled libraries
+        return {"includes": ["Servo.h"], "resolved": {}, "missing": {"Servo.h": ["Servo"]}, "unknown": []}
+
+    monkeypatch.setattr(compile_api, "compile_preflight", preflight)
+
+
+def compile_with(monkeypatch, tmp_path, result):
+    commands = []
+
+    def run_arduino_cli(command):
+        commands.append(command)
+        return {"success": result["returncode"] == 0, "stdout": "", "stderr": "", **result}
+
+    monkeypatch.setattr(compile_api, "run_arduino_cli", run_arduino_cli)
+    sketch_path = str(tmp_path / "sketch" / "sketch.ino")
+    request = CompileRequest(code="#include <Servo.h>\nvoid setup() {}\nvoid loop() {}\n",
+                             board="arduino:avr:uno", sketch_path=sketch_path)
+    return asyncio.run(compile_sketch(request, sketch_path, "ip:1")), commands
+
+
+def test_a_flagged_include_does_not_stop_the_build(flagged_servo, monkeypatch, tmp_path):
+    response, commands = compile_with(monkeypatch, tmp_path, {"returncode": 0, "stdout": "Sketch uses 924 bytes"})
+
+    assert len(commands) == 1
+    assert response["success"]
+    assert "missing_libraries" not in response
+
+
+def test_missing_libraries_are_reported_when_the_compiler_fails_on_them(flagged_servo, monkeypatch, tmp_path):
+    stderr = "sketch.ino:1:10: fatal error: Servo.h: No such file or directory\n"
+    response, _ = compile_with(monkeypatch, tmp_path, {"returncode": 1, "stderr": stderr})
+
+    assert not response["success"]
+    assert response["missing_libraries"] == {"Servo.h": ["Servo"]}
+    assert response["output"].startswith("Missing libraries:\n  Servo.h: install Servo")
@@ -0,0 +1,20 @@
+import asyncio
+
+from services.hub import hub
+from services.metrics import registry
+from services.serial_session import SERIAL_CHANNEL
+
+
+def test_serial_relay_backlog_is_reported_as_lag():
+    async def scrape_with_backlog():
+        queue = hub.subscribe(SERIAL_CHANNEL)
+        try:
+            for n in range(3):
+                hub.publish(SERIAL_CHANNEL, {"type": "data", "data": str(n)})
+            return registry.render()
+        finally:
+            hub.unsubscribe(SERIAL_CHANNEL, queue)
+
+    text = asyncio.run(scrape_with_backlog())
+    assert 'websocket_subscriber_lag_events{channel="serial"} 3' in text
+    assert 'websocket_subscriber_lag_events{channel="serial"} 0' in registry.render()
@@ -0,0 +1,57 @@
+import asyncio
+import sys
+
+import pytest
+
+from services import prewarm
+from services.build_roots import build_key
+from services.prewarm import Prewarmer, Warmup, WarmupCancelled, run_until_stopped
+from services.telemetry import PhaseTimer
+
+
+def test_compile_stops_only_warmups_of_other_sketches_and_boards():
+    async def scenario():
+        prewarmer = Prewarmer()
+        same = Warmup("/sketches/Blink/Blink.ino", "arduino:avr:uno", PhaseTimer("prewarm"))
+        other_board = Warmup("/sketches/Blink/Blink.ino", "arduino:avr:mega", PhaseTimer("prewarm"))
+        other_sketch = Warmup("/sketches/Fade/Fade.ino", "arduino:avr:uno", PhaseTimer("prewarm"))
+        prewarmer.warmups = {"ip:1": same, "ip:2": other_board, "ip:3": other_sketch}
+
+        prewarmer.yield_cpu(build_key("/sketches/Blink/Blink.ino", "arduino:avr:uno"))
+        return [(warmup.stop.is_set(), warmup.boost.is_set()) for warmup in (same, other_board, other_sketch)]
+
+    assert asyncio.run(scenario()) == [(False, True), (True, False), (True, False)]
+
+
+@pytest.fixture
+def short_build(monkeypatch):
+    monkeypatch.setattr(prewarm, "resolve_cli_command", lambda command: [
+        sys.executable, "-c", "import time; time.sleep(0.5)"
+    ])
+    monkeypatch.setattr(prewarm, "record_cli_run", lambda *args: None)
+
+
+@pytest.mark.parametrize("permitted", [True, False])
+def test_adopted_warmup_is_raised_to_normal_priority_or_stopped(short_build, monkeypatch, permitted):
+    raised = []
+
+    async def raise_priority(pid):
+        raised.append(pid)
+        return permitted
+
+    monkeypatch.setattr(prewarm, "raise_priority", raise_priority)
+
+    async def scenario():
+        stop, boost = asyncio.Event(), asyncio.Event()
+        build = asyncio.ensure_future(run_until_stopped(["arduino-cli", "compile"], stop, boost))
+        await asyncio.sleep(0.1)
+        boost.set()
+        try:
+            return (await build)["success"]
+        except WarmupCancelled:
+            return None
+
+    outcome = asyncio.run(scenario())
+
+    assert len(raised) == 1
+    assert outcome is (True if permitted else None)
@@ -0,0 +1,89 @@
+import asyncio
+import ipaddress
+
+import pytest
+from starlette.requests import Request
+
+from services import scheduler
+from services.scheduler import Pool, TokenBucket, client_identity
+
+
+def request_from(address, headers=()):
+    return Request({
+        "type": "http",
+        "client": (address, 50000),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers]
+    })
+
+
+@pytest.fixture
+def proxy(monkeypatch):
+    monkeypatch.setattr(scheduler, "trusted_proxies", [ipaddress.ip_network("10.0.0.0/8")])
+
+
+def test_forwarded_for_is_ignored_from_untrusted_peers(proxy):
+    request = request_from("203.0.113.7", [("X-Forwarded-For", "198.51.100.1")])
+
+    assert client_identity(request) == "ip:203.0.113.7"
+
+
+def test_client_behind_trusted_proxies_is_the_last_untrusted_hop(proxy):
+    request = request_from("10.0.0.2", [("X-Forwarded-For", "1.2.3.4, 198.51.100.1, 10.0.0.5")])
+
+    assert client_identity(request) == "ip:198.51.100.1"
+
+
+def test_session_cookie_identifies_users_only_when_enabled(monkeypatch):
+    request = request_from("203.0.113.7", [("Cookie", "classroom=seat-12")])
+    assert client_identity(request) == "ip:203.0.113.7"
+
+    monkeypatch.setattr(scheduler, "SESSION_COOKIE", "classroom")
+    assert client_identity(request) == "session:seat-12"
+
+
+def test_token_bucket_allows_a_burst_then_its_rate():
+    bucket = TokenBucket(rate=1, burst=2)
+
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert 0.9 < bucket.take() <= 1
+
+
+def test_users_take_turns_at_the_pool():
+    async def scenario():
+        pool = Pool("compile", concurrency=1, per_user=1, rate=0, burst=1, queue=10)
+        order = []
+
+        async def run(user, ticket):
+            grant = await pool.acquire(user, ticket)
+            order.append(ticket)
+            await asyncio.sleep(0.01)
+            pool.release(ticket)
+            return grant
+
+        tasks = [asyncio.create_task(run("ip:a", f"a{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(run("ip:b", "b0")))
+        await asyncio.gather(*tasks)
+        return order
+
+    # b's one compile waits for a's next turn, not for all of a's queue
+    assert asyncio.run(scenario()) == ["a0", "a1", "b0", "a2"]
+
+
+def test_a_full_queue_is_refused_with_a_retry_time():
+    async def scenario():
+        pool = Pool("compile", concurrency=1, per_user=1, rate=0, burst=1, queue=1)
+        first = asyncio.create_task(pool.acquire("ip:a", "a0"))
+        second = asyncio.create_task(pool.acquire("ip:a", "a1"))
+        await asyncio.sleep(0)
+        refused = await pool.acquire("ip:a", "a2")
+        pool.release("a0")
+        pool.release("a1")
+        await asyncio.gather(first, second)
+        return refused
+
+    refused = asyncio.run(scenario())
+
+    assert refused["granted"] is False and refused["reason"] == "queue"
+    assert refused["retry_after"] > 0
@@ -0,0 +1,37 @@
+import pytest
+
+from services import serial_recorder
+from services.serial_recorder import SerialRecorder
+
+
+@pytest.fixture
+def recordings_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "serial_recordings"
+    monkeypatch.setattr(serial_recorder, "RECORDINGS_DIR", directory)
+    return directory
+
+
+def test_delete_removes_a_recording(recordings_dir):
+    recorder = SerialRecorder()
+    recording = recorder.start("/dev/ttyUSB0")
+    recording.append(b"hello")
+    assert recorder.get(recording.id) is recording
+
+    assert recorder.delete(recording.id)
+    assert not (recordings_dir / recording.id).exists()
+    assert recorder.get(recording.id) is None
+
+
+@pytest.mark.parametrize("recording_id", ["..", ".", "../workspace", "{workspace}", "0123456789ab\n", ""])
+def test_ids_outside_the_recordings_directory_are_refused(recordings_dir, recording_id):
+    recordings_dir.mkdir()
+    sibling = recordings_dir.parent / "workspace"
+    sibling.mkdir()
+    (sibling / "sketch.ino").write_text("void setup() {}")
+    recording_id = recording_id.format(workspace=sibling)
+
+    recorder = SerialRecorder()
+    assert recorder.get(recording_id) is None
+    assert not recorder.delete(recording_id)
+    assert (sibling / "sketch.ino").exists()
+    assert recordings_dir.is_dir()
@@ -0,0 +1,50 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from services import sketch_store
+from services.hub import Hub
+from services.sketch_store import SketchRepository, SketchRevisions
+
+
+def test_workers_saving_one_sketch_keep_every_revision(tmp_path, monkeypatch):
+    async def scenario():
+        db = AsyncMongoMockClient()["arduino"]
+        repository = SketchRepository(db)
+        await repository._create_indexes()
+        owner = Hub(str(tmp_path / "hub.sock"))
+        for method, handler in (("save", repository.save), ("load", repository.load),
+                                ("history", repository.history)):
+            owner.register(f"sketches.{method}", handler)
+        client = Hub(owner.path)
+        client.worker = owner.worker + 1
+        await owner.start()
+        await client.start()
+        revisions = SketchRevisions()
+        try:
+            saved = []
+            for hub, content in ((owner, "void setup() {}\n"),
+                                 (client, "void setup() {}\nvoid loop() {}\n"),
+                                 (owner, "void setup() { begin(); }\nvoid loop() {}\n")):
+                monkeypatch.setattr(sketch_store, "hub", hub)
+                saved.append((await revisions.save("ip:1", "blink", content))["rev"])
+            # Numbered without writing to MongoDB: revisions go in one batch
+            unflushed = await db.sketch_revisions.count_documents({})
+            await repository.flush()
+            history = await revisions.history("ip:1", "blink")
+            texts = [(await revisions.load("ip:1", "blink", rev))["content"] for rev in (1, 2, 3)]
+            return saved, unflushed, history, texts
+        finally:
+            await client.stop()
+            await owner.stop()
+
+    saved, unflushed, history, texts = asyncio.run(scenario())
+
+    assert saved == [1, 2, 3]
+    assert unflushed == 0
+    assert [revision["rev"] for revision in history] == [3, 2, 1]
+    assert texts == [
+        "void setup() {}\n",
+        "void setup() {}\nvoid loop() {}\n",
+        "void setup() { begin(); }\nvoid loop() {}\n"
+    ]
@@ -0,0 +1,35 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import sketches
+
+
+class RecordingRepository:
+    def __init__(self):
+        self.users = []
+
+    async def list_sketches(self, user_id):
+        self.users.append(user_id)
+        return []
+
+    async def save(self, user_id, sketch_id, content):
+        self.users.append(user_id)
+        return {"rev": 1, "changed": True}
+
+    async def history(self, user_id, sketch_id, limit):
+        self.users.append(user_id)
+        return []
+
+
+def test_history_belongs_to_the_requester_not_a_query_parameter(monkeypatch):
+    repository = RecordingRepository()
+    monkeypatch.setattr(sketches, "sketch_repository", repository)
+    app = FastAPI()
+    app.include_router(sketches.router)
+    client = TestClient(app)
+
+    client.get("/sketches/", params={"user_id": "victim"})
+    client.get("/sketches/blink/revisions", params={"user_id": "victim"})
+    client.post("/sketches/blink/revisions", json={"user_id": "victim", "content": "void loop() {}"})
+
+    assert repository.users == ["ip:testclient"] * 3
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+import pytest
+
+from api import compile as compile_api
+from api.compile import CompileRequest, SketchFile, prepare_sketch, write_sketch
+from api.files import FilePatch, TextPatch, patch_file
+from services.file_store import content_hash, file_store
+from services.telemetry import PhaseTimer
+
+
+@pytest.fixture(autouse=True)
+def sketch_roots(tmp_path, monkeypatch):
+    monkeypatch.setattr(compile_api, "EXAMPLES_SKETCH_DIR", tmp_path / "examples")
+    monkeypatch.setattr(compile_api, "SKETCH_MANIFEST_DIR", tmp_path / "manifests")
+
+
+def test_files_in_a_client_named_directory_are_never_removed(tmp_path):
+    project = tmp_path / "project"
+    (project / "src").mkdir(parents=True)
+    (project / "src" / "driver.cpp").write_text("int driver;\n")
+    (project / "helpers.h").write_text("#pragma once\n")
+
+    write_sketch(str(project / "project.ino"), "", [SketchFile(name="project.ino", content="void loop() {}\n")])
+
+    assert (project / "src" / "driver.cpp").read_text() == "int driver;\n"
+    assert (project / "helpers.h").exists()
+
+
+def test_only_files_sent_earlier_are_removed_when_left_out(tmp_path):
+    sketch = tmp_path / "examples" / "Blink"
+    sketch.mkdir(parents=True)
+    (sketch / "notes.h").write_text("// written by hand\n")
+    main = SketchFile(name="Blink.ino", content="void loop() {}\n")
+
+    write_sketch(str(sketch / "Blink.ino"), "", [main, SketchFile(name="src/led.cpp", content="int led;\n")])
+    written = write_sketch(str(sketch / "Blink.ino"), "", [main])
+
+    assert not (sketch / "src" / "led.cpp").exists()
+    assert (sketch / "notes.h").exists()
+    assert [file["name"] for file in written if file["hash"] is None] == ["src/led.cpp"]
+
+
+def test_sketch_write_waits_for_a_patch_in_progress(tmp_path, monkeypatch):
+    sketch = tmp_path / "examples" / "Blink"
+    sketch.mkdir(parents=True)
+    path = sketch / "Blink.ino"
+    path.write_text("void setup() {}\n")
+    base = content_hash(path.read_bytes())
+    read_text = file_store.read_text
+
+    def slow_read_text(*args):
+        result = read_text(*args)
+        time.sleep(0.1)
+        return result
+
+    monkeypatch.setattr(file_store, "read_text", slow_read_text)
+    patch = FilePatch(path=str(path), base_hash=base, patches=[TextPatch(start=0, end=0, text="// a\n")])
+    request = CompileRequest(board="arduino:avr:uno", sketch_path=str(path),
+                             files=[SketchFile(name="Blink.ino", content="void loop() {}\n")])
+
+    async def both():
+        patched = asyncio.ensure_future(patch_file(patch))
+        await asyncio.sleep(0.02)
+        return await asyncio.gather(patched, prepare_sketch(request, str(path), PhaseTimer("compile")))
+
+    patched, (refused, _) = asyncio.run(both())
+    assert patched["success"] and refused is None
+    assert path.read_text() == "void loop() {}\n"